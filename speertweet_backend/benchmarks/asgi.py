@@ -0,0 +1,243 @@
+"""
+Throughput and memory of the WSGI and ASGI deployments as connections grow.
+
+Seeds a scratch database, then starts each deployment in turn, one worker
+process each: gunicorn with --threads threads (wsgi), uvicorn serving the
+REST framework views (asgi-sync, ASYNC_VIEWS=0) and uvicorn serving the async
+read views (asgi). For every --connections count that many keep-alive
+connections each GET the read endpoints (recent, user tweets, tweet detail,
+user details) for --seconds, waiting --think seconds between requests, as
+slow or mostly idle clients do. Reports requests per second, latency, failed
+requests and the peak resident memory of the server processes.
+
+Needs the servers: pip install gunicorn uvicorn
+
+    cd speertweet_backend
+    python -m benchmarks.asgi --connections 10 100 500 --seconds 10 --think 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.utils import setup
+
+
+DEPLOYMENTS = ("wsgi", "asgi-sync", "asgi")
+
+
+def server_command(deployment, port, threads):
+    if deployment == "wsgi":
+        return [sys.executable, "-m", "gunicorn", "speertweet_backend.wsgi:application",
+                "--bind", f"127.0.0.1:{port}", "--workers", "1", "--worker-class", "gthread",
+                "--threads", str(threads), "--keep-alive", "60", "--backlog", "4096",
+                "--log-level", "warning"]
+    return [sys.executable, "-m", "uvicorn", "speertweet_backend.asgi:application",
+            "--port", str(port), "--backlog", "4096", "--timeout-keep-alive", "60",
+            "--no-access-log", "--log-level", "warning"]
+
+
+def server_env(deployment):
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": "benchmarks.settings",
+           "DATABASE_PROFILE": "production"}
+    env["ASYNC_VIEWS"] = "1" if deployment == "asgi" else "0"
+    return env
+
+
+def prepare(users, tweets):
+    """
+    Seed the scratch database and return the paths to request.
+    """
+    setup(fresh=True)
+
+    from django.core.management import call_command
+    from django.db import connections
+
+    from tweets.models import Tweet
+    from users.models import User
+
+    call_command("seed", users=users, tweets=tweets, follows=10, days=3,
+                 timeline_hours=1, stdout=open(os.devnull, "w"))
+    tweet_ids = list(Tweet.objects.order_by("-id").values_list("uuid", flat=True)[:200])
+    authors = list(User.objects.values_list("uuid", "username")[:200])
+    connections.close_all()
+
+    paths = ["/tweets/recent/"]
+    paths += [f"/tweets/{uuid}/" for uuid in tweet_ids]
+    paths += [f"/tweets/user/{uuid}/" for uuid, _ in authors]
+    paths += [f"/accounts/{username}/" for _, username in authors]
+    return paths
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def tree_rss(pid):
+    """
+    Resident memory in bytes of a process and all its descendants.
+    """
+    total, pending = 0, [pid]
+    while pending:
+        pid = pending.pop()
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            for task in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+
+class MemorySampler(threading.Thread):
+
+    def __init__(self, pid, interval=0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, tree_rss(self.pid))
+
+
+async def read_response(reader):
+    """
+    Read one HTTP/1.1 response and return (status, keep_alive).
+    """
+    status_line = await reader.readuntil(b"\r\n")
+    status = int(status_line.split()[1])
+    length, keep_alive = None, True
+    while True:
+        line = await reader.readuntil(b"\r\n")
+        if line == b"\r\n":
+            break
+        name, _, value = line.decode("latin1").partition(":")
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "connection" and value == "close":
+            keep_alive = False
+    if length is None:
+        await reader.read()
+        keep_alive = False
+    elif length:
+        await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def client(port, paths, deadline, think, latencies, failures, rng):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            start = time.perf_counter()
+            writer.write(f"GET {rng.choice(paths)} HTTP/1.1\r\nHost: localhost\r\n"
+                         f"Accept: application/json\r\n\r\n".encode())
+            status, keep_alive = await read_response(reader)
+            elapsed = time.perf_counter() - start
+            if status >= 500:
+                failures.append(status)
+            else:
+                latencies.append(elapsed)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            failures.append(0)
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.1)
+        if think:
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, paths, connections, seconds, think):
+    latencies, failures = [], []
+    deadline = time.monotonic() + seconds
+    await asyncio.gather(*(
+        client(port, paths, deadline, think, latencies, failures, random.Random(n))
+        for n in range(connections)
+    ))
+    return latencies, failures
+
+
+def run(deployment, paths, args):
+    process = subprocess.Popen(server_command(deployment, args.port, args.threads),
+                               env=server_env(deployment))
+    try:
+        wait_for_port(args.port, process)
+        # warm up the caches and the connection to the database
+        asyncio.run(load(args.port, paths, 4, 1, 0))
+        idle = tree_rss(process.pid)
+        for connections in args.connections:
+            sampler = MemorySampler(process.pid)
+            sampler.start()
+            latencies, failures = asyncio.run(
+                load(args.port, paths, connections, args.seconds, args.think))
+            sampler.stopped.set()
+            sampler.join()
+            report(deployment, connections, latencies, failures, args.seconds,
+                   idle, sampler.peak)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(deployment, connections, latencies, failures, seconds, idle, peak):
+    name = f"{deployment:<10} {connections:>5} conns"
+    memory = f"rss {idle / 2**20:>6.1f} -> {peak / 2**20:>6.1f} MiB"
+    if len(latencies) < 2:
+        print(f"{name} {len(latencies):>8} ok {len(failures):>6} failed  {memory}")
+        return
+    q = statistics.quantiles(latencies, n=100)
+    print(f"{name} {len(latencies) / seconds:>8.1f} req/s  p50 {q[49] * 1000:>8.2f} ms  "
+          f"p99 {q[98] * 1000:>8.2f} ms  {len(failures):>6} failed  {memory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--connections", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--think", type=float, default=0.05,
+                        help="mean seconds a client waits between requests")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads")
+    parser.add_argument("--deployments", nargs="+", default=DEPLOYMENTS, choices=DEPLOYMENTS)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--tweets", type=int, default=50000)
+    args = parser.parse_args()
+
+    paths = prepare(args.users, args.tweets)
+    for deployment in args.deployments:
+        run(deployment, paths, args)
+
+
+if __name__ == "__main__":
+    main()
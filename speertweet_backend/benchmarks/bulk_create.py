@@ -0,0 +1,60 @@
+"""
+Tweet creation throughput of single POSTs against batched POSTs.
+
+Creates the same number of tweets through POST /tweets/, one request per
+tweet, and through POST /tweets/bulk/ in batches, each request authenticated
+with a JWT like a partner integration would be.
+
+    cd speertweet_backend
+    python -m benchmarks.bulk_create --tweets 5000 --batch-size 100
+"""
+
+import argparse
+
+from benchmarks.utils import report, setup, timed
+
+
+def post_single(client, auth, count):
+    for i in range(count):
+        res = client.post("/tweets/", {"text": f"single {i}"},
+                          content_type="application/json", **auth)
+        assert res.status_code == 201, res.status_code
+
+
+def post_bulk(client, auth, count, batch_size):
+    for start in range(0, count, batch_size):
+        batch = [{"text": f"bulk {i}"}
+                 for i in range(start, min(start + batch_size, count))]
+        res = client.post("/tweets/bulk/", batch,
+                          content_type="application/json", **auth)
+        assert res.status_code == 201, res.status_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tweets", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    setup()
+
+    from django.test import Client
+
+    from users.models import User
+
+    User.objects.create_user(username="partner", password="password")
+    client = Client()
+    res = client.post("/accounts/login/",
+                      {"username": "partner", "password": "password"})
+    auth = {"HTTP_AUTHORIZATION": f"Bearer {res.json()['access']}"}
+
+    _, seconds = timed(post_single, client, auth, args.tweets)
+    report("POST /tweets/", args.tweets, seconds, "tweets")
+
+    for batch_size in sorted({10, args.batch_size}):
+        _, seconds = timed(post_bulk, client, auth, args.tweets, batch_size)
+        report(f"POST /tweets/bulk/ x{batch_size}", args.tweets, seconds, "tweets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Cost of syncing a user's tweets from the changes feed against downloading
+them all again.
+
+Inserts --tweets tweets for one author, takes the current changes token,
+then edits, likes and deletes --changes of them through the API. Times a
+full download of the author's tweets, every page of /tweets/user/<uuid>/,
+against syncing with every page of /tweets/changes/?since=<token>&author=,
+and reports the requests and bytes each took.
+
+    cd speertweet_backend
+    python -m benchmarks.changes --tweets 10000 --changes 10 100 1000
+"""
+
+import argparse
+import random
+
+from benchmarks.utils import insert_tweets, setup, timed
+
+
+def walk(client, url):
+    """
+    GET url and every following page, return (requests, bytes).
+    """
+    requests = sent = 0
+    while url:
+        res = client.get(url)
+        assert res.status_code == 200, res.status_code
+        requests += 1
+        sent += len(res.content)
+        url = res.json()["next"]
+    return requests, sent
+
+
+def walk_changes(client, author, since):
+    requests = sent = 0
+    while True:
+        res = client.get("/tweets/changes/", {"since": since, "author": author,
+                                               "page_size": 1000})
+        assert res.status_code == 200, res.status_code
+        requests += 1
+        sent += len(res.content)
+        data = res.json()
+        since = data["next"]
+        if not data["has_more"]:
+            return requests, sent
+
+
+def make_changes(client, uuids, count, rng):
+    for uuid in rng.sample(uuids, count):
+        action = rng.randrange(3)
+        if action == 0:
+            client.patch(f"/tweets/{uuid}/", {"text": "edited"}, format="json")
+        elif action == 1:
+            client.put(f"/tweets/{uuid}/tweet/")
+        else:
+            client.delete(f"/tweets/{uuid}/")
+            uuids.remove(uuid)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tweets", type=int, default=10000)
+    parser.add_argument("--changes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    setup()
+
+    from rest_framework.test import APIClient
+
+    from tweets.models import Tweet
+    from users.models import User
+
+    author = User.objects.create_user(username="author", password="password")
+    insert_tweets(args.tweets, [author.pk])
+    uuids = list(Tweet.objects.values_list("uuid", flat=True))
+
+    client = APIClient()
+    client.force_authenticate(author)
+    rng = random.Random(0)
+    full_url = f"/tweets/user/{author.uuid}/?page_size=100"
+    for count in args.changes:
+        since = client.get("/tweets/changes/").json()["next"]
+        make_changes(client, uuids, min(count, len(uuids)), rng)
+        (full_requests, full_bytes), full_seconds = timed(walk, client, full_url)
+        (delta_requests, delta_bytes), delta_seconds = timed(
+            walk_changes, client, author.uuid, since)
+        print(f"{count:>6} changes  full download {full_requests:>4} requests "
+              f"{full_bytes / 1024:>8.0f} KiB {full_seconds * 1000:>8.1f} ms  "
+              f"changes feed {delta_requests:>3} requests {delta_bytes / 1024:>7.0f} KiB "
+              f"{delta_seconds * 1000:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Cost of revalidating unchanged tweet responses.
+
+Times GET /tweets/recent/ pages and GET /tweets/<uuid>/ details sent fresh,
+which return 200 with the serialized body, against the same requests sent
+with If-None-Match, which return an empty 304, and reports the bytes sent.
+
+    cd speertweet_backend
+    python -m benchmarks.conditional --requests 2000
+"""
+
+import argparse
+
+from benchmarks.utils import insert_tweets, report, setup, timed
+
+
+def run(client, url, count, **headers):
+    sent = 0
+    for _ in range(count):
+        res = client.get(url, **headers)
+        sent += len(res.content)
+    return res.status_code, sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args()
+
+    setup()
+
+    from django.test import Client
+
+    from tweets.models import Tweet
+    from users.models import User
+
+    author_ids = [
+        User.objects.create_user(username=f"author{i}", password="password").pk
+        for i in range(100)
+    ]
+    insert_tweets(args.rows, author_ids)
+    uuid = Tweet.objects.values_list("uuid", flat=True).first()
+
+    client = Client()
+    urls = [
+        ("recent page", f"/tweets/recent/?page_size={args.page_size}"),
+        ("tweet detail", f"/tweets/{uuid}/"),
+    ]
+    for name, url in urls:
+        etag = client.get(url)["ETag"]
+        print(name)
+        for label, headers in (("200", {}), ("304", {"HTTP_IF_NONE_MATCH": etag})):
+            (status, sent), seconds = timed(run, client, url, args.requests, **headers)
+            assert str(status) == label, status
+            report(f"  {label}", args.requests, seconds, "requests")
+            print(f"  {label} bytes per response {sent // args.requests:>10}")
+
+
+if __name__ == "__main__":
+    main()
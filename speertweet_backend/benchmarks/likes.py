@@ -0,0 +1,98 @@
+"""
+Like throughput on a single hot tweet.
+
+Compares the original read-modify-save of the whole tweet row, the atomic
+single column UPDATE and the write-behind LIKE_BUFFER, first for the counter
+alone and then for full likes including the like row insert. Each mode runs
+with several threads hammering the same tweet.
+
+    cd speertweet_backend
+    python -m benchmarks.likes --likes 2000 --threads 4
+"""
+
+import argparse
+import threading
+
+from benchmarks.utils import report, setup, timed
+
+
+def run_threads(threads, fn, per_thread):
+    from django.db import connection
+
+    def work(n):
+        try:
+            for i in range(per_thread):
+                fn(n, i)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--likes", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    setup()
+
+    from django.db.models import F
+    from django.test.utils import override_settings
+
+    from tweets import counters
+    from tweets.models import Like, Tweet
+    from users.models import User
+
+    per_thread = args.likes // args.threads
+    total = per_thread * args.threads
+
+    author = User.objects.create_user(username="author", password="password")
+    tweet = Tweet.objects.create(text="viral", author=author)
+    User.objects.bulk_create(
+        User(username=f"fan{i}", password="!") for i in range(total))
+    users = list(User.objects.filter(username__startswith="fan").order_by("pk"))
+
+    def save_row(n, i):
+        t = Tweet.objects.get(pk=tweet.pk)
+        t.likes += 1
+        t.save()
+
+    def update_row(n, i):
+        Tweet.objects.filter(pk=tweet.pk).update(likes=F("likes") + 1)
+
+    print("counter only")
+    _, seconds = timed(run_threads, args.threads, save_row, per_thread)
+    report("  save() full row", total, seconds, "likes")
+    _, seconds = timed(run_threads, args.threads, update_row, per_thread)
+    report("  UPDATE likes = likes + 1", total, seconds, "likes")
+
+    buffer = counters.LikeCounterBuffer(flush_interval=1.0, max_pending=1000)
+    liked = counters.liked_tweet(tweet)
+    _, seconds = timed(run_threads, args.threads,
+                       lambda n, i: buffer.add(liked, 1), per_thread)
+    _, flush_seconds = timed(buffer.flush)
+    report("  buffered + flush", total, seconds + flush_seconds, "likes")
+
+    def like(n, i):
+        Like.objects.like(users[n * per_thread + i], tweet)
+
+    print("full like (row insert + counter)")
+    _, seconds = timed(run_threads, args.threads, like, per_thread)
+    report("  atomic UPDATE", total, seconds, "likes")
+
+    Like.objects.all().delete()
+    counters._buffer = None
+    with override_settings(LIKE_BUFFER={"ENABLED": True, "FLUSH_INTERVAL": 1.0,
+                                        "MAX_PENDING": 1000}):
+        _, seconds = timed(run_threads, args.threads, like, per_thread)
+        _, flush_seconds = timed(counters.get_like_buffer().flush)
+    report("  LIKE_BUFFER", total, seconds + flush_seconds, "likes")
+
+
+if __name__ == "__main__":
+    main()
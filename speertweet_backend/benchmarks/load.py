@@ -0,0 +1,357 @@
+"""
+End to end load benchmark of every endpoint.
+
+Sends requests through the real URLconf, either in process with the Django
+test client against a scratch database filled by `manage.py seed`, or over
+HTTP to a running server with --url. Reports p50/p95/p99 latency, throughput
+and, in process, queries per request of each endpoint, and saves the results
+as JSON. Pass an earlier result file with --compare to flag regressions.
+
+    cd speertweet_backend
+    python -m benchmarks.load --users 10000 --tweets 1000000 --output base.json
+    python -m benchmarks.load --reuse --compare base.json
+    python -m benchmarks.load --url http://127.0.0.1:8000 --username user0
+"""
+
+import argparse
+import http.client
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from benchmarks.utils import setup
+
+
+Scenario = namedtuple("Scenario", ["name", "method", "path", "body", "auth", "share"])
+
+
+def scenario(name, method, path, body=None, auth=False, share=1.0):
+    """
+    path and body are functions of the request number, so requests rotate
+    over the sampled tweets and users. share scales the request count.
+    """
+    return Scenario(name, method, path, body, auth, share)
+
+
+class InProcess:
+    """
+    Requests through the Django test client, one client per thread.
+    """
+
+    def __init__(self):
+        from django.test import Client
+
+        self.client_class = Client
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.client_class()
+        meta = {f"HTTP_{k.upper().replace('-', '_')}": v for k, v in (headers or {}).items()}
+        data = json.dumps(body) if body is not None else ""
+        res = client.generic(method, path, data, content_type="application/json", **meta)
+        content = b"".join(res.streaming_content) if res.streaming else res.content
+        return res.status_code, content
+
+    def count_queries(self, fn):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        return len(queries)
+
+    def close(self):
+        from django.db import connection
+
+        connection.close()
+
+
+class Remote:
+    """
+    Requests over HTTP keep-alive connections, one per thread.
+    """
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection_class = (
+            http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection)
+        self.netloc = parts.netloc
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = self.connection_class(self.netloc, timeout=60)
+        headers = {"Content-Type": "application/json", **(headers or {})}
+        data = json.dumps(body).encode() if body is not None else None
+        try:
+            conn.request(method, path, data, headers)
+            res = conn.getresponse()
+            return res.status, res.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self.local.conn = None
+            raise
+
+    def count_queries(self, fn):
+        fn()
+        return None
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+
+
+def get_json(transport, path, headers=None):
+    status, content = transport.request("GET", path, headers=headers)
+    if status != 200:
+        sys.exit(f"GET {path} returned {status}, is the database seeded?")
+    return json.loads(content)
+
+
+def sample(transport, username, password):
+    """
+    Look up tweets, users and words to send requests for through the API
+    itself, so the same code works in process and against a server.
+    """
+    status, content = transport.request(
+        "POST", "/accounts/login/", {"username": username, "password": password})
+    if status != 200:
+        sys.exit(f"could not log in as {username}, is the database seeded?")
+    auth = {"Authorization": f"Bearer {json.loads(content)['access']}"}
+
+    recent = get_json(transport, "/tweets/recent/?page_size=100")
+    tweets = [t["uuid"] for t in recent["results"]]
+    if not tweets:
+        sys.exit("no tweets, seed the database first")
+    usernames = sorted({t["author"] for t in recent["results"]} - {username})[:20]
+    user_uuids = [get_json(transport, f"/accounts/{name}/")["uuid"] for name in usernames]
+    words = sorted({word for t in recent["results"] for word in t["text"].split()})[:50]
+    next_page = urlsplit(recent["next"])
+    return {
+        "auth": auth,
+        "tweets": tweets,
+        "usernames": usernames or [username],
+        "user_uuids": user_uuids,
+        "words": words,
+        "next_page": f"{next_page.path}?{next_page.query}",
+    }
+
+
+def scenarios(data):
+    tweets, users = data["tweets"], data["usernames"]
+    user_uuids, words = data["user_uuids"], data["words"]
+    run = int(time.time())
+
+    def pick(items):
+        return lambda i: items[i % len(items)]
+
+    tweet, user, user_uuid = pick(tweets), pick(users), pick(user_uuids)
+    return [
+        scenario("recent_tweets", "GET", lambda i: "/tweets/recent/"),
+        scenario("recent_tweets_page_2", "GET", lambda i: data["next_page"]),
+        scenario("tweet_detail", "GET", lambda i: f"/tweets/{tweet(i)}/"),
+        scenario("tweet_batch", "GET", lambda i: "/tweets/batch/?ids=" + ",".join(
+            tweet(i + n) for n in range(20))),
+        scenario("user_tweets", "GET", lambda i: f"/tweets/user/{user_uuid(i)}/"),
+        scenario("own_tweets", "GET", lambda i: "/tweets/", auth=True),
+        scenario("home_timeline", "GET", lambda i: "/tweets/home/", auth=True),
+        scenario("trending", "GET", lambda i: "/tweets/trending/"),
+        scenario("search", "GET", lambda i: f"/tweets/search/?q={pick(words)(i)}"),
+        scenario("export", "GET", lambda i: f"/tweets/user/{user_uuid(i)}/export/",
+                 share=0.05),
+        scenario("like_status", "GET", lambda i: f"/tweets/{tweet(i)}/tweet/", auth=True),
+        scenario("current_user", "GET", lambda i: "/accounts/me/", auth=True),
+        scenario("user_details", "GET", lambda i: f"/accounts/{user(i)}/"),
+        scenario("create_tweet", "POST", lambda i: "/tweets/",
+                 lambda i: {"text": f"load test {i}"}, auth=True),
+        scenario("bulk_create_tweets", "POST", lambda i: "/tweets/bulk/",
+                 lambda i: [{"text": f"bulk load test {i} {n}"} for n in range(10)],
+                 auth=True, share=0.2),
+        scenario("like", "PUT", lambda i: f"/tweets/{tweet(i)}/tweet/", auth=True),
+        scenario("unlike", "DELETE", lambda i: f"/tweets/{tweet(i)}/tweet/", auth=True),
+        scenario("follow", "POST", lambda i: f"/accounts/{user(i)}/follow/", auth=True),
+        scenario("unfollow", "DELETE", lambda i: f"/accounts/{user(i)}/follow/", auth=True),
+        scenario("login", "POST", lambda i: "/accounts/login/",
+                 lambda i: {"username": "user0", "password": "password"}, share=0.2),
+        scenario("register", "POST", lambda i: "/accounts/register/",
+                 lambda i: {"username": f"load{run}x{i}", "password": "password",
+                            "confirm_password": "password"}, share=0.2),
+    ]
+
+
+def percentile(latencies, q):
+    if len(latencies) < 2:
+        return latencies[0]
+    return statistics.quantiles(latencies, n=100, method="inclusive")[q - 1]
+
+
+def run_scenario(transport, s, auth, requests, warmup, concurrency):
+    headers = auth if s.auth else None
+
+    def send(i):
+        body = s.body(i) if s.body else None
+        return transport.request(s.method, s.path(i), body, headers)[0]
+
+    # warm up, counting the queries of each request
+    queries = [transport.count_queries(lambda: send(i)) for i in range(warmup)]
+
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker(indices):
+        own = []
+        failed = 0
+        try:
+            for i in indices:
+                start = time.perf_counter()
+                try:
+                    status = send(i)
+                except (http.client.HTTPException, OSError):
+                    status = 599
+                own.append(time.perf_counter() - start)
+                failed += status >= 400
+        finally:
+            transport.close()
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    indices = range(warmup, warmup + requests)
+    threads = [threading.Thread(target=worker, args=(indices[n::concurrency],))
+               for n in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    counted = [q for q in queries if q is not None]
+    return {
+        "requests": requests,
+        "errors": errors[0],
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "throughput_rps": requests / wall,
+        "queries_per_request": statistics.fmean(counted) if counted else None,
+    }
+
+
+def print_results(results):
+    print(f"{'endpoint':<22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'req/s':>9} {'queries':>8} {'errors':>7}")
+    for name, r in results.items():
+        queries = f"{r['queries_per_request']:.1f}" if r["queries_per_request"] is not None else "-"
+        print(f"{name:<22} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+              f"{r['throughput_rps']:>9.1f} {queries:>8} {r['errors']:>7}")
+
+
+def compare(results, baseline_path, threshold):
+    """
+    Print the change of every endpoint against a saved run and return the
+    names of the endpoints that got slower than threshold allows or run more
+    queries.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    print(f"\ncompared with {baseline_path}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        change = r["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0
+        more_queries = (r["queries_per_request"] is not None
+                        and base["queries_per_request"] is not None
+                        and r["queries_per_request"] > base["queries_per_request"])
+        regressed = change > threshold or more_queries
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<22} p95 {change:>+8.1%}"
+              f"{'  more queries' if more_queries else ''}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="benchmark a running server instead of in process")
+    parser.add_argument("--reuse", action="store_true",
+                        help="keep the scratch database from the last run instead of seeding")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--tweets", type=int, default=100000)
+    parser.add_argument("--username", default="user0")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--only", nargs="+", help="endpoints to run")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="p95 slowdown counted as a regression")
+    args = parser.parse_args()
+
+    if args.url:
+        transport = Remote(args.url)
+    else:
+        setup(fresh=not args.reuse)
+        if not args.reuse:
+            from django.core.management import call_command
+            call_command("seed", users=args.users, tweets=args.tweets, verbosity=0,
+                         stdout=io.StringIO())
+        transport = InProcess()
+
+    data = sample(transport, args.username, args.password)
+    results = {}
+    for s in scenarios(data):
+        if args.only and s.name not in args.only:
+            continue
+        requests = max(int(args.requests * s.share), 2)
+        results[s.name] = run_scenario(
+            transport, s, data["auth"], requests, args.warmup, args.concurrency)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {
+                    "date": datetime.now(timezone.utc).isoformat(),
+                    "commit": git_commit(),
+                    "target": args.url or "in process",
+                    "requests": args.requests,
+                    "concurrency": args.concurrency,
+                    "python": platform.python_version(),
+                },
+                "results": results,
+            }, f, indent=2)
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Read throughput as read replicas are added.
+
+Seeds a scratch primary once, then for 0, 1, ... --replicas replicas copies
+it to that many SQLite files and runs reader and writer worker processes
+(the workers of benchmarks.sqlite_profile) for a fixed time while
+`manage.py sync_replicas` keeps the copies fresh. Reads go to the replicas
+through ReplicaRouter; writes, and with them the primary's write lock, stay
+on the primary.
+
+    cd speertweet_backend
+    python -m benchmarks.replicas --replicas 2 --readers 4 --writers 2 --seconds 10
+"""
+
+import argparse
+import multiprocessing
+import os
+
+from benchmarks.sqlite_profile import prepare, summarize, worker
+
+
+def sync(interval):
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    django.setup()
+
+    from django.core.management import call_command
+
+    call_command("sync_replicas", interval=interval, stdout=open(os.devnull, "w"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--sync-interval", type=float, default=2)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--tweets", type=int, default=50000)
+    args = parser.parse_args()
+
+    # spawned workers start clean and read the replica count from the environment
+    ctx = multiprocessing.get_context("spawn")
+    os.environ["BENCH_REPLICAS"] = "0"
+    with ctx.Pool(1) as pool:
+        pool.apply(prepare, (args.users, args.tweets))
+
+    for replicas in range(args.replicas + 1):
+        os.environ["BENCH_REPLICAS"] = str(replicas)
+        syncer = None
+        if replicas:
+            with ctx.Pool(1) as pool:
+                pool.apply(sync, (None,))
+            syncer = ctx.Process(target=sync, args=(args.sync_interval,), daemon=True)
+            syncer.start()
+
+        jobs = [("read", n, args.seconds, args.users) for n in range(args.readers)]
+        jobs += [("write", n, args.seconds, args.users) for n in range(args.writers)]
+        try:
+            with ctx.Pool(len(jobs)) as pool:
+                results = pool.starmap(worker, jobs)
+        finally:
+            if syncer is not None:
+                syncer.terminate()
+                syncer.join()
+        name = f"{replicas} replicas"
+        summarize(name, results, "read", args.seconds)
+        summarize(name, results, "write", args.seconds)
+
+
+if __name__ == "__main__":
+    main()
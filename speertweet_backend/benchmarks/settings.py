@@ -0,0 +1,48 @@
+"""
+Settings for the benchmark scripts: the project settings with the database
+moved to a scratch file, so a benchmark never touches db.sqlite3.
+"""
+
+import os
+import tempfile
+
+from speertweet_backend.settings import *  # noqa: F401,F403
+
+
+DEBUG = False
+
+ALLOWED_HOSTS = ["testserver", "localhost", "127.0.0.1"]
+
+DATABASES = {
+    "default": {
+        **DATABASES["default"],  # noqa: F405
+        "NAME": os.environ.get(
+            "BENCH_DB", os.path.join(tempfile.gettempdir(), "speertweet_bench.sqlite3")),
+    }
+}
+
+# BENCH_REPLICAS=N adds N read replicas, copies of the scratch database
+for i in range(1, int(os.environ.get("BENCH_REPLICAS", 0)) + 1):
+    DATABASES[f"replica{i}"] = {
+        **DATABASES["default"],
+        "NAME": f"{DATABASES['default']['NAME']}.replica{i}",
+    }
+
+# read-your-writes pins, kept in files every worker process sees
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "pins": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(tempfile.gettempdir(), "speertweet_bench_pins"),
+    },
+}
+
+REPLICAS = {  # noqa: F405
+    **REPLICAS,  # noqa: F405
+    "ALIASES": [alias for alias in DATABASES if alias != "default"],
+    "CACHE": "pins",
+    "SINGLE_PROCESS": False,
+}
+
+# hashing passwords properly would dominate any benchmark that creates users
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
@@ -0,0 +1,132 @@
+"""
+Concurrent reads and writes under each database profile.
+
+For every DATABASE_PROFILE a fresh scratch database is seeded, then reader
+and writer worker processes send requests through the test client for a
+fixed time: readers page through recent tweets and user tweets, writers post
+tweets and like them. After each request a worker closes old connections as
+the WSGI handler does, so the default profile reconnects on every request and
+the production profile keeps its connection. Reports throughput, latency and
+failed requests ("database is locked") per profile.
+
+    cd speertweet_backend
+    python -m benchmarks.sqlite_profile --readers 4 --writers 2 --seconds 10
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import time
+
+from benchmarks.utils import setup
+
+
+PROFILES = ("default", "production")
+
+
+def prepare(users, tweets):
+    setup(fresh=True)
+
+    from django.core.management import call_command
+    from django.db import connections
+
+    from speertweet_backend.database import pragma_values
+
+    call_command("seed", users=users, tweets=tweets, follows=10, days=3,
+                 timeline_hours=1, stdout=open(os.devnull, "w"))
+    values = pragma_values(connections["default"])
+    connections.close_all()
+    return values
+
+
+def worker(role, number, seconds, users):
+    """
+    Send requests as role ("read" or "write") for seconds and return the
+    latencies of the successful ones and the number that failed.
+    """
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    django.setup()
+
+    from django.db import close_old_connections
+    from django.test import Client
+
+    from tweets.models import Tweet
+    from users.models import User
+
+    rng = random.Random(number)
+    client = Client(raise_request_exception=False)
+    username = f"user{number + 1}"
+    token = client.post("/accounts/login/", {"username": username, "password": "password"},
+                        content_type="application/json").json()["access"]
+    auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+    tweets = [str(u) for u in Tweet.objects.order_by("-id").values_list("uuid", flat=True)[:500]]
+    authors = [str(u) for u in User.objects.values_list("uuid", flat=True)[:min(users, 100)]]
+    close_old_connections()
+
+    def request():
+        if role == "read":
+            if rng.random() < 0.5:
+                return client.get("/tweets/recent/")
+            return client.get(f"/tweets/user/{rng.choice(authors)}/")
+        if rng.random() < 0.5:
+            return client.post("/tweets/", {"text": "benchmark tweet"},
+                               content_type="application/json", **auth)
+        return client.put(f"/tweets/{rng.choice(tweets)}/tweet/", **auth)
+
+    latencies, failed = [], 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        res = request()
+        elapsed = time.perf_counter() - start
+        close_old_connections()
+        if res.status_code >= 500:
+            failed += 1
+        else:
+            latencies.append(elapsed)
+    return role, latencies, failed
+
+
+def summarize(name, results, role, seconds):
+    latencies = [t for r, times, _ in results if r == role for t in times]
+    failed = sum(f for r, _, f in results if r == role)
+    if len(latencies) < 2:
+        print(f"{name:<12} {role:<6} {len(latencies):>8} ok {failed:>6} failed")
+        return
+    q = statistics.quantiles(latencies, n=100)
+    print(f"{name:<12} {role:<6} {len(latencies) / seconds:>10.1f} req/s "
+          f"p50 {q[49] * 1000:>7.2f} ms  p99 {q[98] * 1000:>8.2f} ms  {failed:>6} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--tweets", type=int, default=50000)
+    parser.add_argument("--profiles", nargs="+", default=PROFILES, choices=PROFILES)
+    args = parser.parse_args()
+
+    # spawned workers start clean and read the profile from the environment
+    ctx = multiprocessing.get_context("spawn")
+    for profile in args.profiles:
+        os.environ["DATABASE_PROFILE"] = profile
+        with ctx.Pool(1) as pool:
+            pragmas = pool.apply(prepare, (args.users, args.tweets))
+        print(f"{profile}: {', '.join(f'{k}={v}' for k, v in pragmas.items())}")
+
+        jobs = [("read", n, args.seconds, args.users) for n in range(args.readers)]
+        jobs += [("write", n, args.seconds, args.users) for n in range(args.writers)]
+        with ctx.Pool(len(jobs)) as pool:
+            results = pool.starmap(worker, jobs)
+        summarize(profile, results, "read", args.seconds)
+        summarize(profile, results, "write", args.seconds)
+
+
+if __name__ == "__main__":
+    main()
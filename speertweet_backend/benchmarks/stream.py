@@ -0,0 +1,177 @@
+"""
+Memory per idle subscriber and delivery latency of the live tweet stream.
+
+Starts the ASGI deployment (uvicorn, one worker process) on a scratch
+database and opens --subscribers connections to /tweets/stream/, reporting
+the server's resident memory before and after and so the memory each idle
+subscriber costs. Then POSTs --tweets tweets, --rate per second, and reports
+how long each took from the start of its POST until every subscriber had
+read it, and how many deliveries were missed.
+
+Needs uvicorn: pip install uvicorn
+
+    cd speertweet_backend
+    python -m benchmarks.stream --subscribers 1000 10000 --tweets 50 --rate 10
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import subprocess
+import time
+
+from benchmarks.asgi import read_response, server_command, server_env, tree_rss, wait_for_port
+from benchmarks.utils import setup
+
+
+TEXT = re.compile(rb'"text":"stream (\d+)"')
+
+
+def prepare():
+    """
+    Create the author in the scratch database and return its access token.
+    """
+    setup(fresh=True)
+
+    from django.db import connections
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from users.models import User
+
+    author = User.objects.create_user(username="author", password="password")
+    token = str(RefreshToken.for_user(author).access_token)
+    connections.close_all()
+    return token
+
+
+class Subscriber:
+
+    def __init__(self):
+        self.reader = self.writer = None
+        self.received = {}
+
+    async def connect(self, port):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        self.writer.write(b"GET /tweets/stream/ HTTP/1.1\r\nHost: localhost\r\n"
+                          b"Accept: text/event-stream\r\n\r\n")
+        await self.reader.readuntil(b"\r\n\r\n")
+
+    async def listen(self):
+        buffer = b""
+        try:
+            while True:
+                chunk = await self.reader.read(65536)
+                if not chunk:
+                    return
+                now = time.perf_counter()
+                buffer += chunk
+                end = 0
+                for match in TEXT.finditer(buffer):
+                    self.received[int(match.group(1))] = now
+                    end = match.end()
+                buffer = buffer[end:]
+        except (OSError, asyncio.CancelledError):
+            return
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def connect_all(port, count, batch=500):
+    subscribers = [Subscriber() for _ in range(count)]
+    for start in range(0, count, batch):
+        await asyncio.gather(*(s.connect(port) for s in subscribers[start:start + batch]))
+    return subscribers
+
+
+async def post_tweets(port, token, count, rate):
+    """
+    POST count tweets over one connection and return when each was started.
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    sent = {}
+    for i in range(count):
+        start = time.perf_counter()
+        body = json.dumps({"text": f"stream {i}"}).encode()
+        writer.write(b"POST /tweets/ HTTP/1.1\r\nHost: localhost\r\n"
+                     b"Content-Type: application/json\r\n"
+                     + f"Authorization: Bearer {token}\r\n"
+                       f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        status, _ = await read_response(reader)
+        if status == 201:
+            sent[i] = start
+        await asyncio.sleep(max(0, start + 1 / rate - time.perf_counter()))
+    writer.close()
+    return sent
+
+
+async def warm_up(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /tweets/recent/ HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    await read_response(reader)
+    writer.close()
+
+
+async def measure(port, process, token, count, args):
+    await warm_up(port)
+    idle = tree_rss(process.pid)
+    subscribers = await connect_all(port, count)
+    listeners = [asyncio.create_task(s.listen()) for s in subscribers]
+    await asyncio.sleep(1)
+    connected = tree_rss(process.pid)
+
+    sent = await post_tweets(port, token, args.tweets, args.rate)
+    await asyncio.sleep(2)
+    for s in subscribers:
+        s.close()
+    for listener in listeners:
+        listener.cancel()
+    await asyncio.gather(*listeners, return_exceptions=True)
+
+    # a tweet is delivered when the last subscriber has read it
+    delivered, missed = [], 0
+    for i, start in sent.items():
+        times = [s.received[i] for s in subscribers if i in s.received]
+        missed += count - len(times)
+        if times:
+            delivered.append(max(times) - start)
+    report(count, idle, connected, delivered, missed)
+
+
+def report(count, idle, connected, delivered, missed):
+    per_subscriber = (connected - idle) / count
+    print(f"{count:>6} subscribers  rss {idle / 2**20:>6.1f} -> {connected / 2**20:>6.1f} MiB  "
+          f"{per_subscriber / 1024:>5.1f} KiB each", end="")
+    if len(delivered) < 2:
+        print(f"  {len(delivered)} tweets delivered")
+        return
+    q = statistics.quantiles(delivered, n=100)
+    print(f"  delivered to all p50 {q[49] * 1000:>7.1f} ms  p99 {q[98] * 1000:>7.1f} ms  "
+          f"{missed} missed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--tweets", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=10, help="tweets posted per second")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    token = prepare()
+    for count in args.subscribers:
+        process = subprocess.Popen(server_command("asgi", args.port, 1),
+                                   env=server_env("asgi"))
+        try:
+            wait_for_port(args.port, process)
+            asyncio.run(measure(args.port, process, token, count, args))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Trending tweets at tens of millions of rows.
+
+Compares ranking the recent tweets by a decay formula computed per request
+over the whole window with reading the top of the stored score index, and
+with the cached top list GET /tweets/trending/ serves. Also times likes with
+and without the in place score update.
+
+    cd speertweet_backend
+    python -m benchmarks.trending --rows 20000000
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.utils import insert_tweets, report, setup, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20000000)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--likes", type=int, default=5000)
+    args = parser.parse_args()
+
+    setup()
+
+    from django.core.cache import cache
+    from django.db.models import F, FloatField
+    from django.db.models.expressions import RawSQL
+    from django.test import Client
+
+    from tweets import trending
+    from tweets.models import Tweet
+    from tweets.scores import score_after
+    from users.models import User
+
+    author_ids = [
+        User.objects.create_user(username=f"author{i}", password="password").pk
+        for i in range(100)
+    ]
+    # the newest tweet is posted now, like counts follow a long tail
+    start = datetime.now(timezone.utc) - timedelta(seconds=args.rows)
+    _, seconds = timed(insert_tweets, args.rows, author_ids, start=start,
+                       likes=lambda i: int(random.paretovariate(1.2)) - 1)
+    report("insert", args.rows, seconds, "tweets")
+
+    since = datetime.now(timezone.utc) - timedelta(seconds=trending.get_setting("WINDOW"))
+    size = trending.get_setting("SIZE")
+    in_window = Tweet.objects.filter(date_created__gte=since).count()
+    print(f"{in_window} tweets in the trending window")
+
+    def per_request():
+        # likes / (age in hours + 2) ^ 1.8, computed for every tweet in the window
+        decayed = RawSQL(
+            "likes / pow((julianday('now') - julianday(date_created)) * 24 + 2, 1.8)",
+            (), output_field=FloatField())
+        return list(Tweet.objects.filter(date_created__gte=since)
+                    .annotate(decayed=decayed).order_by("-decayed").feed()[:size])
+
+    def indexed():
+        return list(Tweet.objects.filter(date_created__gte=since)
+                    .order_by("-score").feed()[:size])
+
+    client = Client()
+
+    def endpoint():
+        assert client.get("/tweets/trending/").status_code == 200
+
+    def uncached_endpoint():
+        cache.clear()
+        endpoint()
+
+    for name, fn in (("decay computed per request", per_request),
+                     ("score index", indexed),
+                     ("GET trending, cache miss", uncached_endpoint),
+                     ("GET trending, cached", endpoint)):
+        _, seconds = timed(lambda: [fn() for _ in range(args.requests)])
+        report(name, args.requests, seconds, "requests")
+
+    ids = random.sample(range(args.rows - in_window + 1, args.rows + 1), args.likes)
+
+    def like(score):
+        for pk in ids:
+            changes = {"likes": F("likes") + 1}
+            if score:
+                changes["score"] = score_after(F("likes") + 1)
+            Tweet.objects.filter(pk=pk).update(**changes)
+
+    _, seconds = timed(like, False)
+    report("like, count only", args.likes, seconds, "likes")
+    _, seconds = timed(like, True)
+    report("like, count and score", args.likes, seconds, "likes")
+
+
+if __name__ == "__main__":
+    main()
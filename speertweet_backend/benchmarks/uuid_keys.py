@@ -0,0 +1,68 @@
+"""
+Insert throughput and uuid index size, uuid4 against uuid7.
+
+Fills a table shaped like tweets_tweet with a unique uuid index, once with
+random uuid4 keys and once with time ordered uuid7 keys, and reports rows per
+second and the index size from SQLite's dbstat table. A small page cache is
+used so that, as with a table much larger than memory, scattered index
+inserts have to go to disk.
+
+    cd speertweet_backend
+    python -m benchmarks.uuid_keys --rows 2000000
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from benchmarks.utils import report
+from speertweet_backend.ids import uuid7
+
+
+def fill(path, rows, batch_size, cache_kib, uuid_factory):
+    if os.path.exists(path):
+        os.remove(path)
+
+    db = sqlite3.connect(path)
+    db.execute(f"PRAGMA cache_size = -{cache_kib}")
+    db.execute(
+        "CREATE TABLE tweets (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "uuid char(32) NOT NULL, text varchar(250) NOT NULL)")
+    db.execute("CREATE UNIQUE INDEX tweets_uuid_uniq ON tweets (uuid)")
+
+    start = time.perf_counter()
+    for done in range(0, rows, batch_size):
+        with db:
+            db.executemany(
+                "INSERT INTO tweets (uuid, text) VALUES (?, ?)",
+                ((uuid_factory().hex, "tweet") for _ in range(min(batch_size, rows - done))))
+    seconds = time.perf_counter() - start
+
+    pages, size = db.execute(
+        "SELECT COUNT(*), SUM(pgsize) FROM dbstat WHERE name = 'tweets_uuid_uniq'"
+    ).fetchone()
+    db.close()
+    os.remove(path)
+    return seconds, pages, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--cache-kib", type=int, default=2048)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), "speertweet_uuid_keys.sqlite3")
+    for name, factory in (("uuid4", uuid.uuid4), ("uuid7", uuid7)):
+        seconds, pages, size = fill(
+            path, args.rows, args.batch_size, args.cache_kib, factory)
+        report(f"{name} insert", args.rows, seconds, "rows")
+        print(f"{name} index    {pages:>9} pages {size / 2 ** 20:>8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
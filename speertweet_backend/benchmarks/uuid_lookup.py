@@ -0,0 +1,109 @@
+"""
+Tweet detail lookup latency by uuid as the table grows.
+
+For each table size the full GET /tweets/<uuid>/ request is timed with the
+unique uuid index in place and again with it dropped, which is how every
+lookup ran before the index existed.
+
+    cd speertweet_backend
+    python -m benchmarks.uuid_lookup --rows 1000000 10000000
+"""
+
+import argparse
+import random
+import statistics
+import time
+from importlib import import_module
+
+from benchmarks.utils import insert_tweets, setup
+
+
+def lookup_latencies(client, uuids):
+    latencies = []
+    for value in uuids:
+        start = time.perf_counter()
+        res = client.get(f"/tweets/{value}/")
+        latencies.append(time.perf_counter() - start)
+        assert res.status_code == 200, res.status_code
+    return latencies
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return (f"p50 {statistics.median(latencies) * 1000:8.3f}ms  "
+            f"p99 {p99 * 1000:8.3f}ms")
+
+
+def named_index(connection, model):
+    """
+    Return the name of the unique uuid index of the still empty tweet table.
+    The later migrations rebuild the table on SQLite, which turns the index
+    0005 creates into an inline UNIQUE constraint that can not be dropped, so
+    the table is rebuilt once more without it, and without the search
+    triggers this benchmark does not need, and the named index added back.
+    """
+    migration = import_module("tweets.migrations.0005_tweet_uuid_unique")
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    if migration.INDEX in constraints:
+        return migration.INDEX
+
+    from django.db import models
+
+    field = model._meta.get_field("uuid")
+    name, _, args, kwargs = field.deconstruct()
+    kwargs.pop("unique")
+    plain = models.UUIDField(*args, **kwargs)
+    plain.set_attributes_from_name(name)
+    plain.model = model
+    with connection.schema_editor() as schema_editor:
+        schema_editor.alter_field(model, field, plain)
+        migration.add_unique_index(None, schema_editor)
+    return migration.INDEX
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--scan-lookups", type=int, default=5,
+                        help="lookups without the index, each is a full scan")
+    args = parser.parse_args()
+
+    setup()
+
+    from django.db import connection
+    from django.test import Client
+
+    from tweets.models import Tweet
+    from users.models import User
+
+    author_ids = [
+        User.objects.create_user(username=f"author{i}", password="password").pk
+        for i in range(100)
+    ]
+    table = Tweet._meta.db_table
+    index = named_index(connection, Tweet)
+
+    client = Client()
+    rows = 0
+    for target in sorted(args.rows):
+        insert_tweets(target - rows, author_ids)
+        rows = target
+
+        pks = random.sample(range(1, rows + 1), min(args.lookups, rows))
+        ids = list(Tweet.objects.filter(pk__in=pks).values_list("uuid", flat=True))
+        print(f"{rows} rows")
+        print(f"  indexed    {summary(lookup_latencies(client, ids))}")
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP INDEX "{index}"')
+        scan = lookup_latencies(client, random.sample(ids, min(args.scan_lookups, len(ids))))
+        print(f"  full scan  {summary(scan)}")
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE UNIQUE INDEX "{index}" ON "{table}" ("uuid")')
+
+
+if __name__ == "__main__":
+    main()
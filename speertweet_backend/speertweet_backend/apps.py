@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class SpeertweetConfig(AppConfig):
+    name = "speertweet_backend"
+
+    def ready(self):
+        from .database import configure_connection
+
+        connection_created.connect(configure_connection, dispatch_uid='configure_connection')
@@ -12,5 +12,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "speertweet_backend.settings")
+# serve the read endpoints with async views, ASYNC_VIEWS=0 keeps the sync ones
+os.environ.setdefault("ASYNC_VIEWS", "1")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once Django is set up
+from tweets.stream import StreamApplication  # noqa: E402
+
+# /tweets/stream/ is answered in the event loop, everything else by Django
+application = StreamApplication(django_application)
@@ -0,0 +1,46 @@
+"""
+URLconf of the ASGI deployment: the project URLconf with the read endpoints
+served by async views, see speertweet_backend.async_views. The routes keep
+their paths, names and order, only their views are replaced.
+"""
+
+from django.contrib import admin
+from django.urls import include, path
+
+from tweets import urls as tweets_urls
+from tweets.async_views import (
+    AsyncRecentTweetsView,
+    AsyncTweetDetailView,
+    AsyncUserTweetListView,
+)
+from users import urls as users_urls
+from users.async_views import AsyncUserDetailsView
+
+from .metrics import metrics_view
+from .urls import handler400, handler500  # noqa: F401
+
+
+def with_views(patterns, views):
+    """
+    Return the URL patterns with the view of every route named in views
+    replaced by views[name].
+    """
+    return [
+        path(str(pattern.pattern), views[pattern.name], name=pattern.name)
+        if pattern.name in views else pattern
+        for pattern in patterns
+    ]
+
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('accounts/', include(with_views(users_urls.urlpatterns, {
+        'user_details': AsyncUserDetailsView.as_view(),
+    }))),
+    path('tweets/', include(with_views(tweets_urls.urlpatterns, {
+        'recent_tweets': AsyncRecentTweetsView.as_view(),
+        'tweet_detail': AsyncTweetDetailView.as_view(),
+        'get_user_tweets': AsyncUserTweetListView.as_view(),
+    }))),
+    path('metrics', metrics_view, name='metrics'),
+]
@@ -0,0 +1,93 @@
+"""
+Async views for the read endpoints, served under ASGI.
+
+REST framework views are synchronous, so under ASGI every request to one is
+run in a worker thread, and a slow client holds that thread for as long as
+it takes to send the request and read the response. The views built on
+AsyncReadView run in the event loop instead: they authenticate with
+AsyncJWTAuthentication, read through the async ORM and the object caches'
+aget, and answer with the same JSON, status codes and validators as the
+REST framework views they stand in for. speertweet_backend.asgi_urls puts
+them in front of the URLconf.
+
+Django's async ORM still runs each query in the one database thread, what is
+saved is the thread per connection. Only JWT authentication is supported;
+methods other than GET, HEAD and OPTIONS are handed to the synchronous view.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views import View
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    MethodNotAllowed,
+    NotAuthenticated,
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from .authentication import AsyncJWTAuthentication
+
+
+class AsyncReadView(View):
+    """
+    Base of the async views. Subclasses implement `async def read(request,
+    **kwargs)` returning an HttpResponse, usually from render(). A view that
+    shares its URL with writes sets sync_view to the view serving them and
+    adds their methods to http_method_names.
+    """
+    http_method_names = ['get', 'head', 'options']
+    authentication = AsyncJWTAuthentication
+    renderer = JSONRenderer()
+    sync_view = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # like REST framework views: session authenticated writes are not
+        # supported here, token authenticated requests need no CSRF token
+        view.csrf_exempt = True
+        return view
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            await self.authentication().aauthenticate(request)
+            return await self.read(Request(request), **kwargs)
+        except APIException as exc:
+            return self.handle_exception(request, exc)
+
+    async def delegate(self, request, *args, **kwargs):
+        return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+    put = patch = delete = delegate
+
+    async def http_method_not_allowed(self, request, *args, **kwargs):
+        return self.handle_exception(request, MethodNotAllowed(request.method))
+
+    async def read(self, request, **kwargs):
+        raise NotImplementedError
+
+    def render(self, data, status=200):
+        """
+        Return the response REST framework would render for data.
+        """
+        content = self.renderer.render(data)
+        response = HttpResponse(content, status=status, content_type=self.renderer.media_type)
+        if not content:
+            del response['Content-Type']
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    def handle_exception(self, request, exc):
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            # answered with 401 and a challenge, as APIView does
+            exc.auth_header = self.authentication().authenticate_header(request)
+        drf_response = exception_handler(exc, {})
+        response = self.render(drf_response.data, drf_response.status_code)
+        for name, value in drf_response.items():
+            if name != 'Content-Type':
+                response[name] = value
+        return response
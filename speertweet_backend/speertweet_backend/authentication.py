@@ -0,0 +1,81 @@
+"""
+The REST framework authentication classes of the project: timed as the auth
+phase of the request metrics, and telling the replica router who the user
+is, so users who just wrote read from the primary.
+"""
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication
+from rest_framework_simplejwt import authentication as jwt_authentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import routers
+from .metrics import timer
+
+
+class TimedAuthenticationMixin:
+
+    def authenticate(self, request):
+        with timer('auth'):
+            return super().authenticate(request)
+
+
+class ReplicaPinMixin:
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            routers.authenticated(result[0])
+        return result
+
+
+class JWTAuthentication(TimedAuthenticationMixin, ReplicaPinMixin,
+                        jwt_authentication.JWTAuthentication):
+    pass
+
+
+class SessionAuthentication(TimedAuthenticationMixin, ReplicaPinMixin,
+                            authentication.SessionAuthentication):
+    pass
+
+
+class BasicAuthentication(TimedAuthenticationMixin, ReplicaPinMixin,
+                          authentication.BasicAuthentication):
+    pass
+
+
+class AsyncJWTAuthentication(jwt_authentication.JWTAuthentication):
+    """
+    JWT authentication for the async views: the token is checked in the event
+    loop and the user is loaded with the async ORM.
+    """
+
+    async def aauthenticate(self, request):
+        with timer('auth'):
+            header = self.get_header(request)
+            if header is None:
+                return None
+            raw_token = self.get_raw_token(header)
+            if raw_token is None:
+                return None
+            validated_token = self.get_validated_token(raw_token)
+            user = await self.aget_user(validated_token)
+        routers.authenticated(user)
+        return user, validated_token
+
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
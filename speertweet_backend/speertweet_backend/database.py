@@ -0,0 +1,83 @@
+"""
+Database performance profiles.
+
+settings.DATABASE_PROFILE selects how SQLite connections are set up:
+
+default
+    SQLite's own defaults: a rollback journal, in which a writer blocks every
+    reader, a full fsync on each commit and a new connection per request.
+production
+    Write-ahead logging, so readers and the writer no longer block each
+    other, synchronous=NORMAL (an fsync per checkpoint instead of per commit,
+    still safe against corruption in WAL mode), memory mapped reads, a larger
+    page cache and a busy timeout, so writers queue for the lock instead of
+    failing with "database is locked". Connections are kept for
+    CONN_MAX_AGE seconds and health checked before reuse.
+
+The pragmas are run on every new connection by configure_connection, a
+connection_created receiver. The persistent connection keys are merged into
+DATABASES by the settings module, see CONNECTION_SETTINGS.
+"""
+
+from django.conf import settings
+
+
+PRAGMAS = {
+    'default': {},
+    'production': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # negative is KiB: 64 MiB
+        'busy_timeout': 5000,  # ms
+        'temp_store': 'memory',
+    },
+}
+
+CONNECTION_SETTINGS = {
+    'default': {},
+    'production': {
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+}
+
+
+def check_profile(profile):
+    """
+    Return profile if it names a database profile, else raise ValueError.
+    """
+    if profile not in PRAGMAS:
+        raise ValueError(f'Unknown DATABASE_PROFILE {profile!r}, pick one of {sorted(PRAGMAS)}')
+    return profile
+
+
+def get_profile():
+    return check_profile(getattr(settings, 'DATABASE_PROFILE', 'default'))
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    Apply the pragmas of the database profile to a new SQLite connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = PRAGMAS[get_profile()]
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def pragma_values(connection):
+    """
+    The current value of each pragma the profiles set, for checks and tests.
+    """
+    names = {name for pragmas in PRAGMAS.values() for name in pragmas}
+    values = {}
+    with connection.cursor() as cursor:
+        for name in sorted(names):
+            cursor.execute(f'PRAGMA {name}')
+            values[name] = cursor.fetchone()[0]
+    return values
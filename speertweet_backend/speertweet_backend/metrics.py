@@ -0,0 +1,329 @@
+"""
+Per request performance metrics.
+
+MetricsMiddleware times each request and splits the time into phases: SQL
+(query count and time, from a wrapper around every query), authentication,
+serialization and rendering. Each response reports its own phases in a
+Server-Timing header, and the phases are added to latency histograms per
+view, exposed in the Prometheus text format at /metrics.
+
+Every worker process keeps its own histograms. With
+METRICS['MULTIPROCESS_DIR'] set, each process saves them to a file of its
+own in that directory every FLUSH_INTERVAL seconds and on exit, and /metrics
+adds up the files of all processes, so any worker can answer a scrape. Empty
+the directory when the server restarts.
+
+With METRICS['ENABLED'] off the middleware removes itself at startup and
+timer() returns a shared no-op context manager, so the cost is one context
+variable lookup per timed block.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SERVER_TIMING': True,
+    'MULTIPROCESS_DIR': None,
+    'FLUSH_INTERVAL': 5,
+}
+
+PHASES = ('total', 'db', 'auth', 'serialize', 'render')
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+DURATION = 'speertweet_request_duration_seconds'
+QUERIES = 'speertweet_request_queries'
+
+HELP = {
+    DURATION: ('Time spent in each phase of a request, by view. '
+               'db overlaps auth and serialize when they run queries.'),
+    QUERIES: 'SQL queries run by a request, by view.',
+}
+
+_NOOP = nullcontext()
+
+_timings = ContextVar('request_timings', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'METRICS', {}).get(name, DEFAULTS[name])
+
+
+class Timer:
+    """
+    Adds the time spent inside the block to one phase. Nested blocks of the
+    same phase are only counted once, by the outermost.
+    """
+
+    def __init__(self, timings, phase):
+        self.timings = timings
+        self.phase = phase
+
+    def __enter__(self):
+        depth = self.timings.depth
+        depth[self.phase] = depth.get(self.phase, 0) + 1
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        depth = self.timings.depth
+        depth[self.phase] -= 1
+        if not depth[self.phase]:
+            self.timings.add(self.phase, elapsed)
+
+
+class Timings:
+    """
+    The phase durations and query count of one request.
+    """
+
+    def __init__(self):
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.depth = {}
+
+    def add(self, phase, seconds):
+        self.durations[phase] += seconds
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['db'] += time.perf_counter() - start
+            self.queries += 1
+
+    def header(self):
+        parts = []
+        for phase in PHASES:
+            part = f'{phase};dur={self.durations[phase] * 1000:.2f}'
+            if phase == 'db':
+                part += f';desc="{self.queries} queries"'
+            parts.append(part)
+        return ', '.join(parts)
+
+
+def timer(phase):
+    """
+    Context manager adding the time spent in it to phase of the current
+    request, a no-op outside a measured request.
+    """
+    timings = _timings.get()
+    if timings is None:
+        return _NOOP
+    return Timer(timings, phase)
+
+
+class TimedSerializerMixin:
+    """
+    Counts the time spent building a serializer's data as serialize time.
+    """
+
+    @property
+    def data(self):
+        with timer('serialize'):
+            return super().data
+
+
+class Histogram:
+
+    def __init__(self, buckets, counts=None, total=0.0, count=0):
+        self.buckets = buckets
+        self.counts = counts or [0] * len(buckets)
+        self.sum = total
+        self.count = count
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+
+class Registry:
+    """
+    The histograms of this process, keyed by metric name and labels.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.saved = time.monotonic()
+
+    def _histogram(self, name, labels, buckets):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        return histogram
+
+    def observe(self, view, timings):
+        with self.lock:
+            for phase in PHASES:
+                self._histogram(DURATION, (('view', view), ('phase', phase)),
+                                DURATION_BUCKETS).observe(timings.durations[phase])
+            self._histogram(QUERIES, (('view', view),), QUERY_BUCKETS).observe(timings.queries)
+
+    def snapshot(self):
+        with self.lock:
+            return [
+                [name, [list(label) for label in labels], h.counts[:], h.sum, h.count]
+                for (name, labels), h in self.histograms.items()
+            ]
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def save(self, force=False):
+        """
+        Write this process's histograms to its file in MULTIPROCESS_DIR, at
+        most every FLUSH_INTERVAL seconds unless force is True.
+        """
+        directory = get_setting('MULTIPROCESS_DIR')
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self.saved < get_setting('FLUSH_INTERVAL'):
+            return
+        self.saved = now
+
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        # replaced in one step, so a scrape never reads half a file
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def collect(self):
+        """
+        Return the histograms of every process, or of this one without a
+        MULTIPROCESS_DIR.
+        """
+        directory = get_setting('MULTIPROCESS_DIR')
+        if not directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.save(force=True)
+            snapshots = []
+            for name in os.listdir(directory):
+                if name.endswith('.json'):
+                    try:
+                        with open(os.path.join(directory, name)) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue
+
+        merged = {}
+        for snapshot in snapshots:
+            for name, labels, counts, total, count in snapshot:
+                key = (name, tuple(tuple(label) for label in labels))
+                buckets = DURATION_BUCKETS if name == DURATION else QUERY_BUCKETS
+                histogram = Histogram(buckets, counts, total, count)
+                if key in merged:
+                    merged[key].merge(histogram)
+                else:
+                    merged[key] = histogram
+        return merged
+
+
+registry = Registry()
+
+atexit.register(registry.save, force=True)
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def render_prometheus(histograms):
+    lines = []
+    for name in (DURATION, QUERIES):
+        lines.append(f'# HELP {name} {HELP[name]}')
+        lines.append(f'# TYPE {name} histogram')
+        for (metric, labels), h in sorted(histograms.items()):
+            if metric != name:
+                continue
+            label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+            cumulative = 0
+            for bound, count in zip(h.buckets, h.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {h.count}')
+            lines.append(f'{name}_sum{{{label_text}}} {h.sum}')
+            lines.append(f'{name}_count{{{label_text}}} {h.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    The request histograms in the Prometheus text format.
+    """
+    if not get_setting('ENABLED'):
+        raise Http404()
+    return HttpResponse(render_prometheus(registry.collect()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MetricsMiddleware:
+    """
+    Measure every request, see the module docstring. Put it first in
+    MIDDLEWARE so the total includes the other middleware.
+    """
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.server_timing = get_setting('SERVER_TIMING')
+
+    def __call__(self, request):
+        timings = Timings()
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        timings.durations['total'] = time.perf_counter() - start
+
+        match = request.resolver_match
+        registry.observe(match.view_name if match else 'unmatched', timings)
+        registry.save()
+        if self.server_timing:
+            response['Server-Timing'] = timings.header()
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, time it from here
+        timings = _timings.get()
+        start = time.perf_counter()
+
+        def rendered(response):
+            timings.add('render', time.perf_counter() - start)
+
+        response.add_post_render_callback(rendered)
+        return response
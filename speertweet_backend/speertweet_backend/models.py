@@ -0,0 +1,10 @@
+from django.db import models
+
+
+class Heartbeat(models.Model):
+    """
+    A single row rewritten on the primary database every few seconds. Read
+    from a replica, it tells how far the replica lags behind, see
+    speertweet_backend.routers.
+    """
+    date_written = models.DateTimeField()
@@ -0,0 +1,302 @@
+"""
+Versioned read-through object cache.
+
+Each ObjectCache keeps a bounded LRU tier in process memory and, when
+OBJECT_CACHE['SHARED_CACHE'] names one of CACHES, a shared tier for all worker
+processes. With a shared tier every key has a version stored in it: entries
+are tagged with the version they were loaded under and invalidating a key
+bumps the version, so stale entries in any worker's LRU, and values loaded by
+a request that raced the invalidation, are never served again. Lookups that
+find nothing are cached as None for the shorter NEGATIVE_TTL.
+
+Invalidation only reaches other processes through the shared tier, so
+without SHARED_CACHE the caches are off unless SINGLE_PROCESS declares
+that one process serves every request.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .routers import use_primary
+
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 10000,
+    'TTL': 300,
+    'NEGATIVE_TTL': 5,
+    'SHARED_CACHE': None,
+    'SINGLE_PROCESS': False,
+}
+
+Entry = namedtuple('Entry', ['version', 'value', 'expires'])
+
+_MISSING = object()
+
+# every ObjectCache by namespace, for stats and clearing
+registry = {}
+
+
+def get_config():
+    config = {**DEFAULTS, **getattr(settings, 'OBJECT_CACHE', {})}
+    if config['SHARED_CACHE'] is None and not config['SINGLE_PROCESS']:
+        # another worker's process memory would go stale
+        config['ENABLED'] = False
+    return config
+
+
+class LRUCache:
+    """
+    Thread safe least recently used mapping holding at most max_entries.
+    """
+
+    def __init__(self):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, max_entries):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ObjectCache:
+    """
+    Read-through cache of one kind of object. loader(key) returns the value to
+    cache for a key, or None when there is no such object. The optional
+    bulk_loader(keys) returns {key: value} for the keys that exist, so that
+    get_many loads all its misses at once.
+    """
+
+    def __init__(self, namespace, loader, bulk_loader=None):
+        self.namespace = namespace
+        self.loader = loader
+        self.bulk_loader = bulk_loader
+        self.hits = 0
+        self.misses = 0
+        self._local = LRUCache()
+        # bumped by every invalidation, so a load that raced one is not kept
+        self._epoch = 0
+        registry[namespace] = self
+
+    def get(self, key):
+        config = get_config()
+        if not config['ENABLED']:
+            return self.loader(key)
+
+        key = str(key)
+        shared = self._shared(config)
+        version = self._version(key, shared)
+        entry = self._local.get(key)
+        if entry is not None and entry.version == version and entry.expires > time.monotonic():
+            self.hits += 1
+            return entry.value
+
+        if shared is not None:
+            value = shared.get(self._value_key(key, version), _MISSING)
+            if value is not _MISSING:
+                self.hits += 1
+                self._store_local(key, version, value, config)
+                return value
+
+        self.misses += 1
+        epoch = self._epoch
+        # never fill the cache from a replica that may lag behind
+        with use_primary():
+            value = self.loader(key)
+        if shared is not None:
+            shared.set(self._value_key(key, version), value, self._ttl(value, config))
+        if epoch == self._epoch:
+            self._store_local(key, version, value, config)
+        return value
+
+    def get_many(self, keys):
+        """
+        Return {key: value} for every key, None for those that do not exist.
+        Keys are returned as strings; all misses are loaded together.
+        """
+        keys = list(dict.fromkeys(str(key) for key in keys))
+        config = get_config()
+        if not config['ENABLED']:
+            return self._load_many(keys)
+
+        shared = self._shared(config)
+        versions = self._versions(keys, shared)
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            entry = self._local.get(key)
+            if entry is not None and entry.version == versions[key] and entry.expires > now:
+                found[key] = entry.value
+
+        misses = [key for key in keys if key not in found]
+        if shared is not None and misses:
+            value_keys = {self._value_key(key, versions[key]): key for key in misses}
+            for value_key, value in shared.get_many(list(value_keys)).items():
+                key = value_keys[value_key]
+                found[key] = value
+                self._store_local(key, versions[key], value, config)
+            misses = [key for key in misses if key not in found]
+
+        self.hits += len(keys) - len(misses)
+        self.misses += len(misses)
+        if misses:
+            epoch = self._epoch
+            with use_primary():
+                loaded = self._load_many(misses)
+            if shared is not None:
+                values = {self._value_key(key, versions[key]): loaded[key] for key in misses}
+                shared.set_many(
+                    {k: v for k, v in values.items() if v is not None}, config['TTL'])
+                shared.set_many(
+                    {k: v for k, v in values.items() if v is None}, config['NEGATIVE_TTL'])
+            if epoch == self._epoch:
+                for key in misses:
+                    self._store_local(key, versions[key], loaded[key], config)
+            found.update(loaded)
+        return {key: found[key] for key in keys}
+
+    async def aget(self, key):
+        """
+        get() for async views. A hit in the process memory tier is answered
+        in the event loop; with a shared tier, or on a miss, get() runs in
+        the database thread.
+        """
+        config = get_config()
+        if config['ENABLED'] and config['SHARED_CACHE'] is None:
+            entry = self._local.get(str(key))
+            if entry is not None and entry.expires > time.monotonic():
+                self.hits += 1
+                return entry.value
+        return await sync_to_async(self.get)(key)
+
+    def invalidate(self, key, using=None):
+        """
+        Drop the key now and, inside a transaction of the database the change
+        was written to, again once it commits, so a read racing the commit can
+        not cache the old value.
+        """
+        key = str(key)
+        using = using or DEFAULT_DB_ALIAS
+        self._invalidate(key)
+        if connections[using].in_atomic_block:
+            transaction.on_commit(lambda: self._invalidate(key), using=using)
+
+    def _invalidate(self, key):
+        self._epoch += 1
+        self._local.delete(key)
+
+        config = get_config()
+        shared = self._shared(config)
+        if shared is not None:
+            self._bump(shared, self._version_key(key), config)
+
+    def clear(self):
+        """
+        Invalidate every key of this cache.
+        """
+        self._epoch += 1
+        self._local.clear()
+
+        config = get_config()
+        shared = self._shared(config)
+        if shared is not None:
+            self._bump(shared, self._generation_key(), config)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._local),
+        }
+
+    def _load_many(self, keys):
+        if self.bulk_loader is None:
+            return {key: self.loader(key) for key in keys}
+        loaded = self.bulk_loader(keys)
+        return {key: loaded.get(key) for key in keys}
+
+    def _store_local(self, key, version, value, config):
+        entry = Entry(version, value, time.monotonic() + self._ttl(value, config))
+        self._local.set(key, entry, config['MAX_ENTRIES'])
+
+    def _ttl(self, value, config):
+        return config['TTL'] if value is not None else config['NEGATIVE_TTL']
+
+    def _shared(self, config):
+        alias = config['SHARED_CACHE']
+        return caches[alias] if alias else None
+
+    def _version(self, key, shared):
+        return self._versions([key], shared)[key]
+
+    def _versions(self, keys, shared):
+        if shared is None:
+            return dict.fromkeys(keys)
+        generation_key = self._generation_key()
+        version_keys = {key: self._version_key(key) for key in keys}
+        versions = shared.get_many([generation_key, *version_keys.values()])
+        generation = versions.get(generation_key, 0)
+        return {
+            key: (generation, versions.get(version_key, 0))
+            for key, version_key in version_keys.items()
+        }
+
+    def _bump(self, shared, version_key, config):
+        # versions outlive every value stored under them, and a version that
+        # expired restarts at a random number so it can not meet old values
+        timeout = 2 * max(config['TTL'], config['NEGATIVE_TTL'])
+        try:
+            shared.incr(version_key)
+            shared.touch(version_key, timeout)
+        except ValueError:
+            shared.set(version_key, random.getrandbits(31), timeout)
+
+    def _generation_key(self):
+        return f'objectcache:{self.namespace}:generation'
+
+    def _version_key(self, key):
+        return f'objectcache:{self.namespace}:version:{key}'
+
+    def _value_key(self, key, version):
+        generation, key_version = version
+        return f'objectcache:{self.namespace}:{generation}:{key_version}:{key}'
+
+
+def cache_stats():
+    """
+    Return the hit and miss counters of every object cache by namespace.
+    """
+    return {namespace: cache.stats() for namespace, cache in registry.items()}
+
+
+def clear_caches():
+    for cache in registry.values():
+        cache.clear()
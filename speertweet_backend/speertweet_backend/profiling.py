@@ -0,0 +1,153 @@
+"""
+Opt-in profiling of single requests.
+
+ProfilerMiddleware runs a request under cProfile when it carries a valid
+signed PROFILER['HEADER'] (see `manage.py profile_token`) or is picked at
+random with probability SAMPLE_RATE. It writes two files to DIRECTORY, named
+after the view and the time of the request:
+
+    RecentTweetsAPIView-20240101T120000-1a2b3c4d.prof  pstats, e.g. for snakeviz
+    RecentTweetsAPIView-20240101T120000-1a2b3c4d.sql   every query, with its time
+
+and returns the shared file name in the X-Profile-Id response header. With
+PROFILER['ENABLED'] off the middleware removes itself at startup.
+"""
+
+import cProfile
+import os
+import random
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+
+DEFAULTS = {
+    'ENABLED': False,
+    'DIRECTORY': 'profiles',
+    'HEADER': 'X-Profile',
+    'TOKEN_MAX_AGE': 60 * 60,
+    'SAMPLE_RATE': 0.0,
+}
+
+SALT = 'speertweet_backend.profiling'
+
+
+def get_setting(name):
+    return getattr(settings, 'PROFILER', {}).get(name, DEFAULTS[name])
+
+
+def make_token():
+    """
+    Return a header value that triggers profiling for TOKEN_MAX_AGE seconds.
+    """
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def check_token(value):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(value, max_age=get_setting('TOKEN_MAX_AGE'))
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def view_name(request):
+    """
+    The class name of the view that handled request, or the function name
+    of a plain view.
+    """
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    func = match.func
+    view_class = getattr(func, 'view_class', None)
+    return (view_class or func).__name__
+
+
+class QueryLog:
+    """
+    Execute wrapper recording the SQL and the time of every query. The SQL is
+    kept with its placeholders: parameters carry passwords, tokens and other
+    user data that have no place in files on disk.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            if many:
+                detail = f'{len(params)} parameter rows'
+            else:
+                detail = f'{len(params or ())} parameters'
+            self.queries.append((elapsed, context['connection'].alias, detail, sql))
+
+    def write(self, path, header):
+        with open(path, 'w') as f:
+            f.write(f'-- {header}\n')
+            total = sum(query[0] for query in self.queries)
+            f.write(f'-- {len(self.queries)} queries, {total * 1000:.2f} ms\n')
+            for elapsed, alias, detail, sql in self.queries:
+                f.write(f'\n-- {elapsed * 1000:.2f} ms on {alias}, {detail}\n{sql};\n')
+
+
+class ProfilerMiddleware:
+    """
+    Profile the requests asked for, see the module docstring.
+    """
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.header = 'HTTP_' + get_setting('HEADER').upper().replace('-', '_')
+        self.sample_rate = get_setting('SAMPLE_RATE')
+
+    def wanted(self, request):
+        token = request.META.get(self.header)
+        if token is not None:
+            return check_token(token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.wanted(request):
+            return self.get_response(request)
+
+        queries = QueryLog()
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+        elapsed = time.perf_counter() - start
+
+        directory = get_setting('DIRECTORY')
+        os.makedirs(directory, exist_ok=True)
+        name = '-'.join([
+            view_name(request),
+            timezone.now().strftime('%Y%m%dT%H%M%S'),
+            uuid.uuid4().hex[:8],
+        ])
+        profile.dump_stats(os.path.join(directory, f'{name}.prof'))
+        queries.write(
+            os.path.join(directory, f'{name}.sql'),
+            f'{request.method} {request.get_full_path()} -> {response.status_code} '
+            f'in {elapsed * 1000:.2f} ms')
+
+        response['X-Profile-Id'] = name
+        return response
@@ -0,0 +1,262 @@
+"""
+Read replica routing.
+
+REPLICAS['ALIASES'] names databases in DATABASES that are copies of
+"default". ReplicaMiddleware marks GET, HEAD and OPTIONS requests as
+read-only, and ReplicaRouter sends their reads to a random healthy replica.
+Everything else goes to the primary: writes, every query of other methods,
+queries inside a transaction, queries outside a request and the loads of
+the object caches, so an invalidated entry is never refilled from a replica
+that has not seen the change yet.
+
+Reads stick to the primary for STICKY_SECONDS after a user writes, so
+users read their own writes. The pin is kept under the user id in the
+REPLICAS['CACHE'] cache and checked when the request is authenticated. The
+cache must be shared by every worker, which is checked at startup unless
+SINGLE_PROCESS says one process serves every request. Anonymous requests
+are not pinned: behind a proxy every client has the proxy's address.
+
+Lag is measured with a Heartbeat row the primary rewrites every few seconds
+(`manage.py sync_replicas --heartbeat-only --interval 1`): a replica lags by
+how much older its copy of the row is. Every LAG_CHECK_INTERVAL seconds each
+process reads the row from the primary and every replica, and skips replicas
+more than MAX_LAG seconds behind or not answering; with none left, reads
+fall back to the primary.
+"""
+
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils import timezone
+
+
+DEFAULTS = {
+    'ALIASES': [],
+    'STICKY_SECONDS': 5,
+    'MAX_LAG': 5,
+    'LAG_CHECK_INTERVAL': 1,
+    'CACHE': 'default',
+    'SINGLE_PROCESS': False,
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('replica_state', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'REPLICAS', {}).get(name, DEFAULTS[name])
+
+
+class RequestState:
+    """
+    Whether the reads of the current request must go to the primary, and
+    whether it wrote anything.
+    """
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+@contextmanager
+def use_primary():
+    """
+    Send the reads of the block to the primary.
+    """
+    state = _state.get()
+    if state is None or state.pinned:
+        yield
+        return
+    state.pinned = True
+    try:
+        yield
+    finally:
+        # a write in the block keeps the rest of the request on the primary
+        state.pinned = state.wrote
+
+
+def _pin_key(user_id):
+    return f'replicas:pin:user:{user_id}'
+
+
+def pin(user_id):
+    """
+    Send the reads of this user to the primary for STICKY_SECONDS.
+    """
+    caches[get_setting('CACHE')].set(_pin_key(user_id), True, get_setting('STICKY_SECONDS'))
+
+
+def is_pinned(user_id):
+    return bool(caches[get_setting('CACHE')].get(_pin_key(user_id)))
+
+
+def check_cache():
+    """
+    Raise ImproperlyConfigured unless the pins are kept where every worker
+    sees them.
+    """
+    alias = get_setting('CACHE')
+    backend = caches[alias]
+    if isinstance(backend, DummyCache) or (
+            isinstance(backend, LocMemCache) and not get_setting('SINGLE_PROCESS')):
+        raise ImproperlyConfigured(
+            f"REPLICAS['CACHE'] {alias!r} is not shared by the worker processes, so "
+            f"users would not read their own writes; name a shared cache such as "
+            f"redis, or set REPLICAS['SINGLE_PROCESS'] when one process serves "
+            f"every request")
+
+
+def authenticated(user):
+    """
+    Called once a request is authenticated: pin its reads to the primary if
+    the user wrote recently.
+    """
+    state = _state.get()
+    if state is not None and not state.pinned and is_pinned(user.pk):
+        state.pinned = True
+
+
+def write_heartbeat():
+    from .models import Heartbeat
+
+    # a plain UPDATE, not update_or_create: on SQLite a transaction that
+    # reads before it writes fails at once when another writer holds the lock
+    heartbeats = Heartbeat.objects.using(DEFAULT_DB_ALIAS)
+    now = timezone.now()
+    if not heartbeats.filter(pk=1).update(date_written=now):
+        heartbeats.create(pk=1, date_written=now)
+
+
+def read_heartbeat(alias):
+    from .models import Heartbeat
+
+    return (Heartbeat.objects.using(alias).filter(pk=1)
+            .values_list('date_written', flat=True).first())
+
+
+def replica_lag(primary, replica):
+    """
+    Seconds replica is behind, from the heartbeat each has: 0 while the
+    primary has none, infinite when only the replica has none.
+    """
+    if primary is None:
+        return 0.0
+    if replica is None:
+        return math.inf
+    return max((primary - replica).total_seconds(), 0.0)
+
+
+class LagMonitor:
+    """
+    The lag of every replica, measured at most every LAG_CHECK_INTERVAL
+    seconds.
+    """
+
+    def __init__(self):
+        self.lags = {}
+        self.checked = None
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.lags = {}
+            self.checked = None
+
+    def healthy(self, aliases):
+        now = time.monotonic()
+        if self.checked is None or now - self.checked >= get_setting('LAG_CHECK_INTERVAL'):
+            # one thread measures, the others keep using the last result
+            if self.lock.acquire(blocking=self.checked is None):
+                try:
+                    self.lags = self.measure(aliases)
+                    self.checked = time.monotonic()
+                finally:
+                    self.lock.release()
+        max_lag = get_setting('MAX_LAG')
+        return [alias for alias in aliases if self.lags.get(alias, math.inf) <= max_lag]
+
+    def measure(self, aliases):
+        try:
+            primary = read_heartbeat(DEFAULT_DB_ALIAS)
+        except DatabaseError:
+            primary = None
+        lags = {}
+        for alias in aliases:
+            try:
+                lags[alias] = replica_lag(primary, read_heartbeat(alias))
+            except DatabaseError:
+                lags[alias] = math.inf
+        return lags
+
+
+monitor = LagMonitor()
+
+
+class ReplicaRouter:
+    """
+    Send the reads of read-only requests to the replicas, see the module
+    docstring.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        healthy = monitor.healthy(get_setting('ALIASES'))
+        return random.choice(healthy) if healthy else None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # later reads of the request see the write
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *get_setting('ALIASES')}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the primary
+        if db in get_setting('ALIASES'):
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Let the reads of read-only requests go to the replicas and pin users
+    that write to the primary, see the module docstring.
+    """
+
+    def __init__(self, get_response):
+        if not get_setting('ALIASES'):
+            raise MiddlewareNotUsed()
+        check_cache()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RequestState(pinned=request.method not in SAFE_METHODS)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        user = getattr(request, 'user', None)
+        if state.wrote and user is not None and user.is_authenticated:
+            pin(user.pk)
+        return response
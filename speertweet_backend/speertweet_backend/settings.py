@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import CONNECTION_SETTINGS, check_profile
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -42,11 +45,16 @@ INSTALLED_APPS = [
     'rest_framework',
     'django_nose',
 
+    'speertweet_backend',
     'users',
     'tweets',
 ]
 
 MIDDLEWARE = [
+    "speertweet_backend.metrics.MetricsMiddleware",
+    "speertweet_backend.profiling.ProfilerMiddleware",
+    "speertweet_backend.slowqueries.SlowQueryMiddleware",
+    "speertweet_backend.routers.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -56,7 +64,11 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
-ROOT_URLCONF = "speertweet_backend.urls"
+# ASYNC_VIEWS=1, the default of the ASGI application, serves the read
+# endpoints with async views, see speertweet_backend.async_views
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "0") == "1"
+
+ROOT_URLCONF = "speertweet_backend.asgi_urls" if ASYNC_VIEWS else "speertweet_backend.urls"
 
 TEMPLATES = [
     {
@@ -80,13 +92,41 @@ WSGI_APPLICATION = "speertweet_backend.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Performance profile of the database connections (see
+# speertweet_backend.database): "default" keeps SQLite's defaults,
+# "production" turns on WAL, tuned pragmas and persistent connections.
+DATABASE_PROFILE = check_profile(os.environ.get("DATABASE_PROFILE", "default"))
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        **CONNECTION_SETTINGS[DATABASE_PROFILE],
     }
 }
 
+# DATABASE_REPLICAS=N adds N read replicas, local SQLite copies of the
+# primary kept up to date by `manage.py sync_replicas --interval 2`
+for i in range(1, int(os.environ.get("DATABASE_REPLICAS", 0)) + 1):
+    DATABASES[f"replica{i}"] = {
+        **DATABASES["default"],
+        "NAME": BASE_DIR / f"db-replica{i}.sqlite3",
+        "TEST": {"MIRROR": "default"},
+    }
+
+# DATABASE_SHARDS=N spreads tweets by author over N local SQLite files, see
+# tweets.shards, moved into place with `manage.py rebalance_shards`
+for i in range(1, int(os.environ.get("DATABASE_SHARDS", 0)) + 1):
+    DATABASES[f"shard{i}"] = {
+        **DATABASES["default"],
+        "NAME": BASE_DIR / f"db-shard{i}.sqlite3",
+    }
+
+DATABASE_ROUTERS = [
+    "tweets.shards.ShardRouter",
+    "speertweet_backend.routers.ReplicaRouter",
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -131,9 +171,9 @@ LOGIN_REDIRECT_URL = '/'
 # Rest Config
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
+        'speertweet_backend.authentication.JWTAuthentication',
+        'speertweet_backend.authentication.SessionAuthentication',
+        'speertweet_backend.authentication.BasicAuthentication',
     ],
 }
 if not DEBUG:
@@ -149,6 +189,100 @@ SIMPLE_JWT = {
 }
 
 
+# Like counter write-behind buffer (see tweets.counters)
+LIKE_BUFFER = {
+    'ENABLED': False,
+    'FLUSH_INTERVAL': 1.0,  # seconds between the first buffered like and a flush
+    'MAX_PENDING': 1000,  # flush once this many tweets have buffered likes
+}
+
+
+# Home timeline fan out (see tweets.timeline)
+TIMELINE = {
+    'FANOUT_LIMIT': 10000,  # authors with this many followers are merged on read
+    'BACKFILL': 50,  # tweets copied into a timeline on follow
+    'BATCH_SIZE': 1000,
+}
+
+# Trending tweets (see tweets.trending)
+TRENDING = {
+    'WINDOW': 2 * 24 * 60 * 60,  # seconds, only tweets this recent trend
+    'SIZE': 50,
+    'CACHE_TTL': 30,  # seconds the top list is cached
+    'BATCH_SIZE': 1000,  # tweets rescored per query by rollup_trending
+}
+
+# Tweet and user detail caches (see speertweet_backend.objectcache)
+OBJECT_CACHE = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 10000,  # per cache, in each process
+    'TTL': 300,
+    'NEGATIVE_TTL': 5,  # how long a 404 is remembered
+    'SHARED_CACHE': None,  # alias in CACHES shared by every worker, e.g. redis
+    # without SHARED_CACHE the caches are only used when a single process
+    # serves every request, as invalidations do not reach other workers
+    'SINGLE_PROCESS': False,
+}
+
+# Per request timings, Server-Timing and /metrics (see speertweet_backend.metrics)
+METRICS = {
+    'ENABLED': False,
+    'SERVER_TIMING': True,  # send each response's timings in a Server-Timing header
+    'MULTIPROCESS_DIR': None,  # directory where every worker saves its histograms
+    'FLUSH_INTERVAL': 5,  # seconds between saves to MULTIPROCESS_DIR
+}
+
+# Profiles of single requests (see speertweet_backend.profiling)
+PROFILER = {
+    'ENABLED': False,
+    'DIRECTORY': BASE_DIR / 'profiles',  # where .prof and .sql files are written
+    'HEADER': 'X-Profile',  # request header carrying a `manage.py profile_token`
+    'TOKEN_MAX_AGE': 60 * 60,  # seconds a token stays valid
+    'SAMPLE_RATE': 0.0,  # fraction of all requests profiled
+}
+
+# Slow query log with query plans (see speertweet_backend.slowqueries)
+SLOW_QUERIES = {
+    'ENABLED': False,
+    'THRESHOLD': 0.1,  # seconds, slower queries are logged
+    'EXPLAIN': True,  # log the plan of slow queries
+    'FULL_SCAN_TABLES': ('tweets_tweet', 'users_user'),  # flag plans reading these in full
+}
+
+# Read replicas (see speertweet_backend.routers)
+REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias.startswith('replica')],
+    'STICKY_SECONDS': 5,  # reads of a client go to the primary this long after it writes
+    'MAX_LAG': 5,  # seconds, replicas further behind are skipped
+    'LAG_CHECK_INTERVAL': 1,  # seconds between lag checks in each process
+    'CACHE': 'default',  # where pins are kept, must be shared by all workers, e.g. redis
+    # allows a process memory CACHE: runserver, which these settings are
+    # for, serves every request from one process
+    'SINGLE_PROCESS': DEBUG,
+}
+
+SHARDS = {
+    # databases tweets are spread over by author, empty keeps them all in default;
+    # only append to the list, then run `manage.py rebalance_shards`
+    'ALIASES': [alias for alias in DATABASES if alias.startswith('shard')],
+}
+
+# Tweet change log read by /tweets/changes/ (see tweets.changes)
+CHANGES = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 1000,
+    'RETENTION_DAYS': 30,  # `manage.py compact_changes` expires older tokens
+}
+
+# Live tweet stream at /tweets/stream/, served under ASGI (see tweets.stream)
+STREAM = {
+    'HISTORY': 1000,  # events kept for clients resuming with Last-Event-ID
+    'QUEUE_SIZE': 64,  # events queued for one subscriber before it is dropped
+    'HEARTBEAT': 15,  # seconds between keep-alive comments
+    'RETRY': 2000,  # ms, how long EventSource waits before reconnecting
+}
+
+
 # NOSE config
 TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 NOSE_ARGS = [
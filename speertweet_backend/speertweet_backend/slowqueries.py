@@ -0,0 +1,173 @@
+"""
+Slow query log with query plans.
+
+SlowQueryLog is a database execute wrapper. Every query slower than
+SLOW_QUERIES['THRESHOLD'] seconds is logged as a warning to the
+speertweet_backend.slowqueries logger together with its plan, from EXPLAIN
+QUERY PLAN on SQLite and EXPLAIN on PostgreSQL. Plans that read one of
+FULL_SCAN_TABLES in full, without an index, are flagged.
+
+SlowQueryMiddleware wraps every request in it when SLOW_QUERIES['ENABLED']
+is on. Tests use assert_no_full_scans() to fail on any full scan, whatever
+the query took.
+
+A scan through an index, e.g. `ORDER BY date_created LIMIT 20` walking the
+date index, is not a full scan: it stops after the rows needed.
+"""
+
+import logging
+import re
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+DEFAULTS = {
+    'ENABLED': False,
+    'THRESHOLD': 0.1,
+    'EXPLAIN': True,
+    'FULL_SCAN_TABLES': ('tweets_tweet', 'users_user'),
+}
+
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')
+
+# "tweets_tweet" U0 -> U0 is an alias of tweets_tweet
+ALIAS_RE = re.compile(r'"(\w+)"\s+(?:AS\s+)?"?(\w+)"?', re.IGNORECASE)
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?$')
+POSTGRESQL_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+
+logger = logging.getLogger(__name__)
+
+
+def get_setting(name):
+    return getattr(settings, 'SLOW_QUERIES', {}).get(name, DEFAULTS[name])
+
+
+def explain(connection, sql, params):
+    """
+    Return the plan of a query as a list of lines.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            # (id, parent, notused, detail), indented by depth
+            depth = {0: -1}
+            lines = []
+            for node, parent, _, detail in cursor.fetchall():
+                depth[node] = depth.get(parent, -1) + 1
+                lines.append('  ' * depth[node] + detail)
+            return lines
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def full_scans(vendor, sql, plan, tables):
+    """
+    Return the tables of tables that plan reads in full.
+    """
+    aliases = {alias: table for table, alias in ALIAS_RE.findall(sql)}
+    scanned = set()
+    for line in plan:
+        line = line.strip()
+        if vendor == 'sqlite':
+            match = SQLITE_SCAN_RE.match(line)
+            names = match.groups() if match else ()
+        else:
+            names = POSTGRESQL_SCAN_RE.findall(line)
+        for name in names:
+            if name:
+                scanned.add(aliases.get(name, name))
+    return sorted(scanned & set(tables))
+
+
+class SlowQueryLog:
+    """
+    Execute wrapper logging queries slower than threshold with their plan.
+    With on_full_scan, that function is called with (sql, plan, tables) for
+    every query that scans one of FULL_SCAN_TABLES in full.
+    """
+
+    def __init__(self, threshold=None, on_full_scan=None):
+        self.threshold = get_setting('THRESHOLD') if threshold is None else threshold
+        self.explain = get_setting('EXPLAIN')
+        self.tables = get_setting('FULL_SCAN_TABLES')
+        self.on_full_scan = on_full_scan
+        self.explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # the EXPLAIN itself runs through this wrapper too
+        if self.explaining:
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed = time.perf_counter() - start
+
+        if elapsed >= self.threshold:
+            self.report(context['connection'], sql, params, many, elapsed)
+        return result
+
+    def report(self, connection, sql, params, many, elapsed):
+        plan, scans = [], []
+        if self.explain and not many and sql.lstrip().upper().startswith(EXPLAINABLE):
+            self.explaining = True
+            try:
+                plan = explain(connection, sql, params)
+            except Exception as e:
+                plan = [f'EXPLAIN failed: {e}']
+            finally:
+                self.explaining = False
+            scans = full_scans(connection.vendor, sql, plan, self.tables)
+
+        if scans and self.on_full_scan is not None:
+            self.on_full_scan(sql, plan, scans)
+        if elapsed >= get_setting('THRESHOLD'):
+            logger.warning(
+                'Slow query (%.1f ms)%s: %s\n%s', elapsed * 1000,
+                f', FULL SCAN of {", ".join(scans)}' if scans else '',
+                sql, '\n'.join(plan))
+
+
+@contextmanager
+def wrap_connections(wrapper):
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield wrapper
+
+
+@contextmanager
+def assert_no_full_scans(test_case, tables=None):
+    """
+    Explain every query run in the block and fail test_case if any scans one
+    of tables (FULL_SCAN_TABLES by default) in full.
+    """
+    found = []
+    log = SlowQueryLog(threshold=0, on_full_scan=lambda *scan: found.append(scan))
+    if tables is not None:
+        log.tables = tables
+    log.explain = True
+    with wrap_connections(log):
+        yield
+    if found:
+        test_case.fail('\n\n'.join(
+            f'full scan of {", ".join(scans)}: {sql}\n' + '\n'.join(plan)
+            for sql, plan, scans in found))
+
+
+class SlowQueryMiddleware:
+    """
+    Log the slow queries of every request, see the module docstring.
+    """
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with wrap_connections(SlowQueryLog()):
+            return self.get_response(request)
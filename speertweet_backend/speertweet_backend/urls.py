@@ -17,10 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('users.urls')),
     path('tweets/', include('tweets.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 handler500 = 'rest_framework.exceptions.server_error'
@@ -7,3 +7,7 @@ from . import models
 class TweetAdmin(admin.ModelAdmin):
     pass
 
+
+@admin.register(models.Like)
+class LikeAdmin(admin.ModelAdmin):
+    pass
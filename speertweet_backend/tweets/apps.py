@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class TweetsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "tweets"
+
+    def ready(self):
+        from . import receivers  # noqa: F401
+        from .shards import disable_foreign_keys
+
+        connection_created.connect(disable_foreign_keys, dispatch_uid='disable_shard_foreign_keys')
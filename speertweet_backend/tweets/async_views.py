@@ -0,0 +1,98 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from rest_framework.exceptions import NotFound
+
+from speertweet_backend.async_views import AsyncReadView
+from speertweet_backend.metrics import timer
+
+from . import shards
+from .caches import tweet_cache
+from .conditional import not_modified, set_validators, tweet_etag
+from .counters import get_like_buffer
+from .models import Tweet
+from .pagination import KeysetPagination
+from .serializers import TweetSerializer
+from .views import TweetDetailAPIView
+
+
+class AsyncTweetListView(AsyncReadView):
+    """
+    Base of the async tweet lists, answered like ConditionalListMixin: one
+    keyset page, 304 when the client's copy is current.
+    """
+    pagination_class = KeysetPagination
+
+    async def get_queryset(self, request, **kwargs):
+        raise NotImplementedError
+
+    async def read(self, request, **kwargs):
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(
+            await self.get_queryset(request, **kwargs), request)
+        if shards.enabled():
+            await sync_to_async(shards.attach_authors)(page)
+
+        etag = tweet_etag(page, paginator.has_next, paginator.has_previous)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        with timer('serialize'):
+            data = TweetSerializer(page, many=True).data
+            response = self.render(paginator.get_paginated_response(data).data)
+        return set_validators(response, etag)
+
+
+class AsyncRecentTweetsView(AsyncTweetListView):
+    """
+    RecentTweetsAPIView served in the event loop.
+    """
+
+    async def get_queryset(self, request, **kwargs):
+        if shards.enabled():
+            return shards.all_feeds()
+        return Tweet.objects.feed()
+
+
+class AsyncUserTweetListView(AsyncTweetListView):
+    """
+    UserTweetListAPIView served in the event loop.
+    """
+
+    async def get_queryset(self, request, uuid):
+        if not shards.enabled():
+            return Tweet.objects.filter(author__uuid=uuid).feed()
+        author_id = await (get_user_model().objects.filter(uuid=uuid)
+                           .values_list('pk', flat=True).afirst())
+        return shards.feed(shards.tweets(author_id).filter(author_id=author_id))
+
+
+class AsyncTweetDetailView(AsyncReadView):
+    """
+    TweetDetailAPIView served in the event loop for reads, through the tweet
+    cache. Edits and deletes go to TweetDetailAPIView.
+    """
+    http_method_names = ['get', 'head', 'options', 'put', 'patch', 'delete']
+    # a staticmethod, so the view function is not bound to the instance
+    sync_view = staticmethod(TweetDetailAPIView.as_view())
+
+    async def read(self, request, uuid):
+        row = await tweet_cache.aget(uuid)
+        if row is None:
+            raise NotFound()
+
+        etag = tweet_etag([row])
+        # buffered likes are not in date_modified yet
+        buffer = get_like_buffer()
+        if buffer is None or not buffer.pending(row['uuid']):
+            last_modified = row['date_modified']
+        else:
+            last_modified = None
+
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        with timer('serialize'):
+            response = self.render(TweetSerializer().row_to_representation(row))
+        return set_validators(response, etag, last_modified)
@@ -0,0 +1,27 @@
+from speertweet_backend.objectcache import ObjectCache
+
+from . import shards
+from .models import Tweet
+
+
+def load_tweet(uuid):
+    """
+    Return the TweetQuerySet.feed() row of a tweet, or None.
+    """
+    if shards.enabled():
+        return shards.find(uuid)
+    return Tweet.objects.filter(uuid=uuid).feed().first()
+
+
+def load_tweets(uuids):
+    """
+    Return {uuid: TweetQuerySet.feed() row} of the tweets that exist, fetched
+    with one IN query.
+    """
+    if shards.enabled():
+        return shards.find_many(uuids)
+    return {str(row['uuid']): row for row in Tweet.objects.filter(uuid__in=uuids).feed()}
+
+
+# feed rows by tweet uuid, kept fresh by tweets.receivers
+tweet_cache = ObjectCache('tweet', load_tweet, load_tweets)
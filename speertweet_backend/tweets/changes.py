@@ -0,0 +1,193 @@
+"""
+Append-only change log of tweets, read by GET /tweets/changes/.
+
+Every create, edit, like count change and delete of a tweet appends a
+TweetChange, so a client keeping an offline copy syncs in the number of
+changes instead of downloading every tweet again. Deletes are recorded by a
+post_delete receiver, so tweets deleted with their author or from the admin
+leave a tombstone too; a rebalance only moves tweets and records none. seq is the table's integer
+primary key. SQLite runs one write transaction at a time, so entries are
+numbered in commit order; PostgreSQL hands out ids before the commit, so
+there record() locks the table until its transaction commits, serializing
+the writers that log changes. Compaction always keeps the newest entry so a
+number is never handed out twice.
+
+A client passes the seq of the last change it applied as `since` and gets
+the changes after it, oldest first. A delete removes the tweet; any other
+change carries the tweet as it is now and replaces the client's copy, so a
+tweet changed several times within a page is sent once. A `since` older
+than the oldest entry kept has missed compacted changes and is answered
+with 410; the client then downloads the tweets again, starting from the
+token of a request without `since`.
+
+`manage.py compact_changes`, run on a schedule, deletes entries superseded
+by a later change to the same tweet, which no client needs, and entries
+older than CHANGES['RETENTION_DAYS'], which expires older tokens.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .caches import tweet_cache
+from .models import TweetChange
+from .serializers import TweetSerializer
+
+
+DEFAULTS = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 1000,
+    'RETENTION_DAYS': 30,  # entries kept at least this long, and with them tokens
+}
+
+
+_moving = ContextVar('tweets_moving', default=False)
+
+
+def get_setting(name):
+    return getattr(settings, 'CHANGES', {}).get(name, DEFAULTS[name])
+
+
+class ChangesExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Changes since this token were compacted, download the tweets again.'
+    default_code = 'expired'
+
+
+def record(kind, tweets):
+    """
+    Append a change of kind for every tweet, Tweet instances or anything
+    else with uuid and author_id.
+    """
+    entries = [
+        TweetChange(tweet_uuid=tweet.uuid, author_id=tweet.author_id, kind=kind)
+        for tweet in tweets
+    ]
+    if not entries:
+        return
+    db = router.db_for_write(TweetChange)
+    with transaction.atomic(using=db):
+        connection = connections[db]
+        if connection.vendor == 'postgresql':
+            # held until the commit: a later seq is never visible first, which
+            # would let a client's token skip the earlier one
+            with connection.cursor() as cursor:
+                cursor.execute('LOCK TABLE {} IN EXCLUSIVE MODE'.format(
+                    connection.ops.quote_name(TweetChange._meta.db_table)))
+        TweetChange.objects.using(db).bulk_create(entries)
+
+
+@contextmanager
+def moving():
+    """
+    Record no deletes in the block, which deletes tweets already copied to
+    another database, see `manage.py rebalance_shards`.
+    """
+    token = _moving.set(True)
+    try:
+        yield
+    finally:
+        _moving.reset(token)
+
+
+def is_moving():
+    return _moving.get()
+
+
+def bounds():
+    """
+    Return the seq of the oldest and the newest entry, None when the log is
+    empty.
+    """
+    result = TweetChange.objects.aggregate(first=Min('seq'), last=Max('seq'))
+    return result['first'], result['last']
+
+
+def changes_since(since, author_id=None, page_size=None):
+    """
+    Return the changes after the token since, at most page_size of them,
+    as the changes feed renders them. Without since only the current token
+    is returned.
+    """
+    first, last = bounds()
+    last = last or 0
+    if since is None:
+        return {'changes': [], 'next': str(last), 'has_more': False}
+    # compacted, or from another database
+    if since > last or (first is not None and since < first - 1):
+        raise ChangesExpired()
+
+    page_size = page_size or get_setting('PAGE_SIZE')
+    entries = TweetChange.objects.filter(seq__gt=since).order_by('seq')
+    if author_id is not None:
+        entries = entries.filter(author_id=author_id)
+    entries = list(entries.values('seq', 'tweet_uuid', 'kind')[:page_size + 1])
+    has_more = len(entries) > page_size
+    entries = entries[:page_size]
+
+    # the last change to each tweet, in seq order
+    latest = {entry['tweet_uuid']: entry for entry in entries}
+    entries = sorted(latest.values(), key=lambda entry: entry['seq'])
+    rows = tweet_cache.get_many(
+        entry['tweet_uuid'] for entry in entries if entry['kind'] != TweetChange.DELETE)
+
+    serializer = TweetSerializer()
+    changes = []
+    for entry in entries:
+        row = rows.get(str(entry['tweet_uuid']))
+        changes.append({
+            'seq': entry['seq'],
+            # deleted by a change further on
+            'type': entry['kind'] if row is not None else TweetChange.DELETE,
+            'uuid': str(entry['tweet_uuid']),
+            'tweet': serializer.row_to_representation(row) if row is not None else None,
+        })
+
+    if has_more:
+        next_token = entries[-1]['seq']
+    else:
+        # a page of one author's changes still ends at the newest entry
+        next_token = max([last, *(entry['seq'] for entry in entries)])
+    return {'changes': changes, 'next': str(next_token), 'has_more': has_more}
+
+
+def compact(retention_days=None, batch_size=5000):
+    """
+    Delete superseded entries and entries older than retention_days,
+    keeping the oldest and the newest entry. Returns the number of each
+    deleted.
+    """
+    if retention_days is None:
+        retention_days = get_setting('RETENTION_DAYS')
+    first, last = bounds()
+    if first is None:
+        return 0, 0
+
+    later = TweetChange.objects.filter(tweet_uuid=OuterRef('tweet_uuid'), seq__gt=OuterRef('seq'))
+    superseded = 0
+    # the oldest entry marks how far tokens are valid, so it is kept
+    start = first
+    while start < last:
+        end = start + batch_size
+        with transaction.atomic():
+            superseded += TweetChange.objects.filter(
+                Exists(later), seq__gt=start, seq__lte=end).delete()[0]
+        start = end
+
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    expired = 0
+    while True:
+        seqs = list(TweetChange.objects.filter(date_created__lt=cutoff, seq__lt=last)
+                    .order_by('seq').values_list('seq', flat=True)[:batch_size])
+        if not seqs:
+            break
+        with transaction.atomic():
+            expired += TweetChange.objects.filter(seq__lte=seqs[-1]).delete()[0]
+    return superseded, expired
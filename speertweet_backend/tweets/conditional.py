@@ -0,0 +1,78 @@
+"""
+Conditional GET for tweet responses.
+
+Validators are computed from the tweet rows a response is rendered from, not
+from the rendered body, so a request whose If-None-Match still matches is
+answered with 304 Not Modified without serializing anything.
+"""
+
+import hashlib
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from . import shards
+from .counters import get_like_buffer
+
+
+def tweet_etag(rows, *extra):
+    """
+    Return a strong ETag for TweetQuerySet.feed() rows. Every field of the
+    rendered tweet is covered: the text through date_modified, which moves
+    with each edit, and the like count and author username directly. Any extra
+    values, e.g. whether there is a next page, are hashed in too.
+    """
+    buffer = get_like_buffer()
+    digest = hashlib.md5(usedforsecurity=False)
+    for value in extra:
+        digest.update(f'{value}\n'.encode())
+    for row in rows:
+        likes = row['likes'] + (buffer.pending(row['uuid']) if buffer else 0)
+        digest.update(
+            f"{row['id']}:{row['date_modified'].isoformat()}:{likes}:"
+            f"{row['author__username']}\n".encode())
+    return quote_etag(digest.hexdigest())
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Return the 304 (or 412) response the request preconditions call for, or
+    None when the full response has to be sent.
+    """
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+    return response
+
+
+class ConditionalListMixin:
+    """
+    List view mixin answering a GET of an unchanged page with 304. The page is
+    fetched as usual, its ETag is taken from the rows and the page is only
+    serialized when the client's copy is out of date. Pages carry no
+    Last-Modified: deleting a tweet changes a page without moving any
+    date_modified forward.
+    """
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        # rows read from a shard come without their author
+        shards.attach_authors(page)
+        etag = tweet_etag(page, self.paginator.has_next, self.paginator.has_previous)
+
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        serializer = self.get_serializer(page, many=True)
+        return set_validators(self.get_paginated_response(serializer.data), etag)
@@ -0,0 +1,186 @@
+import atexit
+import threading
+from collections import defaultdict, namedtuple
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import shards
+from .scores import score_after
+from .signals import likes_changed
+
+
+# what a like count change and likes_changed carry of the tweet, db being
+# its shard as shards.tweet_db returns it and id its primary key there
+LikedTweet = namedtuple('LikedTweet', ['db', 'id', 'uuid', 'author_id'])
+
+
+def liked_tweet(tweet):
+    return LikedTweet(shards.tweet_db(tweet), tweet.pk, tweet.uuid, tweet.author_id)
+
+
+class LikeCounterBuffer:
+    """
+    Write-behind buffer for Tweet.likes. Like deltas are summed in process
+    memory and written in one transaction per flush and database, one UPDATE
+    per distinct delta, so a viral tweet costs one row write per flush instead of one per
+    like. A flush runs once FLUSH_INTERVAL seconds have passed since the first
+    buffered like, once MAX_PENDING tweets are buffered and at interpreter
+    exit. A failed flush puts its deltas back to be retried with the next one.
+
+    The like rows themselves are written synchronously, so counts lost with a
+    crashed process can be rebuilt from them with `manage.py reconcile_likes`.
+    """
+
+    def __init__(self, flush_interval=1.0, max_pending=1000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # deltas by tweet uuid, ids being per shard
+        self._pending = defaultdict(int)
+        self._flushing = {}
+        # LikedTweet of each tweet in _pending
+        self._tweets = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def add(self, tweet, delta):
+        """
+        Buffer a like count change of the LikedTweet.
+        """
+        key = str(tweet.uuid)
+        with self._lock:
+            self._pending[key] += delta
+            self._tweets[key] = tweet
+            full = len(self._pending) >= self.max_pending
+            if not full and self._timer is None and self.flush_interval:
+                self._timer = threading.Timer(
+                    self.flush_interval, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if full:
+            self.flush()
+
+    def pending(self, uuid):
+        """
+        Return the like delta for the tweet that is not yet in the database.
+        """
+        key = str(uuid)
+        with self._lock:
+            return self._pending.get(key, 0) + self._flushing.get(key, 0)
+
+    def flush(self):
+        """
+        Write all buffered deltas to the database. Returns the number of tweets
+        updated.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                batch = {k: v for k, v in self._pending.items() if v}
+                tweets = self._tweets
+                self._pending = defaultdict(int)
+                self._tweets = {}
+                self._flushing = batch
+
+            try:
+                self._write(batch, tweets)
+            except Exception:
+                with self._lock:
+                    # the part of the batch whose database did not commit
+                    failed = self._flushing
+                    self._flushing = {}
+                    for key, delta in failed.items():
+                        self._pending[key] += delta
+                        self._tweets.setdefault(key, tweets[key])
+                self._send([tweets[key] for key in batch if key not in failed])
+                raise
+
+        self._send([tweets[key] for key in batch])
+        return len(batch)
+
+    def _send(self, tweets):
+        if tweets:
+            likes_changed.send(sender=apps.get_model('tweets', 'Tweet'), tweets=tweets)
+
+    def _write(self, batch, tweets):
+        """
+        Write the batch, one transaction per database, and drop each part of
+        _flushing as it commits.
+        """
+        Tweet = apps.get_model('tweets', 'Tweet')
+
+        by_db = defaultdict(lambda: defaultdict(list))
+        for key, delta in batch.items():
+            tweet = tweets[key]
+            by_db[tweet.db][delta].append(tweet.id)
+
+        now = timezone.now()
+        for db, by_delta in by_db.items():
+            locked = False
+            try:
+                with transaction.atomic(using=db):
+                    for delta, tweet_ids in by_delta.items():
+                        Tweet.objects.using(db).filter(pk__in=tweet_ids).update(
+                            likes=F('likes') + delta,
+                            score=score_after(F('likes') + delta),
+                            date_modified=now)
+                    # held over the commit, so pending() never counts the
+                    # batch both in the rows and in _flushing
+                    self._lock.acquire()
+                    locked = True
+                self._flushing = {key: delta for key, delta in self._flushing.items()
+                                  if tweets[key].db != db}
+            finally:
+                if locked:
+                    self._lock.release()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            # the timer thread owns its own connections, one per database a
+            # flush wrote to
+            connections.close_all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_like_buffer():
+    """
+    Return the process wide LikeCounterBuffer, or None when LIKE_BUFFER is not
+    enabled in settings.
+    """
+    global _buffer
+
+    config = getattr(settings, 'LIKE_BUFFER', {})
+    if not config.get('ENABLED'):
+        return None
+
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = LikeCounterBuffer(
+                    flush_interval=config.get('FLUSH_INTERVAL', 1.0),
+                    max_pending=config.get('MAX_PENDING', 1000),
+                )
+    return _buffer
+
+
+@atexit.register
+def _flush_at_exit():
+    if _buffer is not None:
+        _buffer.flush()
+
+
+def pending_likes(uuid):
+    buffer = get_like_buffer()
+    return buffer.pending(uuid) if buffer is not None else 0
@@ -0,0 +1,72 @@
+"""
+Streaming export of tweets as NDJSON or CSV.
+
+Tweets are read with QuerySet.iterator(), one chunk of rows at a time, and
+every chunk is formatted and handed on before the next is fetched, so memory
+use does not grow with the number of tweets exported.
+"""
+
+import csv
+import io
+import json
+from itertools import islice
+
+from django.utils.text import compress_sequence
+
+from . import shards
+from .serializers import TweetSerializer
+
+
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+def export_rows(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of up to chunk_size tweets of the queryset, oldest first, in
+    the format of the tweet API.
+    """
+    serializer = TweetSerializer()
+    rows = shards.feed(queryset.order_by('date_created', 'id')).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        shards.attach_authors(chunk)
+        yield [serializer.row_to_representation(row) for row in chunk]
+
+
+def ndjson_lines(chunks):
+    for tweets in chunks:
+        yield ''.join(
+            json.dumps(tweet, ensure_ascii=False) + '\n' for tweet in tweets
+        ).encode()
+
+
+def csv_lines(chunks):
+    fields = TweetSerializer.Meta.fields
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    yield buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+    for tweets in chunks:
+        writer.writerows(tweets)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def export(queryset, output='ndjson', gzip=False, chunk_size=CHUNK_SIZE):
+    """
+    Return an iterator of the encoded export, gzip compressed as it streams
+    when gzip is True.
+    """
+    chunks = export_rows(queryset, chunk_size)
+    lines = csv_lines(chunks) if output == 'csv' else ndjson_lines(chunks)
+    return compress_sequence(lines) if gzip else lines
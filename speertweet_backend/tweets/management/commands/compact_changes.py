@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from tweets import changes
+
+
+class Command(BaseCommand):
+    help = (
+        'Compact the tweet change log: delete changes superseded by a later '
+        'change to the same tweet, and changes older than --days, after which '
+        'clients holding older tokens download the tweets again. Meant to run '
+        'periodically, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=None,
+                            help="defaults to CHANGES['RETENTION_DAYS']")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        superseded, expired = changes.compact(options['days'], options['batch_size'])
+        self.stdout.write(f'Deleted {superseded} superseded and {expired} expired changes')
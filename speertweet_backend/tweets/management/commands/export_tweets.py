@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from tweets import export
+from tweets import shards
+
+
+class Command(BaseCommand):
+    help = (
+        'Export all tweets of a user, oldest first, as NDJSON or CSV. The '
+        'tweets are streamed a chunk at a time, so memory use stays flat '
+        'whatever the size of the account.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--output', choices=list(export.FORMATS), default='ndjson')
+        parser.add_argument('--gzip', action='store_true', help='gzip compress the export')
+        parser.add_argument('--file', help='write to this file instead of stdout')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user named {options["username"]}')
+
+        stream = export.export(
+            shards.tweets(user.pk).filter(author=user), options['output'],
+            options['gzip'], options['chunk_size'])
+
+        if options['file']:
+            with open(options['file'], 'wb') as f:
+                for data in stream:
+                    f.write(data)
+            return
+
+        out = getattr(self.stdout, 'buffer', None)
+        if out is None and options['gzip']:
+            raise CommandError('--gzip needs --file or a binary stdout')
+        for data in stream:
+            if out is not None:
+                out.write(data)
+            else:
+                self.stdout.write(data.decode(), ending='')
+        if out is not None:
+            out.flush()
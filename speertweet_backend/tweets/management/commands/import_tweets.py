@@ -0,0 +1,251 @@
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import timezone as dt_timezone
+from uuid import UUID
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from speertweet_backend.ids import uuid7_from
+from tweets import changes
+from tweets.models import Tweet, TweetChange
+from tweets.scores import hot_score
+
+
+class InvalidRecord(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Import users and tweets from an NDJSON file (.gz too, - for stdin), '
+        'one JSON object per line, read lazily so files larger than memory '
+        'work. Tweet lines are the export_tweets format: text, author '
+        '(username) or author_uuid, and optionally uuid, likes and '
+        'date_created. User lines are {"type": "user", "username": ...} '
+        'with optional uuid, date_joined and password (already hashed). '
+        'Rows are bulk inserted a batch per transaction and existing users '
+        'and tweets are skipped; tweets without a uuid are only recognised '
+        'as existing if they have a date_created. With --checkpoint an '
+        'interrupted import resumes after the last committed batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--checkpoint', help='file recording the progress to resume from')
+
+    def handle(self, *args, **options):
+        self.User = get_user_model()
+        self.authors = {}
+        self.batch_size = options['batch_size']
+        self.checkpoint = options['checkpoint']
+        self.input = options['input']
+        if self.checkpoint and self.input == '-':
+            raise CommandError('stdin can not be resumed, --checkpoint needs a file')
+
+        self.lines = self.skipped = self.existing = self.users = self.tweets = 0
+        offset = self.read_checkpoint()
+        with self.open_input() as f:
+            if offset:
+                f.seek(offset)
+                self.stdout.write(f'Resuming after line {self.lines}')
+            self.run(f)
+
+    def run(self, f):
+        self.started = time.monotonic()
+        self.start_lines = self.lines
+        users, tweets = [], []
+        while True:
+            line = f.readline()
+            if line:
+                self.lines += 1
+                try:
+                    self.parse(line, users, tweets)
+                except InvalidRecord as e:
+                    self.skipped += 1
+                    self.stderr.write(f'line {self.lines}: {e}')
+
+            if not line or len(users) + len(tweets) >= self.batch_size:
+                self.write_batch(users, tweets)
+                self.write_checkpoint(None if self.input == '-' else f.tell())
+                self.report()
+                users, tweets = [], []
+            if not line:
+                break
+
+        self.stdout.write(
+            f'Imported {self.users} users and {self.tweets} tweets, '
+            f'{self.existing} were already there, skipped {self.skipped} invalid lines')
+
+    def parse(self, line, users, tweets):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise InvalidRecord('not JSON')
+        if not isinstance(record, dict):
+            raise InvalidRecord('not a JSON object')
+
+        kind = record.get('type', 'tweet')
+        if kind == 'user':
+            users.append(self.build_user(record))
+        elif kind == 'tweet':
+            tweets.append(self.build_tweet(record))
+        else:
+            raise InvalidRecord(f'unknown type {kind!r}')
+
+    def build_user(self, record):
+        username = record.get('username')
+        if not isinstance(username, str) or not username:
+            raise InvalidRecord('user without a username')
+        user = self.User(
+            username=username,
+            password=record.get('password') or make_password(None),
+            date_joined=self.parse_date(record, 'date_joined'),
+        )
+        if record.get('uuid'):
+            user.uuid = self.parse_uuid(record['uuid'])
+        return user
+
+    def build_tweet(self, record):
+        text = record.get('text')
+        if not isinstance(text, str) or not text:
+            raise InvalidRecord('tweet without text')
+        if len(text) > Tweet._meta.get_field('text').max_length:
+            raise InvalidRecord('tweet text too long')
+
+        if record.get('author_uuid'):
+            author = ('uuid', self.parse_uuid(record['author_uuid']))
+        elif record.get('author'):
+            author = ('username', record['author'])
+        else:
+            raise InvalidRecord('tweet without an author')
+
+        likes = record.get('likes', 0)
+        if not isinstance(likes, int) or likes < 0:
+            raise InvalidRecord('invalid likes')
+        date_created = self.parse_date(record, 'date_created')
+        if record.get('uuid'):
+            uuid = self.parse_uuid(record['uuid'])
+        else:
+            # a dated line imported again gets the same uuid and is skipped
+            uuid = uuid7_from(date_created, f'{author[1]}\n{date_created.isoformat()}\n{text}')
+
+        tweet = Tweet(uuid=uuid, text=text, likes=likes, date_created=date_created,
+                      score=hot_score(likes, date_created))
+        return author, tweet
+
+    def parse_uuid(self, value):
+        try:
+            return UUID(str(value))
+        except ValueError:
+            raise InvalidRecord(f'invalid uuid {value!r}')
+
+    def parse_date(self, record, field):
+        value = record.get(field)
+        if value is None:
+            return timezone.now()
+        date = parse_datetime(value) if isinstance(value, str) else None
+        if date is None:
+            raise InvalidRecord(f'invalid {field} {value!r}')
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date, dt_timezone.utc)
+        return date
+
+    def write_batch(self, users, tweets):
+        with transaction.atomic():
+            if users:
+                new = self.new_rows(self.User, users, ('username', 'uuid'))
+                self.User.objects.bulk_create(new, ignore_conflicts=True)
+                self.users += len(new)
+                self.existing += len(users) - len(new)
+
+            self.resolve_authors(author for author, tweet in tweets)
+            resolved = []
+            for author, tweet in tweets:
+                tweet.author_id = self.authors.get(author)
+                if tweet.author_id is None:
+                    self.skipped += 1
+                    self.stderr.write(f'unknown author {author[1]}')
+                else:
+                    resolved.append(tweet)
+            new = self.new_rows(Tweet, resolved, ('uuid',))
+            Tweet.objects.bulk_create(new, ignore_conflicts=True)
+            changes.record(TweetChange.CREATE, new)
+            self.tweets += len(new)
+            self.existing += len(resolved) - len(new)
+
+    def new_rows(self, model, objs, fields):
+        """
+        Return the objs whose unique fields are not taken, by a row or by an
+        earlier obj of the list.
+        """
+        taken = set()
+        if objs:
+            query = Q()
+            for field in fields:
+                query |= Q(**{f'{field}__in': {getattr(obj, field) for obj in objs}})
+            for row in model.objects.filter(query).values_list(*fields):
+                taken.update(zip(fields, row))
+        new = []
+        for obj in objs:
+            keys = {(field, getattr(obj, field)) for field in fields}
+            if not keys & taken:
+                taken |= keys
+                new.append(obj)
+        return new
+
+    def resolve_authors(self, keys):
+        """
+        Add the ids of authors not seen before to the in memory author map.
+        """
+        missing = {key for key in keys if key not in self.authors}
+        for field in ('username', 'uuid'):
+            values = [value for kind, value in missing if kind == field]
+            if values:
+                users = self.User.objects.filter(**{f'{field}__in': values})
+                for value, pk in users.values_list(field, 'pk'):
+                    self.authors[(field, value)] = pk
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        rate = (self.lines - self.start_lines) / elapsed if elapsed else 0
+        self.stdout.write(f'{self.lines} lines, {rate:.0f} rows/s')
+
+    def open_input(self):
+        if self.input == '-':
+            return open(sys.stdin.fileno(), 'rb', closefd=False)
+        try:
+            if self.input.endswith('.gz'):
+                return gzip.open(self.input, 'rb')
+            return open(self.input, 'rb')
+        except OSError as e:
+            raise CommandError(e)
+
+    def read_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        if state['input'] != os.path.abspath(self.input):
+            raise CommandError(f'{self.checkpoint} is the checkpoint of {state["input"]}')
+        self.lines = state['lines']
+        return state['offset']
+
+    def write_checkpoint(self, offset):
+        if not self.checkpoint:
+            return
+        # replaced in one step, so a crash never leaves half a checkpoint
+        tmp = f'{self.checkpoint}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'input': os.path.abspath(self.input),
+                       'offset': offset, 'lines': self.lines}, f)
+        os.replace(tmp, self.checkpoint)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from speertweet_backend import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        'Print a signed token that makes the profiler middleware profile a '
+        'request sent with it, e.g. curl -H "X-Profile: <token>". Valid for '
+        'PROFILER["TOKEN_MAX_AGE"] seconds.'
+    )
+
+    def handle(self, *args, **options):
+        header = profiling.get_setting('HEADER')
+        self.stdout.write(f'{header}: {profiling.make_token()}')
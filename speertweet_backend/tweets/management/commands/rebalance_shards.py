@@ -0,0 +1,106 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from tweets import changes, shards
+from tweets.models import Like, TimelineEntry, Tweet
+
+
+class Command(BaseCommand):
+    help = (
+        'Move every tweet to the shard of its author, e.g. after appending a '
+        'database to SHARDS["ALIASES"] or turning sharding on, when all '
+        'tweets are still in default. Tweets are copied a batch at a time '
+        'and deleted from their old database once the copy is committed, '
+        'so they can be read throughout; an interrupted run is simply run '
+        'again. The likes and home timeline entries of a tweet are copied '
+        'with it; likes made while their batch is being moved can be lost, '
+        'reconcile_likes recounts them afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only count the tweets that would move')
+
+    def handle(self, *args, **options):
+        if not shards.enabled():
+            raise CommandError('Sharding is off, SHARDS["ALIASES"] is empty')
+        for alias in shards.databases():
+            if alias not in connections:
+                raise CommandError(f'{alias} is not in DATABASES')
+
+        moved = 0
+        for source in shards.databases():
+            moved += self.rebalance(source, options['batch_size'], options['dry_run'])
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(f'{verb} {moved} tweets')
+
+    def rebalance(self, source, batch_size, dry_run):
+        moved = 0
+        last_id = 0
+        while True:
+            batch = list(Tweet.objects.using(source).filter(pk__gt=last_id)
+                         .order_by('pk')[:batch_size])
+            if not batch:
+                return moved
+            last_id = batch[-1].pk
+
+            targets = {}
+            for tweet in batch:
+                target = shards.author_alias(tweet.author_id)
+                if target != source:
+                    targets.setdefault(target, []).append(tweet)
+            for target, tweets in targets.items():
+                moved += len(tweets)
+                if not dry_run:
+                    self.move(tweets, source, target, batch_size)
+
+    def move(self, tweets, source, target, batch_size):
+        ids = {tweet.uuid: tweet.pk for tweet in tweets}
+        for tweet in tweets:
+            # ids are per database, the uuid is what identifies a tweet
+            tweet.pk = None
+            tweet._state.adding = True
+        with transaction.atomic(using=target):
+            # skips tweets an interrupted run already copied
+            Tweet.objects.using(target).bulk_create(tweets, ignore_conflicts=True)
+            new_ids = {ids[uuid]: pk for uuid, pk in Tweet.objects.using(target)
+                       .filter(uuid__in=list(ids)).values_list('uuid', 'pk')}
+            self.copy(Like, ('user_id', 'tweet_id', 'date_created'),
+                      new_ids, source, target, batch_size)
+            self.copy(TimelineEntry, ('owner_id', 'tweet_id', 'date_created'),
+                      new_ids, source, target, batch_size)
+        # a move, not a delete clients have to be told about
+        with transaction.atomic(using=source), changes.moving():
+            Tweet.objects.using(source).filter(pk__in=list(new_ids)).delete()
+        self.stdout.write(f'{len(tweets)} tweets {source} -> {target}')
+
+    def copy(self, model, fields, new_ids, source, target, batch_size):
+        """
+        Copy the rows of model referring to the moved tweets to target, their
+        tweet_id changed to the tweet's id there. Inserted in SQL, so
+        auto_now_add keeps the date the rows were created; rows an interrupted
+        run already copied are skipped.
+        """
+        connection = connections[target]
+        q = connection.ops.quote_name
+        columns = [model._meta.get_field(name) for name in fields]
+        sql = (f'INSERT INTO {q(model._meta.db_table)} '
+               f'({", ".join(q(field.column) for field in columns)}) '
+               f'VALUES ({", ".join(["%s"] * len(columns))}) ON CONFLICT DO NOTHING')
+        tweet = fields.index('tweet_id')
+
+        rows = (model.objects.using(source).filter(tweet_id__in=list(new_ids))
+                .values_list(*fields).iterator(chunk_size=batch_size))
+        params = []
+        with connection.cursor() as cursor:
+            for row in rows:
+                row = list(row)
+                row[tweet] = new_ids[row[tweet]]
+                params.append([field.get_db_prep_value(value, connection)
+                               for field, value in zip(columns, row)])
+                if len(params) >= batch_size:
+                    cursor.executemany(sql, params)
+                    params = []
+            if params:
+                cursor.executemany(sql, params)
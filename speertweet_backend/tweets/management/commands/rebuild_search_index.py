@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from tweets import search
+from tweets.models import Tweet
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the tweet full-text search index, recreating it first if it '
+        'or its triggers are missing. On SQLite the index is rebuilt one '
+        'batch of tweets per transaction and stays searchable throughout; on '
+        'PostgreSQL the GIN index is reindexed concurrently.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        search.install(connection)
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'REINDEX INDEX CONCURRENTLY {search.GIN_INDEX}')
+            self.stdout.write('Reindexed tweet search')
+            return
+        if connection.vendor != 'sqlite':
+            self.stdout.write(f'No search index on {connection.vendor}')
+            return
+
+        batch_size = options['batch_size']
+        table = search.FTS_TABLE
+        last_id = 0
+        indexed = 0
+        while True:
+            ids = list(
+                Tweet.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            # replace the index entries of the id range (last_id, ids[-1]],
+            # which also drops entries of tweets deleted from it
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE rowid > %s AND rowid <= %s',
+                    [last_id, ids[-1]])
+                cursor.execute(
+                    f'INSERT INTO {table} (rowid, text) SELECT id, text '
+                    f'FROM tweets_tweet WHERE id > %s AND id <= %s',
+                    [last_id, ids[-1]])
+            indexed += len(ids)
+            last_id = ids[-1]
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE rowid > %s AND rowid NOT IN '
+                f'(SELECT id FROM tweets_tweet WHERE id > %s)',
+                [last_id, last_id])
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+
+        self.stdout.write(f'Indexed {indexed} tweets')
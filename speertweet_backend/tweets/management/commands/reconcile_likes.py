@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Subquery, Value
+
+from tweets import shards
+from tweets.counters import get_like_buffer
+from tweets.models import Like, Tweet
+from tweets.scores import score_after
+
+
+class Command(BaseCommand):
+    help = (
+        'Recount Tweet.likes from the like rows, e.g. after a crash lost '
+        'buffered like counts. Tweets without like rows are set to 0 likes, '
+        'unless --keep-unliked keeps counts from before the like table existed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--keep-unliked', action='store_true',
+                            help='leave the count of tweets without like rows alone')
+
+    def handle(self, *args, **options):
+        buffer = get_like_buffer()
+        if buffer is not None:
+            buffer.flush()
+
+        fixed = 0
+        for db in shards.databases():
+            fixed += self.recount(db, options['batch_size'])
+            if not options['keep_unliked']:
+                fixed += self.reset_unliked(db, options['batch_size'])
+        self.stdout.write(f'Recounted likes of {fixed} tweets')
+
+    def recount(self, db, batch_size):
+        """
+        Set the count of tweets with like rows on db, a shard or default,
+        where each tweet's likes are stored, to the number of rows.
+        """
+        like_counts = Subquery(
+            Like.objects.filter(tweet=OuterRef('pk'))
+            .values('tweet')
+            .annotate(count=Count('*'))
+            .values('count')
+        )
+
+        last_id = 0
+        fixed = 0
+        while True:
+            ids = list(
+                Like.objects.using(db).filter(tweet_id__gt=last_id)
+                .order_by('tweet_id')
+                .values_list('tweet_id', flat=True)
+                .distinct()[:batch_size]
+            )
+            if not ids:
+                break
+
+            with transaction.atomic(using=db):
+                fixed += Tweet.objects.using(db).filter(pk__in=ids).update(
+                    likes=like_counts, score=score_after(like_counts))
+            last_id = ids[-1]
+        return fixed
+
+    def reset_unliked(self, db, batch_size):
+        """
+        Set the count of tweets on db that have likes but no like rows to 0.
+        """
+        unliked = (Tweet.objects.using(db).exclude(likes=0)
+                   .filter(~Exists(Like.objects.filter(tweet=OuterRef('pk'))))
+                   .order_by('pk'))
+        reset = 0
+        while True:
+            ids = list(unliked.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return reset
+            with transaction.atomic(using=db):
+                reset += Tweet.objects.using(db).filter(pk__in=ids).update(
+                    likes=0, score=score_after(Value(0)))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from tweets import trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the trending score of recent tweets from their like '
+        'counts, correcting drift of the in place updates. Meant to run '
+        'periodically, e.g. from cron.'
+    )
+
+    def handle(self, *args, **options):
+        updated = trending.rollup()
+        self.stdout.write(f'Rescored {updated} tweets')
@@ -0,0 +1,175 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from speertweet_backend.ids import uuid7_from
+from tweets import timeline
+from tweets.models import TimelineEntry, Tweet
+from tweets.scores import hot_score
+from users.models import Follow
+
+
+WORDS = (
+    'the be to of and a in that have it for not on with he as you do at this '
+    'but his by from they we say her she or an will my one all would there '
+    'their what so up out if about who get which go me when make can like '
+    'time no just him know take people into year your good some could them '
+    'see other than then now look only come its over think also back after '
+    'use two how our work first well way even new want because any these '
+    'give day most us django python sqlite search tweet trending release '
+    'coffee weekend music football launch update news travel photo'
+).split()
+
+
+def power_law_weights(count, exponent):
+    """
+    Cumulative weights of count items where the item of rank r is drawn in
+    proportion to 1 / r ** exponent, for random.choices(cum_weights=...).
+    """
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic users, follows and tweets for load '
+        'testing, with bulk inserts. Authors, followers and likes are power '
+        'law distributed: a few users write most tweets and get most '
+        'followers and likes. Users are named <prefix>0, <prefix>1, ... '
+        'and all have the password "password".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--tweets', type=int, default=1000000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='users followed by each user')
+        parser.add_argument('--days', type=int, default=30,
+                            help='tweets are spread over this many days up to now')
+        parser.add_argument('--timeline-hours', type=int, default=2,
+                            help='hours of tweets written into home timelines')
+        parser.add_argument('--prefix', default='user')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0, help='random seed')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        User = get_user_model()
+        if User.objects.filter(username=f'{options["prefix"]}0').exists():
+            raise CommandError(f'Users named {options["prefix"]}N exist, pick another --prefix')
+
+        user_ids = self.create_users(options['users'], options['prefix'])
+        self.create_follows(user_ids, options['follows'])
+        self.create_tweets(user_ids, options['tweets'], options['days'])
+        self.fill_timelines(user_ids, options['timeline_hours'])
+
+    def progress(self, name, done, started):
+        rate = done / (time.monotonic() - started)
+        self.stdout.write(f'{name}: {done} ({rate:.0f}/s)')
+
+    def create_users(self, count, prefix):
+        User = get_user_model()
+        password = make_password('password')
+        started = time.monotonic()
+        for start in range(0, count, self.batch_size):
+            User.objects.bulk_create(
+                User(username=f'{prefix}{i}', password=password)
+                for i in range(start, min(start + self.batch_size, count)))
+            self.progress('users', min(start + self.batch_size, count), started)
+
+        # ordered by username number, so rank 1 is <prefix>0
+        ids = dict(User.objects.filter(username__startswith=prefix).values_list('username', 'pk'))
+        return [ids[f'{prefix}{i}'] for i in range(count)]
+
+    def create_follows(self, user_ids, per_user):
+        if not per_user or len(user_ids) < 2:
+            return
+        weights = power_law_weights(len(user_ids), 1.0)
+        started = time.monotonic()
+        follows = []
+        for n, follower in enumerate(user_ids, 1):
+            followees = set(self.random.choices(user_ids, cum_weights=weights, k=per_user))
+            follows.extend(
+                Follow(follower_id=follower, followee_id=followee)
+                for followee in followees if followee != follower)
+            if len(follows) >= self.batch_size or n == len(user_ids):
+                Follow.objects.bulk_create(follows, ignore_conflicts=True)
+                follows = []
+                self.progress('follows of users', n, started)
+
+        User = get_user_model()
+        User.objects.filter(pk__in=user_ids).update(followers_count=Coalesce(Subquery(
+            Follow.objects.filter(followee=OuterRef('pk'))
+            .values('followee').annotate(count=Count('*')).values('count')
+        ), 0))
+
+    def create_tweets(self, user_ids, count, days):
+        if not count:
+            return
+        weights = power_law_weights(len(user_ids), 1.1)
+        span = timedelta(days=days).total_seconds()
+        start = timezone.now() - timedelta(days=days)
+        started = time.monotonic()
+        for first in range(0, count, self.batch_size):
+            tweets = []
+            authors = self.random.choices(
+                user_ids, cum_weights=weights, k=min(self.batch_size, count - first))
+            for i, author in enumerate(authors, first):
+                created = start + timedelta(seconds=span * i / count)
+                likes = min(int(self.random.paretovariate(1.2)) - 1, 1000000)
+                tweets.append(Tweet(
+                    uuid=uuid7_from(created, f'seed {author} {i}'),
+                    text=' '.join(self.random.choices(WORDS, k=self.random.randint(3, 20))),
+                    author_id=author,
+                    likes=likes,
+                    date_created=created,
+                    score=hot_score(likes, created),
+                ))
+            with transaction.atomic():
+                Tweet.objects.bulk_create(tweets)
+            self.progress('tweets', first + len(tweets), started)
+
+    def fill_timelines(self, user_ids, hours):
+        """
+        Write the recent tweets of the new users into home timelines, as fan
+        out would have.
+        """
+        if not hours or not user_ids:
+            return
+        since = connection.ops.adapt_datetimefield_value(
+            timezone.now() - timedelta(hours=hours))
+        limit = timeline.get_setting('FANOUT_LIMIT')
+        entries = TimelineEntry._meta.db_table
+        tweets = Tweet._meta.db_table
+        follows = Follow._meta.db_table
+        users = get_user_model()._meta.db_table
+        written = 0
+        # the new users' ids, which need not be contiguous, a chunk at a time
+        # to stay under the database's limit of query parameters
+        for start in range(0, len(user_ids), 500):
+            authors = user_ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(authors))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {entries} (owner_id, tweet_id, date_created) '
+                    f'SELECT t.author_id, t.id, t.date_created FROM {tweets} t '
+                    f'WHERE t.author_id IN ({placeholders}) AND t.date_created >= %s',
+                    [*authors, since])
+                cursor.execute(
+                    f'INSERT INTO {entries} (owner_id, tweet_id, date_created) '
+                    f'SELECT f.follower_id, t.id, t.date_created FROM {follows} f '
+                    f'JOIN {users} u ON u.id = f.followee_id AND u.followers_count < %s '
+                    f'JOIN {tweets} t ON t.author_id = f.followee_id '
+                    f'WHERE f.followee_id IN ({placeholders}) AND t.date_created >= %s',
+                    [limit, *authors, since])
+                written += cursor.rowcount
+        self.stdout.write(f'follower timeline entries: {written}')
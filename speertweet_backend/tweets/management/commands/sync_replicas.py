@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from speertweet_backend import routers
+
+
+class Command(BaseCommand):
+    help = (
+        'Write the replication heartbeat on the primary database and copy the '
+        'primary to every SQLite replica in REPLICAS["ALIASES"], with the '
+        'SQLite backup API so each copy is consistent. Meant for trying read '
+        'replicas locally; with --heartbeat-only it only writes the '
+        'heartbeat, for replicas kept up to date by other means. --interval '
+        'repeats every so many seconds until interrupted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='seconds between syncs')
+        parser.add_argument('--heartbeat-only', action='store_true')
+
+    def handle(self, *args, **options):
+        aliases = routers.get_setting('ALIASES')
+        if not options['heartbeat_only']:
+            for alias in [DEFAULT_DB_ALIAS, *aliases]:
+                if connections[alias].vendor != 'sqlite':
+                    raise CommandError(f'{alias} is not SQLite, use --heartbeat-only')
+
+        while True:
+            try:
+                routers.write_heartbeat()
+                if not options['heartbeat_only']:
+                    for alias in aliases:
+                        self.copy(alias)
+            except DatabaseError as e:
+                if options['interval'] is None:
+                    raise CommandError(e)
+                # a busy database is retried at the next interval
+                self.stderr.write(f'Sync failed: {e}')
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+
+    def copy(self, alias):
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+        primary.ensure_connection()
+        replica.ensure_connection()
+        started = time.monotonic()
+        primary.connection.backup(replica.connection)
+        self.stdout.write(f'Copied to {alias} in {time.monotonic() - started:.2f}s')
@@ -0,0 +1,70 @@
+from django.apps import apps
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import shards
+from .counters import get_like_buffer, liked_tweet
+from .scores import score_after
+from .signals import likes_changed
+
+
+class LikeManager(models.Manager):
+    """
+    Custom like manager class. Keeps Tweet.likes in step with the like rows
+    using a single row UPDATE instead of a read-modify-save of the tweet, or
+    through the write-behind LikeCounterBuffer when LIKE_BUFFER is enabled.
+    Like rows are stored on the shard of their tweet, see tweets.shards.
+    """
+
+    def like(self, user, tweet):
+        """
+        Like a tweet. Returns False if the user already liked it.
+        """
+        tweet = liked_tweet(tweet)
+        try:
+            with transaction.atomic(using=tweet.db):
+                self.db_manager(tweet.db).create(user_id=user.pk, tweet_id=tweet.id)
+                buffered = self._add_likes(tweet, 1)
+        except IntegrityError:
+            return False
+
+        if not buffered:
+            likes_changed.send(sender=self.model, tweets=[tweet])
+        return True
+
+    def unlike(self, user, tweet):
+        """
+        Remove a like. Returns False if the user had not liked the tweet.
+        """
+        tweet = liked_tweet(tweet)
+        with transaction.atomic(using=tweet.db):
+            deleted, _ = self.db_manager(tweet.db).filter(
+                user_id=user.pk, tweet_id=tweet.id).delete()
+            buffered = deleted and self._add_likes(tweet, -1)
+
+        if deleted and not buffered:
+            likes_changed.send(sender=self.model, tweets=[tweet])
+        return bool(deleted)
+
+    def has_liked(self, user, tweet):
+        return self.db_manager(shards.tweet_db(tweet)).filter(
+            user_id=user.pk, tweet_id=tweet.pk).exists()
+
+    def _add_likes(self, tweet, delta):
+        """
+        Apply a like count change to the LikedTweet, returns True if it was
+        buffered.
+        """
+        buffer = get_like_buffer()
+        if buffer is not None:
+            # only buffer once the like row is committed
+            transaction.on_commit(lambda: buffer.add(tweet, delta))
+            return True
+
+        Tweet = apps.get_model('tweets', 'Tweet')
+        Tweet.objects.using(tweet.db).filter(pk=tweet.id).update(
+            likes=F('likes') + delta,
+            score=score_after(F('likes') + delta),
+            date_modified=timezone.now())
+        return False
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['date_created', 'id'], name='tweets_twee_date_cr_6cc51a_idx'),
+        ),
+    ]
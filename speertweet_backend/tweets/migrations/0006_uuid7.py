@@ -0,0 +1,25 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:47
+
+from django.db import migrations, models
+import speertweet_backend.ids
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0005_tweet_uuid_unique'),
+    ]
+
+    # the default is applied by Django, not the database, so only the
+    # migration state changes and existing uuids are left as they are
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='tweet',
+                    name='uuid',
+                    field=models.UUIDField(default=speertweet_backend.ids.uuid7, unique=True),
+                ),
+            ],
+        ),
+    ]
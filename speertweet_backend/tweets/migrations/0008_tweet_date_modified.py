@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0007_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweet',
+            name='date_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from tweets import search
+
+
+def install(apps, schema_editor):
+    search.install(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('tweets', '0008_tweet_date_modified'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,71 @@
+import math
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+
+# tweets.scores as of this migration
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+GRAVITY = 45000
+
+
+def add_score_column(apps, schema_editor):
+    """
+    Add the column in place. Django adds a NOT NULL column to an SQLite table
+    by rebuilding the table, which would drop the search index triggers.
+    """
+    Tweet = apps.get_model('tweets', 'Tweet')
+    q = schema_editor.quote_name
+    db_type = models.FloatField().db_type(schema_editor.connection)
+    schema_editor.execute(
+        f'ALTER TABLE {q(Tweet._meta.db_table)} '
+        f'ADD COLUMN {q("score")} {db_type} DEFAULT 0 NOT NULL')
+
+
+def drop_score_column(apps, schema_editor):
+    Tweet = apps.get_model('tweets', 'Tweet')
+    q = schema_editor.quote_name
+    schema_editor.execute(
+        f'ALTER TABLE {q(Tweet._meta.db_table)} DROP COLUMN {q("score")}')
+
+
+def score_tweets(apps, schema_editor):
+    Tweet = apps.get_model('tweets', 'Tweet')
+    tweets = Tweet.objects.order_by('id').only('id', 'likes', 'date_created')
+    last_id = 0
+    while True:
+        batch = list(tweets.filter(id__gt=last_id)[:2000])
+        if not batch:
+            return
+        for tweet in batch:
+            tweet.score = (math.log10(max(tweet.likes, 1))
+                           + (tweet.date_created - EPOCH).total_seconds() / GRAVITY)
+        Tweet.objects.bulk_update(batch, ['score'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0009_tweet_search'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_score_column, drop_score_column),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='tweet',
+                    name='score',
+                    field=models.FloatField(),
+                ),
+            ],
+        ),
+        migrations.RunPython(score_tweets, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='tweet',
+            index=models.Index(fields=['-score'], name='tweets_twee_score_3d7e84_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0010_tweet_score'),
+    ]
+
+    # auto_now_add and default=timezone.now are both applied by Django, so
+    # only the migration state changes and the table is not rebuilt
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='tweet',
+                    name='date_created',
+                    field=models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+    ]
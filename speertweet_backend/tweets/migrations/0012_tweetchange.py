@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tweets', '0011_tweet_date_created_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TweetChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('tweet_uuid', models.UUIDField()),
+                ('kind', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('likes', 'Likes'), ('delete', 'Delete')], max_length=6)),
+                ('date_created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('author', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tweetchange',
+            index=models.Index(fields=['author', 'seq'], name='tweets_twee_author__dcdb79_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tweetchange',
+            index=models.Index(fields=['tweet_uuid', 'seq'], name='tweets_twee_tweet_u_ab34fb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tweetchange',
+            index=models.Index(fields=['date_created'], name='tweets_twee_date_cr_2eceaa_idx'),
+        ),
+    ]
@@ -1,25 +1,149 @@
 from django.db import models
-from uuid import uuid4
+from django.utils import timezone
+
+from speertweet_backend.ids import uuid7
+
+from . import scores, search
+from .managers import LikeManager
 
 # Create your models here.
 
 
+class TweetQuerySet(models.QuerySet):
+
+    # columns needed to render a tweet in a list, author included
+    FEED_FIELDS = ('id', 'uuid', 'text', 'likes', 'date_created',
+                   'date_modified', 'author__username')
+    # the same without the join, for shards that hold no users, see tweets.shards
+    SHARD_FEED_FIELDS = FEED_FIELDS[:-1] + ('author_id',)
+
+    def feed(self, *extra):
+        """
+        Return the tweets as flat dicts fetched in one query joined to the
+        author, for TweetListSerializer to render without model instances.
+        Any extra fields or annotations are added to each dict.
+        """
+        return self.values(*self.FEED_FIELDS, *extra)
+
+    def search(self, query):
+        """
+        Return the tweets matching the full-text query, annotated with rank.
+        """
+        return search.search(self, query)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for tweet in objs:
+            tweet.set_score()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class Tweet(models.Model):
 
-    uuid = models.UUIDField(default=uuid4, null=False)
+    uuid = models.UUIDField(default=uuid7, null=False, unique=True)
     text = models.CharField(max_length=250, null=False)
     likes = models.IntegerField(default=0, null=False)
-    date_created = models.DateTimeField(auto_now_add=True)
+    date_created = models.DateTimeField(default=timezone.now)
+    # row version, moved forward by every change to the text or like count
+    date_modified = models.DateTimeField(auto_now=True)
+    # see tweets.scores, set on insert unless given and kept up to date with
+    # every like count change
+    score = models.FloatField()
     author = models.ForeignKey(
         'users.User', related_name='tweets', on_delete=models.CASCADE)
 
+    objects = TweetQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['date_created', '-likes']),
-            models.Index(fields=['author_id', 'date_created'])
+            models.Index(fields=['author_id', 'date_created']),
+            models.Index(fields=['date_created', 'id']),
+            models.Index(fields=['-score']),
         ]
 
     def __str__(self):
         return f'<Tweet uuid={self.uuid} author={self.author}>'
 
-    
\ No newline at end of file
+    def set_score(self):
+        if self.score is None:
+            self.score = scores.hot_score(self.likes, self.date_created)
+
+    def save(self, *args, **kwargs):
+        self.set_score()
+        super().save(*args, **kwargs)
+
+
+class Like(models.Model):
+    """
+    A users like of a tweet. A user can like a tweet at most once.
+    """
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE)
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    objects = LikeManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tweet', 'user'], name='unique_tweet_like'),
+        ]
+
+    def __str__(self):
+        return f'<Like tweet={self.tweet_id} user={self.user_id}>'
+
+
+class TimelineEntry(models.Model):
+    """
+    A tweet in a users precomputed home timeline. Written by fan out when a
+    followed user tweets; date_created is copied from the tweet so a timeline
+    page is one range scan of the (owner, date_created, tweet) index.
+    """
+    owner = models.ForeignKey(
+        'users.User', related_name='timeline', on_delete=models.CASCADE)
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE)
+    date_created = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'date_created', 'tweet']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tweet', 'owner'], name='unique_timeline_entry'),
+        ]
+
+    def __str__(self):
+        return f'<TimelineEntry owner={self.owner_id} tweet={self.tweet_id}>'
+
+
+class TweetChange(models.Model):
+    """
+    An entry of the append-only log of changes to tweets read by the changes
+    feed, see tweets.changes. seq numbers the entries in commit order; the
+    author is kept without a constraint so tombstones outlive the tweet.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    LIKES = 'likes'
+    DELETE = 'delete'
+    KINDS = [(CREATE, 'Create'), (UPDATE, 'Update'), (LIKES, 'Likes'), (DELETE, 'Delete')]
+
+    seq = models.BigAutoField(primary_key=True)
+    tweet_uuid = models.UUIDField()
+    author = models.ForeignKey(
+        'users.User', related_name='+', on_delete=models.DO_NOTHING,
+        db_constraint=False, db_index=False)
+    kind = models.CharField(max_length=6, choices=KINDS)
+    date_created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['author', 'seq']),
+            models.Index(fields=['tweet_uuid', 'seq']),
+            models.Index(fields=['date_created']),
+        ]
+
+    def __str__(self):
+        return f'<TweetChange seq={self.seq} {self.kind} tweet={self.tweet_uuid}>'
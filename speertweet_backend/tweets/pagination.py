@@ -0,0 +1,237 @@
+import heapq
+from base64 import b64decode, b64encode
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from urllib import parse
+from uuid import UUID
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+Cursor = namedtuple('Cursor', ['reverse', 'position'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque cursor pagination keyed on (date_created, id), newest first. Every
+    page is a single indexed range scan of at most page_size + 1 rows: there is
+    no OFFSET and no COUNT(*), so the cost of a page does not depend on how
+    deep into the feed it is.
+    EXAMPLE:
+        GET -> /tweets/recent/ -> {"next": url, "previous": url, "results": []}
+        GET -> /tweets/recent/?cursor=<next> -> the following page
+    """
+    # fields the feed is ordered on, newest first, ending with a unique field
+    ordering = ('date_created', 'id')
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Return one page of the queryset. A list of querysets is paged as one
+        feed: each is range scanned for a page and the results are merged.
+        """
+        querysets = self.start(queryset, request)
+        return self.finish([list(qs) for qs in querysets])
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset for async views, the request being a DRF Request
+        wrapping the HttpRequest for its query_params.
+        """
+        querysets = self.start(queryset, request)
+        return self.finish([[row async for row in qs] for qs in querysets])
+
+    def start(self, queryset, request):
+        """
+        Read the page size and cursor of the request and return the sliced
+        page querysets to fetch.
+        """
+        querysets = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request, querysets[0].model)
+
+        # fetch one extra row to find out if there is another page
+        return [self.get_page_queryset(qs)[:self.page_size + 1] for qs in querysets]
+
+    def finish(self, pages):
+        reverse = self.cursor is not None and self.cursor.reverse
+        if len(pages) == 1:
+            rows = pages[0]
+        else:
+            rows = self.merge(pages, descending=not reverse)
+
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        return self.page
+
+    def get_page_queryset(self, queryset):
+        descending = tuple('-' + f for f in self.ordering)
+        if self.cursor is None:
+            return queryset.order_by(*descending)
+        if self.cursor.reverse:
+            return queryset.filter(self.get_range(self.cursor)).order_by(*self.ordering)
+        return queryset.filter(self.get_range(self.cursor)).order_by(*descending)
+
+    def merge(self, pages, descending):
+        """
+        k-way merge sorted pages into one of at most page_size + 1 rows, dropping
+        rows that more than one source returned.
+        """
+        rows = []
+        last = None
+        for row in heapq.merge(*pages, key=self.get_position, reverse=descending):
+            position = self.get_position(row)
+            if position == last:
+                continue
+            rows.append(row)
+            last = position
+            if len(rows) > self.page_size:
+                break
+        return rows
+
+    def get_range(self, cursor):
+        """
+        Return the filter selecting the rows after the cursor position, e.g.
+        date_created <= d AND (date_created < d OR (date_created = d AND id < i)).
+        The redundant leading bound gives the planner a sargable range, so the
+        index is entered at the cursor instead of walked from its end.
+        """
+        op = 'gt' if cursor.reverse else 'lt'
+        after = Q()
+        for i, field in enumerate(self.ordering):
+            equal = dict(zip(self.ordering[:i], cursor.position[:i]))
+            after |= Q(**equal, **{f'{field}__{op}': cursor.position[i]})
+
+        if len(self.ordering) == 1:
+            return after
+        return Q(**{f'{self.ordering[0]}__{op}e': cursor.position[0]}) & after
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self.get_position(self.page[-1])
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(False, position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self.get_position(self.page[0])
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(True, position))
+
+    def get_position(self, row):
+        if isinstance(row, dict):
+            return tuple(row[field] for field in self.ordering)
+        return tuple(getattr(row, field) for field in self.ordering)
+
+    def decode_cursor(self, request, model):
+        """
+        Return the Cursor from the request query params, or None when the first
+        page is requested.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens['r'][0]))
+            values = tokens['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = tuple(
+                self.to_python(model, field, value)
+                for field, value in zip(self.ordering, values)
+            )
+        except (TypeError, ValueError, KeyError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(reverse, position)
+
+    def to_python(self, model, field, value):
+        return model._meta.get_field(field).to_python(value)
+
+    def encode_cursor(self, cursor):
+        """
+        Return the absolute url of the page starting after the given Cursor.
+        """
+        querystring = parse.urlencode({
+            'r': int(cursor.reverse),
+            'p': [self.encode_value(value) for value in cursor.position],
+        }, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def encode_value(self, value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, UUID):
+            return value.hex
+        return str(value)
+
+
+class TimelinePagination(KeysetPagination):
+    """
+    Keyset pagination of home timeline rows, which carry the tweet id as
+    tweet_id.
+    """
+    ordering = ('date_created', 'tweet_id')
+
+
+class SearchPagination(KeysetPagination):
+    """
+    Keyset pagination of search results, best match first. The rank is not a
+    column, so a cursor only stays exact while the index statistics it was
+    computed from are unchanged.
+    """
+    ordering = ('rank', 'id')
+
+    def to_python(self, model, field, value):
+        if field == 'rank':
+            return float(value)
+        return super().to_python(model, field, value)
@@ -0,0 +1,50 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.signals import followed, unfollowed, username_changed
+
+from . import changes, timeline
+from .caches import tweet_cache
+from .models import Tweet, TweetChange
+from .signals import likes_changed
+
+
+@receiver(followed)
+def backfill_timeline(sender, follower, followee, **kwargs):
+    timeline.backfill(follower, followee)
+
+
+@receiver(unfollowed)
+def clear_timeline(sender, follower, followee, **kwargs):
+    timeline.remove(follower, followee)
+    timeline.backfill_followers(followee)
+
+
+@receiver(post_save, sender=Tweet)
+@receiver(post_delete, sender=Tweet)
+def invalidate_tweet(sender, instance, using, **kwargs):
+    tweet_cache.invalidate(instance.uuid, using=using)
+
+
+@receiver(post_delete, sender=Tweet)
+def record_delete(sender, instance, **kwargs):
+    # whatever deleted it, the view, a deleted author or the admin
+    if not changes.is_moving():
+        changes.record(TweetChange.DELETE, [instance])
+
+
+@receiver(likes_changed)
+def invalidate_liked_tweets(sender, tweets, **kwargs):
+    for tweet in tweets:
+        tweet_cache.invalidate(tweet.uuid, using=tweet.db)
+
+
+@receiver(likes_changed)
+def record_like_changes(sender, tweets, **kwargs):
+    changes.record(TweetChange.LIKES, tweets)
+
+
+@receiver(username_changed)
+def invalidate_authors_tweets(sender, user, old_username, **kwargs):
+    # cached tweets carry the author username
+    tweet_cache.clear()
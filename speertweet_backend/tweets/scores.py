@@ -0,0 +1,32 @@
+"""
+Trending score of a tweet: log10 of its like count plus its age in units of
+GRAVITY seconds. A tweet needs ten times the likes to outrank one posted
+GRAVITY seconds later, so the stored score never has to be decayed: newer
+tweets start higher instead. A like only changes the log term, which an
+UPDATE can adjust in place from the old and new like count.
+"""
+
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import F
+from django.db.models.functions import Greatest, Log
+
+
+EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+GRAVITY = 45000
+
+
+def hot_score(likes, date_created):
+    return (math.log10(max(likes, 1))
+            + (date_created - EPOCH).total_seconds() / GRAVITY)
+
+
+def score_after(likes):
+    """
+    Return the expression updating Tweet.score to the new like count, given
+    as an expression evaluated against the old row, e.g. F('likes') + 1.
+    """
+    return (F('score')
+            - Log(10, Greatest(F('likes'), 1))
+            + Log(10, Greatest(likes, 1)))
@@ -0,0 +1,115 @@
+"""
+Full-text search over Tweet.text.
+
+On SQLite the text is indexed in an FTS5 table keyed by tweet id, which
+triggers on tweets_tweet keep in step with every insert, text update and
+delete, whatever code path writes the tweet. The table keeps its own copy of
+the text, so a range of it can be rebuilt while the rest stays searchable.
+On PostgreSQL a GIN index over to_tsvector('english', text) is maintained by
+the database itself. Other backends fall back to an unindexed icontains scan.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+
+FTS_TABLE = 'tweets_tweet_fts'
+GIN_INDEX = 'tweets_tweet_text_search'
+VECTOR = "to_tsvector('english', \"tweets_tweet\".\"text\")"
+INDEXED_VECTOR = "to_tsvector('english', \"text\")"
+
+TERM_RE = re.compile(r'\w+')
+
+FTS_TRIGGERS = {
+    f'{FTS_TABLE}_insert': f"""
+        AFTER INSERT ON tweets_tweet BEGIN
+            INSERT INTO {FTS_TABLE} (rowid, text) VALUES (new.id, new.text);
+        END""",
+    f'{FTS_TABLE}_delete': f"""
+        AFTER DELETE ON tweets_tweet BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END""",
+    f'{FTS_TABLE}_update': f"""
+        AFTER UPDATE OF text ON tweets_tweet BEGIN
+            UPDATE {FTS_TABLE} SET text = new.text WHERE rowid = old.id;
+        END""",
+}
+
+
+def terms(query):
+    return TERM_RE.findall(query)
+
+
+def search(queryset, query):
+    """
+    Return the tweets of queryset containing every word of query, annotated
+    with a rank that is higher for better matches.
+    """
+    words = terms(query)
+    if not words:
+        return queryset.none().annotate(rank=Value(0.0, FloatField()))
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        # quoted, so user input is never parsed as FTS5 query syntax
+        match = ' '.join(f'"{word}"' for word in words)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = "tweets_tweet"."id"', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        ).annotate(rank=RawSQL(f'-bm25({FTS_TABLE})', (), output_field=FloatField()))
+
+    if vendor == 'postgresql':
+        tsquery = "plainto_tsquery('english', %s)"
+        text = ' '.join(words)
+        return queryset.extra(
+            where=[f'{VECTOR} @@ {tsquery}'],
+            params=[text],
+        ).annotate(rank=RawSQL(
+            f'ts_rank({VECTOR}, {tsquery})', (text,), output_field=FloatField()))
+
+    for word in words:
+        queryset = queryset.filter(text__icontains=word)
+    return queryset.annotate(rank=Value(0.0, FloatField()))
+
+
+def install(connection):
+    """
+    Create the search index and fill it from the existing tweets. Running it
+    again restores anything missing, e.g. the triggers, which SQLite drops
+    when a migration rebuilds tweets_tweet.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                [FTS_TABLE])
+            exists = cursor.fetchone() is not None
+
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                f"USING fts5(text, tokenize='porter unicode61')")
+            for name, body in FTS_TRIGGERS.items():
+                cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+            if not exists:
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE} (rowid, text) SELECT id, text FROM tweets_tweet')
+
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {GIN_INDEX} '
+                f'ON "tweets_tweet" USING GIN ({INDEXED_VECTOR})')
+
+
+def uninstall(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for name in FTS_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {GIN_INDEX}')
@@ -1,12 +1,47 @@
+from django.db import transaction
+from django.db.models import Manager, QuerySet
 from rest_framework import serializers
 
-from . import models
+from speertweet_backend.metrics import TimedSerializerMixin
 
+from . import models, shards
+from .counters import get_like_buffer
 
 
+class TweetListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """
+    Read optimised list serializer. Tweet querysets are fetched as flat rows in
+    one query joined to the author and each row is formatted directly, skipping
+    the per-field serializer machinery. Lists of tweets are created with a
+    single bulk insert.
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        if isinstance(data, QuerySet) and data.model is models.Tweet:
+            data = data.feed()
+
+        return [
+            self.child.row_to_representation(row) if isinstance(row, dict)
+            else self.child.to_representation(row)
+            for row in data
+        ]
+
+    def create(self, validated_data):
+        """
+        Insert all the tweets with one bulk_create in a single transaction, on
+        the shard of their author.
+        """
+        tweets = [models.Tweet(**attrs) for attrs in validated_data]
+        for tweet in tweets:
+            tweet.uuid = shards.new_uuid(tweet.author_id)
+        author_id = tweets[0].author_id
+        with transaction.atomic(using=shards.author_alias(author_id)):
+            return shards.tweets(author_id).bulk_create(tweets)
 
 
-class TweetSerializer(serializers.ModelSerializer):
+class TweetSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer that provides an overview of the Tweet model. 
     """
@@ -17,4 +52,48 @@ class TweetSerializer(serializers.ModelSerializer):
         model = models.Tweet
         fields = ['uuid', 'text', 'author', 'likes',
                   'date_created']
-        read_only_fields = ['uuid', 'author', 'date_created', 'likes']
\ No newline at end of file
+        read_only_fields = ['uuid', 'author', 'date_created', 'likes']
+        list_serializer_class = TweetListSerializer
+
+    def create(self, validated_data):
+        """
+        Create the tweet on the shard of its author, with its bucket in the
+        uuid, see tweets.shards.
+        """
+        author = validated_data['author']
+        return shards.tweets(author.pk).create(uuid=shards.new_uuid(author.pk), **validated_data)
+
+    def update(self, instance, validated_data):
+        """
+        Save only the edited columns, so a like committed while the edit is in
+        flight is not overwritten with the like count read before it.
+        """
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # save() kwargs that are not columns, e.g. edited, are only set
+        columns = [field.name for field in instance._meta.concrete_fields
+                   if field.name in validated_data]
+        instance.save(update_fields=[*columns, 'date_modified'])
+        return instance
+
+    def row_to_representation(self, row):
+        """
+        Format a TweetQuerySet.feed() row the way to_representation formats a
+        Tweet instance.
+        """
+        fields = self.fields
+        buffer = get_like_buffer()
+        return {
+            'uuid': fields['uuid'].to_representation(row['uuid']),
+            'text': row['text'],
+            'author': row['author__username'],
+            'likes': row['likes'] + (buffer.pending(row['uuid']) if buffer else 0),
+            'date_created': fields['date_created'].to_representation(row['date_created']),
+        }
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        buffer = get_like_buffer()
+        if buffer is not None:
+            data['likes'] += buffer.pending(instance.uuid)
+        return data
@@ -0,0 +1,285 @@
+"""
+Horizontal sharding of tweets by author.
+
+SHARDS['ALIASES'] names the databases in DATABASES that hold tweets. Every
+author hashes to one of NUM_BUCKETS buckets and every bucket to one alias
+with a jump consistent hash, so appending an alias moves only the buckets the
+new shard takes over, about 1/n of the tweets, see `manage.py
+rebalance_shards`. With no aliases sharding is off and tweets stay in
+"default" like everything else.
+
+A new tweet's uuid carries its bucket in the low BUCKET_BITS bits, so the
+detail route goes straight to the right shard. Tweets created before
+sharding, or still on their way to a new shard, are looked for on the other
+shards next.
+
+A tweet's likes and home timeline entries are stored with it, on its shard,
+and every shard has its own search index; home timelines, search and
+trending read each shard and merge. Users and follows stay in "default". The
+author username is not joined in SQL on a shard, it is filled in from
+"default" after a page is read, see attach_authors.
+"""
+
+import zlib
+from uuid import UUID
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from speertweet_backend.ids import uuid7
+
+
+DEFAULTS = {
+    'ALIASES': [],
+}
+
+# fixed: the bucket of every tweet is part of its uuid
+BUCKET_BITS = 10
+NUM_BUCKETS = 1 << BUCKET_BITS
+
+
+def get_setting(name):
+    return getattr(settings, 'SHARDS', {}).get(name, DEFAULTS[name])
+
+
+def enabled():
+    return bool(get_setting('ALIASES'))
+
+
+def databases():
+    """
+    Every database that may hold tweets: the shards, and "default", where
+    tweets written before sharding wait to be rebalanced.
+    """
+    aliases = list(get_setting('ALIASES'))
+    if DEFAULT_DB_ALIAS not in aliases:
+        aliases.append(DEFAULT_DB_ALIAS)
+    return aliases
+
+
+def author_bucket(author_id):
+    return zlib.crc32(str(author_id).encode()) % NUM_BUCKETS
+
+
+def jump_hash(key, buckets):
+    """
+    Jump consistent hash (Lamping and Veach): map key to one of buckets,
+    moving only 1/buckets of the keys when a bucket is added.
+    """
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (1 << 31) / ((key >> 33) + 1))
+    return b
+
+
+def bucket_alias(bucket):
+    aliases = get_setting('ALIASES')
+    if not aliases:
+        return DEFAULT_DB_ALIAS
+    return aliases[jump_hash(bucket, len(aliases))]
+
+
+def author_alias(author_id):
+    return bucket_alias(author_bucket(author_id))
+
+
+def uuid_bucket(value):
+    """
+    Return the bucket encoded in a tweet uuid, or None for a uuid that is not
+    a UUIDv7. Tweets created before sharding give a random bucket.
+    """
+    value = value if isinstance(value, UUID) else UUID(str(value))
+    if value.version != 7:
+        return None
+    return value.int & (NUM_BUCKETS - 1)
+
+
+def new_uuid(author_id):
+    """
+    Return a UUIDv7 for a new tweet of the author, carrying its bucket.
+    """
+    return UUID(int=uuid7().int >> BUCKET_BITS << BUCKET_BITS | author_bucket(author_id))
+
+
+def lookup_order(uuid):
+    """
+    Return the databases to look for a tweet in, most likely first.
+    """
+    aliases = databases()
+    bucket = uuid_bucket(uuid)
+    if bucket is None:
+        return aliases
+    first = bucket_alias(bucket)
+    return [first, *(alias for alias in aliases if alias != first)]
+
+
+def tweets(author_id):
+    """
+    Return the Tweet queryset of the shard holding the author's tweets. With
+    sharding off it is left to the database routers.
+    """
+    from .models import Tweet
+
+    if not enabled():
+        return Tweet.objects.all()
+    return Tweet.objects.using(author_alias(author_id))
+
+
+def feed(queryset, *extra):
+    """
+    TweetQuerySet.feed() of a queryset on any database. Off "default" the
+    author is not joined, it is added by attach_authors.
+    """
+    if queryset._db in (None, DEFAULT_DB_ALIAS):
+        return queryset.feed(*extra)
+    return queryset.values(*queryset.SHARD_FEED_FIELDS, *extra)
+
+
+def all_feeds(*extra):
+    """
+    Return the feed querysets of every database holding tweets, for
+    KeysetPagination to page through as one merged feed.
+    """
+    from .models import Tweet
+
+    return [feed(Tweet.objects.using(alias), *extra) for alias in databases()]
+
+
+def attach_authors(rows):
+    """
+    Fill in author__username of feed rows read from a shard, with one query
+    to "default". Returns the rows.
+    """
+    from users.models import User
+
+    missing = {row['author_id'] for row in rows if 'author__username' not in row}
+    if missing:
+        usernames = dict(User.objects.filter(pk__in=missing).values_list('pk', 'username'))
+        for row in rows:
+            if 'author__username' not in row:
+                row['author__username'] = usernames.get(row['author_id'])
+    return rows
+
+
+def find(uuid):
+    """
+    Return the feed row of a tweet from whichever database holds it, or None.
+    """
+    from .models import Tweet
+
+    for alias in lookup_order(uuid):
+        row = feed(Tweet.objects.using(alias).filter(uuid=uuid)).first()
+        if row is not None:
+            return attach_authors([row])[0]
+    return None
+
+
+def find_many(uuids):
+    """
+    Return {uuid: feed row} of the tweets that exist, one IN query per
+    database, asking the likely shard of every uuid first.
+    """
+    from .models import Tweet
+
+    found = {}
+    remaining = [str(uuid) for uuid in uuids]
+    for attempt in range(len(databases())):
+        by_alias = {}
+        for uuid in remaining:
+            aliases = lookup_order(uuid)
+            by_alias.setdefault(aliases[attempt], []).append(uuid)
+        for alias, batch in by_alias.items():
+            for row in feed(Tweet.objects.using(alias).filter(uuid__in=batch)):
+                found[str(row['uuid'])] = row
+        remaining = [uuid for uuid in remaining if uuid not in found]
+        if not remaining:
+            break
+    attach_authors(list(found.values()))
+    return found
+
+
+def routed(alias):
+    """
+    Return the alias to pass to using() to query a database of databases(),
+    None for "default", where the database routers pick, e.g. a replica.
+    """
+    return None if alias == DEFAULT_DB_ALIAS else alias
+
+
+def tweet_db(tweet):
+    """
+    Return the shard a tweet instance was read from or saved to, None for
+    "default" and its replicas, where the database routers pick.
+    """
+    alias = tweet._state.db
+    if enabled() and alias != DEFAULT_DB_ALIAS and alias in get_setting('ALIASES'):
+        return alias
+    return None
+
+
+def get_tweet(uuid):
+    """
+    Return the Tweet instance from whichever database holds it, or None.
+    """
+    from .models import Tweet
+
+    for alias in lookup_order(uuid):
+        tweet = Tweet.objects.using(alias).filter(uuid=uuid).first()
+        if tweet is not None:
+            return tweet
+    return None
+
+
+def disable_foreign_keys(sender, connection, **kwargs):
+    """
+    connection_created receiver: a shard holds no users, so the author
+    foreign key of its tweets and the user foreign key of their likes cannot
+    be enforced there.
+    """
+    if (connection.vendor == 'sqlite' and connection.alias != DEFAULT_DB_ALIAS
+            and connection.alias in get_setting('ALIASES')):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA foreign_keys = OFF')
+
+
+def is_tweet(model):
+    return model._meta.label_lower == 'tweets.tweet'
+
+
+class ShardRouter:
+    """
+    Save tweets to their author's shard, and read the rows other models relate
+    to a sharded tweet from "default". Listed before ReplicaRouter.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if (enabled() and instance is not None and not is_tweet(model)
+                and is_tweet(type(instance)) and instance._state.db != DEFAULT_DB_ALIAS):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if not enabled() or instance is None:
+            return None
+        if is_tweet(model) and is_tweet(type(instance)):
+            # a tweet read from the database is saved back where it was found
+            if instance._state.adding or instance._state.db is None:
+                alias = author_alias(instance.author_id)
+            else:
+                alias = instance._state.db
+        else:
+            # e.g. the permissions `migrate --database` creates on a shard
+            alias = instance._state.db
+        # writes to "default" are left to ReplicaRouter, which pins the request
+        if alias in get_setting('ALIASES') and alias != DEFAULT_DB_ALIAS:
+            return alias
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if enabled() and (is_tweet(type(obj1)) or is_tweet(type(obj2))):
+            return True
+        return None
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+
+# sent with tweets, LikedTweets, once like count changes to them are committed
+likes_changed = Signal()
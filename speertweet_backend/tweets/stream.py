@@ -0,0 +1,301 @@
+"""
+Live tweet stream over Server-Sent Events.
+
+GET /tweets/stream/ is a text/event-stream of `tweet` events, one per new
+tweet in the format of the tweet API, and `likes` events, {"uuid", "likes"}
+with the new count of a liked or unliked tweet. It is served by
+StreamApplication, a plain ASGI application in front of Django, see
+speertweet_backend.asgi: a subscriber is a few small objects waiting in the
+event loop, not a thread or a Django request, so one process holds tens of
+thousands of them.
+
+Events go through Broker, an in-process pub/sub. Views publish once their
+transaction commits, from whatever thread they run in. Each event is encoded
+once and the same bytes are queued for every subscriber. A subscriber
+whose queue holds STREAM['QUEUE_SIZE'] events is a slow consumer. It is
+dropped, and the client reconnects with Last-Event-ID.
+
+Event ids increase across restarts. The last HISTORY events are kept, so a
+client that reconnects with Last-Event-ID is sent the events it missed. A
+client that is too far behind, or that was connected to another process,
+gets a `reset` event instead and should reload /tweets/recent/. Only clients
+of the process that served the write see its events, so the stream needs
+the writes and subscribers in one process, e.g. a single ASGI worker.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+
+DEFAULTS = {
+    'HISTORY': 1000,  # events kept for clients resuming with Last-Event-ID
+    'QUEUE_SIZE': 64,  # events queued for one subscriber before it is dropped
+    'HEARTBEAT': 15,  # seconds between keep-alive comments
+    'RETRY': 2000,  # ms, how long EventSource waits before reconnecting
+}
+
+PATH = '/tweets/stream/'
+
+Message = namedtuple('Message', ['id', 'data'])
+
+
+def get_setting(name):
+    return getattr(settings, 'STREAM', {}).get(name, DEFAULTS[name])
+
+
+def encode(event_id, event, data):
+    payload = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    return f'id: {event_id}\nevent: {event}\ndata: {payload}\n\n'.encode()
+
+
+class Subscriber:
+    """
+    The queue of encoded events of one connection, waited on in its event
+    loop. start is the last event id when it subscribed, later events are
+    the ones not already in its backlog.
+    """
+    __slots__ = ('queue', 'waiter', 'dropped', 'closed', 'start')
+
+    def __init__(self, start=0):
+        self.queue = deque()
+        self.waiter = None
+        self.dropped = False
+        self.closed = False
+        self.start = start
+
+    def push(self, message, limit):
+        # published before it subscribed, but delivered to its loop after
+        if self.dropped or message.id <= self.start:
+            return
+        if len(self.queue) >= limit:
+            self.dropped = True
+            self.queue.clear()
+        else:
+            self.queue.append(message.data)
+        self.wake()
+
+    def close(self):
+        self.closed = True
+        self.wake()
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def wait(self, timeout):
+        """
+        Wait until there is something to send or the subscriber is done, at
+        most timeout seconds.
+        """
+        if self.queue or self.dropped or self.closed:
+            return
+        self.waiter = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self.waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.waiter = None
+
+
+class Broker:
+    """
+    Fan out of events to the subscribers of every event loop in the process.
+    publish() may be called from any thread; subscribers are only touched in
+    their own loop.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.history = deque(maxlen=get_setting('HISTORY'))
+        # microseconds since the epoch, so ids keep increasing after a restart
+        self.last_id = time.time_ns() // 1000
+        self.loops = {}
+
+    def has_subscribers(self):
+        return bool(self.loops)
+
+    def subscribe(self, last_id=None):
+        """
+        Return a new Subscriber of the running loop and the encoded events
+        after last_id, or None when they are no longer all kept.
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            subscriber = Subscriber(self.last_id)
+            backlog = self.since(last_id)
+            self.loops.setdefault(loop, set()).add(subscriber)
+        return subscriber, backlog
+
+    def unsubscribe(self, subscriber):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            subscribers = self.loops.get(loop)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.loops[loop]
+
+    def since(self, last_id):
+        if last_id is None or last_id == self.last_id:
+            return []
+        if last_id > self.last_id or not self.history or last_id < self.history[0].id - 1:
+            return None
+        return [message.data for message in self.history if message.id > last_id]
+
+    def publish(self, event, data):
+        """
+        Send an event to every subscriber. Returns its id.
+        """
+        with self.lock:
+            self.last_id += 1
+            message = Message(self.last_id, encode(self.last_id, event, data))
+            self.history.append(message)
+            # scheduled under the lock, so every loop gets events in id order
+            for loop in list(self.loops):
+                try:
+                    loop.call_soon_threadsafe(self.deliver, loop, message)
+                except RuntimeError:
+                    # the loop was closed without unsubscribing
+                    del self.loops[loop]
+        return message.id
+
+    def deliver(self, loop, message):
+        limit = get_setting('QUEUE_SIZE')
+        for subscriber in self.loops.get(loop, ()):
+            subscriber.push(message, limit)
+
+    def reset(self):
+        with self.lock:
+            self.history = deque(maxlen=get_setting('HISTORY'))
+            self.loops.clear()
+
+
+broker = Broker()
+
+
+def publish_tweets(tweets):
+    """
+    Send `tweet` events for new tweets once the transaction commits.
+    """
+    if not broker.has_subscribers():
+        return
+    from .serializers import TweetSerializer
+
+    data = TweetSerializer(tweets, many=True).data
+
+    def send():
+        for tweet in data:
+            broker.publish('tweet', tweet)
+
+    transaction.on_commit(send)
+
+
+def publish_likes(tweet):
+    """
+    Send a `likes` event with the like count of the tweet once the
+    transaction commits.
+    """
+    if not broker.has_subscribers():
+        return
+    from . import shards
+    from .counters import get_like_buffer
+    from .models import Tweet
+
+    tweets = Tweet.objects.using(shards.tweet_db(tweet))
+
+    def send():
+        likes = tweets.filter(pk=tweet.pk).values_list('likes', flat=True).first()
+        if likes is None:
+            return
+        buffer = get_like_buffer()
+        if buffer is not None:
+            likes += buffer.pending(tweet.uuid)
+        broker.publish('likes', {'uuid': str(tweet.uuid), 'likes': likes})
+
+    transaction.on_commit(send)
+
+
+def parse_last_event_id(scope):
+    for name, value in scope.get('headers', ()):
+        if name == b'last-event-id':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def stream(scope, receive, send):
+    """
+    Serve one subscriber until the client disconnects or is dropped.
+    """
+    subscriber, backlog = broker.subscribe(parse_last_event_id(scope))
+
+    async def listen():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        subscriber.close()
+
+    listener = asyncio.get_running_loop().create_task(listen())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        first = [f'retry: {get_setting("RETRY")}\n\n'.encode()]
+        if backlog is None:
+            first.append(b'event: reset\ndata: {}\n\n')
+        else:
+            first.extend(backlog)
+        await send({'type': 'http.response.body', 'body': b''.join(first), 'more_body': True})
+
+        heartbeat = get_setting('HEARTBEAT')
+        while True:
+            await subscriber.wait(heartbeat)
+            if subscriber.closed:
+                return
+            if subscriber.dropped:
+                # the client reconnects with Last-Event-ID and catches up
+                break
+            if subscriber.queue:
+                body = b''.join(subscriber.queue)
+                subscriber.queue.clear()
+            else:
+                body = b': ping\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        broker.unsubscribe(subscriber)
+        listener.cancel()
+
+
+class StreamApplication:
+    """
+    ASGI application serving PATH, and everything else with application.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != PATH:
+            return await self.application(scope, receive, send)
+        if scope['method'] != 'GET':
+            await send({'type': 'http.response.start', 'status': 405,
+                        'headers': [(b'allow', b'GET'), (b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body',
+                        'body': json.dumps({'detail': f'Method "{scope["method"]}" not allowed.'}).encode()})
+            return
+        await stream(scope, receive, send)
@@ -1,12 +1,48 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Value
+from io import StringIO
+from unittest import mock
 from rest_framework.test import APITestCase
 from rest_framework import status as s
-from uuid import uuid4
+from uuid import uuid4, RFC_4122
 from django.shortcuts import reverse
 from django.contrib.auth import get_user_model
-
-from .models import Tweet
+from django.utils import timezone
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.core.handlers.asgi import ASGIHandler
+from django.urls import resolve
+from asgiref.sync import async_to_sync
+import asyncio
+import datetime as dt
+import csv
+import gzip
+import io
+import json
+import os
+import pstats
+import tempfile
+import time
+import tracemalloc
+
+from speertweet_backend import database, metrics, profiling, routers, slowqueries
+from speertweet_backend.ids import uuid7
+from speertweet_backend.objectcache import ObjectCache, clear_caches, registry
+from speertweet_backend.models import Heartbeat
+from users.models import Follow
+
+from . import counters, export, shards, stream, timeline, trending
+from .management.commands.import_tweets import Command as ImportCommand
+from .caches import load_tweet, load_tweets, tweet_cache
+from .models import Like, TimelineEntry, Tweet, TweetChange
+from .scores import hot_score, score_after
 from .serializers import TweetSerializer
+from .views import TweetDetailAPIView
 
 # Create your tests here.
 
@@ -53,10 +89,11 @@ class TweetListCreateTest(APITestCase):
         res = self.client.get(reverse('tweet_list_create'),
                               HTTP_AUTHORIZATION=f'Bearer {self.token}')
         tweets = TweetSerializer(
-            instance=Tweet.objects.filter(author=self.author), many=True)
+            instance=Tweet.objects.filter(author=self.author).order_by(
+                '-date_created', '-id'), many=True)
 
         self.assertEqual(res.status_code, s.HTTP_200_OK)
-        self.assertListEqual(tweets.data, res.data)
+        self.assertListEqual(tweets.data, res.data['results'])
 
     def test_tweet_list_unauth(self):
         res = self.client.get(reverse('tweet_list_create'))
@@ -70,10 +107,11 @@ class TweetListCreateTest(APITestCase):
         res = self.client.get(reverse('tweet_list_create'),
                               HTTP_AUTHORIZATION=f'Bearer {self.token}')
         tweets = TweetSerializer(
-            instance=Tweet.objects.filter(author=self.author), many=True)
+            instance=Tweet.objects.filter(author=self.author).order_by(
+                '-date_created', '-id'), many=True)
 
         self.assertEqual(res.status_code, s.HTTP_200_OK)
-        self.assertListEqual(tweets.data, res.data)
+        self.assertListEqual(tweets.data, res.data['results'])
 
     def test_create_new_tweet(self):
         res = self.client.post(
@@ -131,6 +169,22 @@ class TweetDetailView(APITestCase):
         self.assertEqual(res.status_code, s.HTTP_200_OK)
         self.assertDictEqual(ps.data, res.data)
 
+    def test_detail_view_404(self):
+        res = self.client.get(reverse('tweet_detail', kwargs={'uuid': uuid4()}))
+        self.assertEqual(res.status_code, s.HTTP_404_NOT_FOUND)
+
+    def test_malformed_uuid(self):
+        for path in ['/tweets/not-a-uuid/', '/tweets/1234/tweet/',
+                     '/tweets/user/not-a-uuid/']:
+            with self.assertNumQueries(0):
+                res = self.client.get(path)
+            self.assertEqual(res.status_code, s.HTTP_404_NOT_FOUND)
+
+    def test_uuid_unique(self):
+        p = Tweet.objects.get(pk=1)
+        with self.assertRaises(IntegrityError):
+            Tweet.objects.create(text='dupe', author=p.author, uuid=p.uuid)
+
     def test_delete_no_user(self):
         p = Tweet.objects.get(pk=1)
         res = self.client.delete(
@@ -168,6 +222,25 @@ class TweetDetailView(APITestCase):
         p = Tweet.objects.get(pk=1)
         self.assertEqual(p.text, 'edited text')
 
+    def test_update_keeps_concurrent_likes(self):
+        p = Tweet.objects.get(pk=1)
+        get_object = TweetDetailAPIView.get_object
+
+        def like_after_read(view):
+            tweet = get_object(view)
+            # committed between the edit reading the tweet and saving it
+            Like.objects.like(User.objects.get(pk=2), Tweet.objects.get(pk=tweet.pk))
+            return tweet
+
+        with mock.patch.object(TweetDetailAPIView, 'get_object', like_after_read):
+            res = self.client.put(reverse('tweet_detail', kwargs={'uuid': p.uuid}),
+                                  data={'text': 'edited text'},
+                                  HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        p.refresh_from_db()
+        self.assertEqual((p.text, p.likes), ('edited text', 1))
+
     def test_update_no_user(self):
         p = Tweet.objects.get(pk=1)
         res = self.client.put(reverse('tweet_detail', kwargs={'uuid': p.uuid}),
@@ -247,6 +320,71 @@ class LikeTweetViewTest(APITestCase):
                               HTTP_AUTHORIZATION=f'Bearer {self.token}')
         self.assertEqual(res.status_code, s.HTTP_404_NOT_FOUND)
 
+    def test_like_twice(self):
+        p = Tweet.objects.get(pk=1)
+        for _ in range(2):
+            res = self.client.put(reverse('like_tweet', kwargs={'uuid': p.uuid}),
+                                  HTTP_AUTHORIZATION=f'Bearer {self.token}')
+            self.assertEqual(res.status_code, s.HTTP_200_OK)
+
+        self.assertEqual(Tweet.objects.get(pk=1).likes, 1)
+        self.assertEqual(Like.objects.filter(tweet=p).count(), 1)
+
+    def test_like_two_users(self):
+        p = Tweet.objects.get(pk=1)
+        for token in (self.token, self.token2):
+            self.client.put(reverse('like_tweet', kwargs={'uuid': p.uuid}),
+                            HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        self.assertEqual(Tweet.objects.get(pk=1).likes, 2)
+
+    def test_unlike(self):
+        p = Tweet.objects.get(pk=1)
+        self.client.put(reverse('like_tweet', kwargs={'uuid': p.uuid}),
+                        HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+        res = self.client.delete(reverse('like_tweet', kwargs={'uuid': p.uuid}),
+                                 HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        self.assertEqual(Tweet.objects.get(pk=1).likes, 0)
+
+        # unliking again does not go negative
+        res = self.client.delete(reverse('like_tweet', kwargs={'uuid': p.uuid}),
+                                 HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        self.assertEqual(Tweet.objects.get(pk=1).likes, 0)
+
+    def test_liked_status(self):
+        p = Tweet.objects.get(pk=1)
+        url = reverse('like_tweet', kwargs={'uuid': p.uuid})
+
+        res = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertFalse(res.data['liked'])
+
+        self.client.put(url, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        res = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertTrue(res.data['liked'])
+
+        res = self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {self.token2}')
+        self.assertFalse(res.data['liked'])
+
+    def test_like_updates_likes_column_only(self):
+        p = Tweet.objects.get(pk=1)
+        user = User.objects.get(pk=2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(Like.objects.like(user, p))
+        updates = [q['sql'] for q in ctx.captured_queries
+                   if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"text"', updates[0])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(Like.objects.unlike(user, p))
+        sql = [q['sql'].split()[0] for q in ctx.captured_queries]
+        self.assertEqual(sql.count('DELETE'), 1)
+        self.assertEqual(sql.count('UPDATE'), 1)
+
 
 
 
@@ -270,17 +408,2368 @@ class UserTweetListAPIViewTest(APITestCase):
         res = self.client.get(
             reverse('get_user_tweets', kwargs={'uuid': self.user.uuid}))
 
-        self.assertDictEqual(tweets.data[0], res.data[0])
-        self.assertDictEqual(tweets.data[1], res.data[1])
-        self.assertDictEqual(tweets.data[2], res.data[2])
+        self.assertDictEqual(tweets.data[0], res.data['results'][0])
+        self.assertDictEqual(tweets.data[1], res.data['results'][1])
+        self.assertDictEqual(tweets.data[2], res.data['results'][2])
 
     def test_no_tweets(self):
         res = self.client.get(
             reverse('get_user_tweets', kwargs={'uuid': self.user2.uuid}))
 
-        self.assertEqual(res.data, [])
+        self.assertEqual(res.data['results'], [])
 
     def test_bad_uuid(self):
         res = self.client.get(
             reverse('get_user_tweets', kwargs={'uuid': uuid4()}))
-        self.assertEqual(res.data, [])
\ No newline at end of file
+        self.assertEqual(res.data['results'], [])
+
+
+class KeysetPaginationTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='test', password='password')
+        # equal timestamps make the id tie-breaker matter
+        now = timezone.now()
+        for i in range(7):
+            t = Tweet.objects.create(text=f'tweet{i}', author=user)
+            Tweet.objects.filter(pk=t.pk).update(
+                date_created=now - dt.timedelta(minutes=i // 2))
+        cls.user = user
+
+    def _walk(self, url):
+        seen = []
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, s.HTTP_200_OK)
+            seen.extend(t['uuid'] for t in res.data['results'])
+            url = res.data['next']
+        return seen
+
+    def test_recent_pages(self):
+        expected = [str(u) for u in Tweet.objects.order_by(
+            '-date_created', '-id').values_list('uuid', flat=True)]
+
+        res = self.client.get(reverse('recent_tweets'), {'page_size': 3})
+        self.assertEqual(len(res.data['results']), 3)
+        self.assertIsNone(res.data['previous'])
+        self.assertIsNotNone(res.data['next'])
+
+        self.assertListEqual(expected, self._walk(
+            reverse('recent_tweets') + '?page_size=3'))
+
+    def test_user_tweets_pages(self):
+        expected = [str(u) for u in Tweet.objects.order_by(
+            '-date_created', '-id').values_list('uuid', flat=True)]
+        url = reverse('get_user_tweets', kwargs={'uuid': self.user.uuid})
+
+        self.assertListEqual(expected, self._walk(url + '?page_size=2'))
+
+    def test_previous_page(self):
+        first = self.client.get(reverse('recent_tweets'), {'page_size': 3})
+        second = self.client.get(first.data['next'])
+        self.assertIsNotNone(second.data['previous'])
+
+        back = self.client.get(second.data['previous'])
+        self.assertListEqual(first.data['results'], back.data['results'])
+        self.assertIsNone(back.data['previous'])
+
+    def test_last_page(self):
+        res = self.client.get(reverse('recent_tweets'), {'page_size': 7})
+        self.assertEqual(len(res.data['results']), 7)
+        self.assertIsNone(res.data['next'])
+
+    def test_invalid_cursor(self):
+        res = self.client.get(reverse('recent_tweets'), {'cursor': 'garbage'})
+        self.assertEqual(res.status_code, s.HTTP_404_NOT_FOUND)
+
+class TweetQueryCountTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test', password='password')
+        for i in range(20):
+            author = User.objects.create_user(
+                username=f'author{i}', password='password')
+            Tweet.objects.create(text=f'tweet{i}', author=author)
+            Tweet.objects.create(text=f'tweet{i}', author=cls.user)
+
+    def setUp(self):
+        res = self.client.post(reverse('token_login'), data={
+            'username': 'test',
+            'password': 'password',
+        })
+        self.token = res.data.get('access')
+
+    def test_recent_single_query(self):
+        with self.assertNumQueries(1):
+            res = self.client.get(reverse('recent_tweets'))
+        self.assertEqual(len(res.data['results']), 40)
+
+    def test_user_tweets_single_query(self):
+        with self.assertNumQueries(1):
+            res = self.client.get(
+                reverse('get_user_tweets', kwargs={'uuid': self.user.uuid}))
+        self.assertEqual(len(res.data['results']), 20)
+
+    def test_own_tweets_queries(self):
+        # one query to authenticate and one for the page
+        with self.assertNumQueries(2):
+            res = self.client.get(reverse('tweet_list_create'),
+                                  HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(len(res.data['results']), 20)
+
+    def test_detail_single_query(self):
+        p = Tweet.objects.first()
+        with self.assertNumQueries(1):
+            res = self.client.get(reverse('tweet_detail', kwargs={'uuid': p.uuid}))
+        self.assertEqual(res.data['author'], p.author.username)
+
+    def test_list_matches_serializer(self):
+        qs = Tweet.objects.select_related('author').order_by('-date_created', '-id')
+        expected = [TweetSerializer(instance=t).data for t in qs]
+
+        res = self.client.get(reverse('recent_tweets'))
+        self.assertListEqual(expected, res.data['results'])
+
+
+@override_settings(LIKE_BUFFER={'ENABLED': True, 'FLUSH_INTERVAL': 0,
+                                'MAX_PENDING': 3})
+class LikeCounterBufferTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='test', password='password')
+        for i in range(5):
+            Tweet.objects.create(text=f'tweet{i}', author=user)
+        for i in range(3):
+            User.objects.create_user(username=f'fan{i}', password='password')
+
+    def setUp(self):
+        counters._buffer = None
+        self.buffer = counters.get_like_buffer()
+        self.fans = list(User.objects.filter(username__startswith='fan'))
+
+    def tearDown(self):
+        counters._buffer = None
+
+    def _like(self, user, tweet):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.like(user, tweet)
+
+    def test_likes_are_buffered(self):
+        p = Tweet.objects.get(pk=1)
+        for fan in self.fans:
+            self._like(fan, p)
+
+        self.assertEqual(Tweet.objects.get(pk=1).likes, 0)
+        self.assertEqual(self.buffer.pending(p.uuid), 3)
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(Tweet.objects.get(pk=1).likes, 3)
+        self.assertEqual(self.buffer.pending(p.uuid), 0)
+
+    def test_background_flush_closes_its_connections(self):
+        p = Tweet.objects.get(pk=1)
+        self._like(self.fans[0], p)
+        with mock.patch.object(counters.connections, 'close_all') as close_all:
+            self.buffer._flush_in_background()
+        close_all.assert_called_once_with()
+        self.assertEqual(Tweet.objects.get(pk=1).likes, 1)
+
+    def test_reads_include_pending(self):
+        p = Tweet.objects.get(pk=1)
+        self._like(self.fans[0], p)
+
+        res = self.client.get(reverse('tweet_detail', kwargs={'uuid': p.uuid}))
+        self.assertEqual(res.data['likes'], 1)
+
+        res = self.client.get(reverse('recent_tweets'))
+        likes = {t['uuid']: t['likes'] for t in res.data['results']}
+        self.assertEqual(likes[str(p.uuid)], 1)
+
+    def test_unlike_is_buffered(self):
+        p = Tweet.objects.get(pk=1)
+        self._like(self.fans[0], p)
+        self.buffer.flush()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.unlike(self.fans[0], p)
+        self.assertEqual(self.buffer.pending(p.uuid), -1)
+        self.buffer.flush()
+        self.assertEqual(Tweet.objects.get(pk=1).likes, 0)
+
+    def test_flush_when_full(self):
+        tweets = list(Tweet.objects.order_by('pk')[:3])
+        for tweet in tweets:
+            self._like(self.fans[0], tweet)
+
+        for tweet in tweets:
+            tweet.refresh_from_db()
+            self.assertEqual(tweet.likes, 1)
+            self.assertEqual(self.buffer.pending(tweet.uuid), 0)
+
+    def test_failed_flush_is_retried(self):
+        p = Tweet.objects.get(pk=1)
+        self._like(self.fans[0], p)
+
+        with mock.patch.object(self.buffer, '_write', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.pending(p.uuid), 1)
+
+        self.buffer.flush()
+        self.assertEqual(Tweet.objects.get(pk=1).likes, 1)
+
+    def test_reconcile_likes(self):
+        p = Tweet.objects.get(pk=1)
+        for fan in self.fans:
+            self._like(fan, p)
+        # a crash loses the buffered counts
+        counters._buffer = None
+
+        call_command('reconcile_likes', stdout=StringIO())
+        self.assertEqual(Tweet.objects.get(pk=1).likes, 3)
+
+    def test_reconcile_tweets_without_likes(self):
+        Tweet.objects.filter(pk=2).update(likes=7, score=score_after(Value(7)))
+        call_command('reconcile_likes', '--keep-unliked', stdout=StringIO())
+        self.assertEqual(Tweet.objects.get(pk=2).likes, 7)
+
+        out = StringIO()
+        call_command('reconcile_likes', stdout=out)
+        tweet = Tweet.objects.get(pk=2)
+        self.assertEqual(tweet.likes, 0)
+        self.assertAlmostEqual(tweet.score, hot_score(0, tweet.date_created))
+        self.assertEqual(out.getvalue().strip(), 'Recounted likes of 1 tweets')
+
+    def test_pending_cleared_with_the_commit(self):
+        p = Tweet.objects.get(pk=1)
+        self._like(self.fans[0], p)
+        seen = []
+
+        def write(batch, tweets):
+            # what a reader sees while the flush is being written
+            seen.append(self.buffer.pending(p.uuid))
+            return written(batch, tweets)
+
+        written = self.buffer._write
+        with mock.patch.object(self.buffer, '_write', write):
+            self.buffer.flush()
+        self.assertEqual(seen, [1])
+        self.assertEqual(self.buffer.pending(p.uuid), 0)
+        self.assertEqual(Tweet.objects.get(pk=1).likes, 1)
+
+
+class UUID7Test(TestCase):
+
+    def test_version_and_variant(self):
+        u = uuid7()
+        self.assertEqual(u.version, 7)
+        self.assertEqual(u.variant, RFC_4122)
+
+    def test_ids_increase(self):
+        ids = [uuid7() for _ in range(10000)]
+        self.assertListEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_new_rows_use_uuid7(self):
+        user = User.objects.create_user(username='test', password='password')
+        tweet = Tweet.objects.create(text='tweet', author=user)
+        self.assertEqual(user.uuid.version, 7)
+        self.assertEqual(tweet.uuid.version, 7)
+
+
+class HomeTimelineTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='password')
+        self.friend = User.objects.create_user(username='friend', password='password')
+        self.stranger = User.objects.create_user(username='stranger', password='password')
+        self.token = self._login('test')
+
+    def _login(self, username):
+        res = self.client.post(reverse('token_login'), data={
+            'username': username,
+            'password': 'password',
+        })
+        return res.data['access']
+
+    def _tweet(self, token, text):
+        res = self.client.post(reverse('tweet_list_create'), data={'text': text},
+                               HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(res.status_code, s.HTTP_201_CREATED)
+        return res.data['uuid']
+
+    def _home(self, **params):
+        res = self.client.get(reverse('home_timeline'), params,
+                              HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        return res
+
+    def _walk(self, page_size):
+        seen = []
+        res = self._home(page_size=page_size)
+        while True:
+            seen.extend(t['text'] for t in res.data['results'])
+            if not res.data['next']:
+                return seen
+            res = self.client.get(res.data['next'],
+                                  HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_fan_out(self):
+        Follow.objects.follow(self.user, self.friend)
+        friend_token = self._login('friend')
+        self._tweet(friend_token, 'from friend')
+        self._tweet(self._login('stranger'), 'from stranger')
+        self._tweet(self.token, 'my own')
+
+        texts = [t['text'] for t in self._home().data['results']]
+        self.assertListEqual(['my own', 'from friend'], texts)
+
+    def test_backfill_and_unfollow(self):
+        friend_token = self._login('friend')
+        self._tweet(friend_token, 'old tweet')
+
+        Follow.objects.follow(self.user, self.friend)
+        texts = [t['text'] for t in self._home().data['results']]
+        self.assertListEqual(['old tweet'], texts)
+
+        Follow.objects.unfollow(self.user, self.friend)
+        self.assertListEqual([], self._home().data['results'])
+
+    @override_settings(TIMELINE={'FANOUT_LIMIT': 2})
+    def test_merge_on_read(self):
+        # friend has too many followers to fan out, stranger does not
+        fan = User.objects.create_user(username='fan', password='password')
+        Follow.objects.follow(fan, self.friend)
+        Follow.objects.follow(self.user, self.friend)
+        Follow.objects.follow(self.user, self.stranger)
+
+        friend_token = self._login('friend')
+        stranger_token = self._login('stranger')
+        expected = []
+        for i in range(4):
+            self._tweet(friend_token, f'friend {i}')
+            self._tweet(stranger_token, f'stranger {i}')
+            expected[:0] = [f'stranger {i}', f'friend {i}']
+
+        self.assertFalse(TimelineEntry.objects.filter(
+            owner=self.user, tweet__author=self.friend).exists())
+        self.assertListEqual(expected, self._walk(page_size=3))
+
+    @override_settings(TIMELINE={'FANOUT_LIMIT': 2})
+    def test_crossing_the_limit(self):
+        fan = User.objects.create_user(username='fan', password='password')
+        Follow.objects.follow(self.user, self.friend)
+        friend_token = self._login('friend')
+        self._tweet(friend_token, 'fanned out')
+
+        # above the limit, the fanned out tweet is not shown twice
+        Follow.objects.follow(fan, self.friend)
+        self._tweet(friend_token, 'merged')
+        self.assertListEqual(['merged', 'fanned out'], self._walk(page_size=1))
+
+        # below it again, the merged tweet is copied into the timeline
+        Follow.objects.unfollow(fan, self.friend)
+        self.assertTrue(TimelineEntry.objects.filter(
+            owner=self.user, tweet__text='merged').exists())
+        self._tweet(friend_token, 'fanned out again')
+        self.assertListEqual(['fanned out again', 'merged', 'fanned out'],
+                             self._walk(page_size=2))
+
+    def test_pages(self):
+        Follow.objects.follow(self.user, self.friend)
+        friend_token = self._login('friend')
+        for i in range(5):
+            self._tweet(friend_token, f'tweet {i}')
+
+        self.assertListEqual([f'tweet {i}' for i in reversed(range(5))],
+                             self._walk(page_size=2))
+
+    def test_home_queries(self):
+        Follow.objects.follow(self.user, self.friend)
+        friend_token = self._login('friend')
+        for i in range(5):
+            self._tweet(friend_token, f'tweet {i}')
+
+        # authenticate, followed authors to merge, timeline page, tweets
+        with self.assertNumQueries(4):
+            self._home()
+
+    def test_home_unauth(self):
+        res = self.client.get(reverse('home_timeline'))
+        self.assertEqual(res.status_code, s.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(OBJECT_CACHE={'SINGLE_PROCESS': True})
+class TweetCacheTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='test', password='password')
+        Tweet.objects.create(text='tweet1', author=user)
+        User.objects.create_user(username='test2', password='password')
+
+    def setUp(self):
+        clear_caches()
+        tweet_cache.hits = tweet_cache.misses = 0
+        self.tweet = Tweet.objects.get(pk=1)
+        self.url = reverse('tweet_detail', kwargs={'uuid': self.tweet.uuid})
+        res = self.client.post(reverse('token_login'), data={
+            'username': 'test',
+            'password': 'password',
+        })
+        self.token = res.data.get('access')
+
+    def test_detail_cached(self):
+        res = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+
+        self.assertDictEqual(res.data, cached.data)
+        self.assertEqual(tweet_cache.stats()['hits'], 1)
+        self.assertEqual(tweet_cache.stats()['misses'], 1)
+
+    def test_off_without_shared_tier(self):
+        # other workers would keep serving what this one invalidates
+        with self.settings(OBJECT_CACHE={}):
+            self.client.get(self.url)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(self.url)
+        self.assertTrue(queries.captured_queries)
+        self.assertEqual(tweet_cache.stats()['hits'], 0)
+
+    def test_update_not_stale(self):
+        self.client.get(self.url)
+        self.client.put(self.url, data={'text': 'edited text'},
+                        HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+        self.assertEqual(self.client.get(self.url).data['text'], 'edited text')
+
+    def test_delete_not_stale(self):
+        self.client.get(self.url)
+        self.client.delete(self.url, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+        self.assertEqual(self.client.get(self.url).status_code, s.HTTP_404_NOT_FOUND)
+
+    def test_like_not_stale(self):
+        self.client.get(self.url)
+        like_url = reverse('like_tweet', kwargs={'uuid': self.tweet.uuid})
+
+        self.client.put(like_url, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(self.client.get(self.url).data['likes'], 1)
+
+        self.client.delete(like_url, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(self.client.get(self.url).data['likes'], 0)
+
+    @override_settings(LIKE_BUFFER={'ENABLED': True, 'FLUSH_INTERVAL': 0})
+    def test_buffered_like_not_stale(self):
+        counters._buffer = None
+        self.addCleanup(setattr, counters, '_buffer', None)
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.like(User.objects.get(pk=2), self.tweet)
+        self.assertEqual(self.client.get(self.url).data['likes'], 1)
+
+        counters.get_like_buffer().flush()
+        self.assertEqual(self.client.get(self.url).data['likes'], 1)
+
+    def test_negative_entry(self):
+        uuid = uuid7()
+        url = reverse('tweet_detail', kwargs={'uuid': uuid})
+        self.assertEqual(self.client.get(url).status_code, s.HTTP_404_NOT_FOUND)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, s.HTTP_404_NOT_FOUND)
+
+        # creating the tweet replaces the negative entry
+        Tweet.objects.create(text='late', author=self.tweet.author, uuid=uuid)
+        self.assertEqual(self.client.get(url).status_code, s.HTTP_200_OK)
+
+    @override_settings(OBJECT_CACHE={'SINGLE_PROCESS': True, 'NEGATIVE_TTL': 0})
+    def test_negative_entry_expires(self):
+        url = reverse('tweet_detail', kwargs={'uuid': uuid7()})
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_author_rename_not_stale(self):
+        self.client.get(self.url)
+        author = self.tweet.author
+        author.username = 'renamed'
+        author.save()
+
+        self.assertEqual(self.client.get(self.url).data['author'], 'renamed')
+
+    @override_settings(
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                       'LOCATION': 'shared'},
+        },
+        OBJECT_CACHE={'SHARED_CACHE': 'shared'})
+    def test_shared_tier_versions(self):
+        # two workers, each with its own in process tier
+        worker1 = ObjectCache('worker-test', load_tweet)
+        worker2 = ObjectCache('worker-test', load_tweet)
+        self.assertEqual(worker1.get(self.tweet.uuid)['text'], 'tweet1')
+        self.assertEqual(worker2.get(self.tweet.uuid)['text'], 'tweet1')
+        self.assertEqual(worker2.hits, 1)
+
+        Tweet.objects.filter(pk=1).update(text='edited')
+        worker2.invalidate(self.tweet.uuid)
+
+        # worker1 still holds the old version in process but must not serve it
+        self.assertEqual(worker1.get(self.tweet.uuid)['text'], 'edited')
+        registry.pop('worker-test')
+
+    @override_settings(
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                       'LOCATION': 'shared-many'},
+        },
+        OBJECT_CACHE={'SHARED_CACHE': 'shared'})
+    def test_shared_tier_get_many(self):
+        worker1 = ObjectCache('worker-many', load_tweet, load_tweets)
+        worker2 = ObjectCache('worker-many', load_tweet, load_tweets)
+        self.addCleanup(registry.pop, 'worker-many')
+        missing = str(uuid7())
+        keys = [str(self.tweet.uuid), missing]
+
+        self.assertEqual(worker1.get_many(keys)[missing], None)
+        with self.assertNumQueries(0):
+            found = worker2.get_many(keys)
+        self.assertEqual(found[keys[0]]['text'], 'tweet1')
+
+        Tweet.objects.filter(pk=1).update(text='edited')
+        worker2.invalidate(self.tweet.uuid)
+        self.assertEqual(worker1.get_many(keys)[keys[0]]['text'], 'edited')
+
+
+@override_settings(OBJECT_CACHE={'SINGLE_PROCESS': True})
+class ConditionalGetTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test', password='password')
+        cls.fan = User.objects.create_user(username='fan', password='password')
+        cls.tweets = [Tweet.objects.create(text=f'tweet{i}', author=cls.user)
+                      for i in range(3)]
+
+    def setUp(self):
+        clear_caches()
+        self.recent = reverse('recent_tweets')
+        self.detail = reverse('tweet_detail', kwargs={'uuid': self.tweets[0].uuid})
+
+    def revalidate(self, url, res):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+
+    def test_feed_not_modified(self):
+        res = self.client.get(self.recent)
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+
+        # the page query only, nothing is serialized
+        with self.assertNumQueries(1):
+            cached = self.revalidate(self.recent, res)
+        self.assertEqual(cached.status_code, s.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cached['ETag'], res['ETag'])
+        self.assertEqual(cached.content, b'')
+
+    def test_feed_changes(self):
+        changes = [
+            lambda: Like.objects.like(self.fan, self.tweets[1]),
+            lambda: Tweet.objects.create(text='new', author=self.user),
+            lambda: self.tweets[2].delete(),
+            lambda: User.objects.filter(pk=self.user.pk).update(username='renamed'),
+        ]
+        for change in changes:
+            res = self.client.get(self.recent)
+            change()
+            self.assertEqual(self.revalidate(self.recent, res).status_code, s.HTTP_200_OK)
+
+    def test_feed_edit(self):
+        res = self.client.get(self.recent)
+        tweet = Tweet.objects.get(pk=self.tweets[1].pk)
+        tweet.text = 'edited'
+        tweet.save()
+
+        self.assertEqual(self.revalidate(self.recent, res).status_code, s.HTTP_200_OK)
+
+    def test_pages_differ(self):
+        first = self.client.get(self.recent, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(
+            self.revalidate(first.data['next'], second).status_code,
+            s.HTTP_304_NOT_MODIFIED)
+
+    def test_user_feed_not_modified(self):
+        url = reverse('get_user_tweets', kwargs={'uuid': self.user.uuid})
+        res = self.client.get(url)
+        self.assertEqual(self.revalidate(url, res).status_code, s.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_not_modified(self):
+        res = self.client.get(self.detail)
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(0):
+            cached = self.revalidate(self.detail, res)
+        self.assertEqual(cached.status_code, s.HTTP_304_NOT_MODIFIED)
+
+        cached = self.client.get(
+            self.detail, HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(cached.status_code, s.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_like_changes(self):
+        res = self.client.get(self.detail)
+        Like.objects.like(self.fan, self.tweets[0])
+        changed = self.revalidate(self.detail, res)
+
+        self.assertEqual(changed.status_code, s.HTTP_200_OK)
+        self.assertEqual(changed.data['likes'], 1)
+        self.assertNotEqual(changed['ETag'], res['ETag'])
+
+    @override_settings(LIKE_BUFFER={'ENABLED': True, 'FLUSH_INTERVAL': 0})
+    def test_buffered_like_changes(self):
+        counters._buffer = None
+        self.addCleanup(setattr, counters, '_buffer', None)
+        res = self.client.get(self.detail)
+        feed = self.client.get(self.recent)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.like(self.fan, self.tweets[0])
+
+        changed = self.revalidate(self.detail, res)
+        self.assertEqual(changed.status_code, s.HTTP_200_OK)
+        self.assertNotIn('Last-Modified', changed)
+        self.assertEqual(self.revalidate(self.recent, feed).status_code, s.HTTP_200_OK)
+
+        # once flushed the count is in the row and Last-Modified is sent again
+        counters.get_like_buffer().flush()
+        flushed = self.revalidate(self.detail, changed)
+        self.assertEqual(flushed.data['likes'], 1)
+        self.assertIn('Last-Modified', flushed)
+
+
+class SearchTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test', password='password')
+        cls.tweets = [
+            Tweet.objects.create(text=text, author=cls.user) for text in [
+                'Django full text search',
+                'searching with sqlite',
+                'nothing to see here',
+                'search search search',
+            ]
+        ]
+
+    def search(self, query, **params):
+        return self.client.get(reverse('search_tweets'), {'q': query, **params})
+
+    def texts(self, res):
+        return [tweet['text'] for tweet in res.data['results']]
+
+    def test_search_ranked(self):
+        res = self.search('search')
+
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        # porter stemming matches searching, the most mentions rank first
+        self.assertEqual(self.texts(res)[0], 'search search search')
+        self.assertCountEqual(self.texts(res), [
+            'Django full text search', 'searching with sqlite', 'search search search'])
+        self.assertEqual(set(res.data['results'][0]), {
+            'uuid', 'text', 'author', 'likes', 'date_created'})
+
+    def test_all_words_match(self):
+        self.assertEqual(self.texts(self.search('django SEARCH')), ['Django full text search'])
+        self.assertEqual(self.texts(self.search('django sqlite')), [])
+
+    def test_query_syntax_ignored(self):
+        res = self.search('"search" OR NOT* (')
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        self.assertEqual(self.texts(self.search('!!!')), [])
+
+    def test_query_required(self):
+        self.assertEqual(self.search('  ').status_code, s.HTTP_400_BAD_REQUEST)
+
+    def test_index_follows_writes(self):
+        tweet = Tweet.objects.create(text='brand new words', author=self.user)
+        self.assertEqual(self.texts(self.search('brand')), ['brand new words'])
+
+        tweet.text = 'edited words'
+        tweet.save()
+        self.assertEqual(self.texts(self.search('brand')), [])
+        self.assertEqual(self.texts(self.search('edited')), ['edited words'])
+
+        tweet.delete()
+        self.assertEqual(self.texts(self.search('edited')), [])
+
+    def test_pages(self):
+        first = self.search('search', page_size=2)
+        second = self.client.get(first.data['next'])
+
+        self.assertEqual(len(first.data['results']), 2)
+        self.assertEqual(
+            self.texts(first) + self.texts(second), self.texts(self.search('search')))
+        self.assertIsNone(second.data['next'])
+
+        previous = self.client.get(second.data['previous'])
+        self.assertEqual(self.texts(previous), self.texts(first))
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM tweets_tweet_fts')
+            cursor.execute('DROP TRIGGER tweets_tweet_fts_insert')
+            cursor.execute(
+                "INSERT INTO tweets_tweet_fts (rowid, text) VALUES (9999, 'search ghost')")
+        self.assertEqual(self.texts(self.search('sqlite')), [])
+
+        out = StringIO()
+        call_command('rebuild_search_index', batch_size=2, stdout=out)
+
+        self.assertIn('Indexed 4 tweets', out.getvalue())
+        self.assertEqual(self.texts(self.search('sqlite')), ['searching with sqlite'])
+        self.assertEqual(len(self.texts(self.search('search'))), 3)
+        # the triggers are back
+        Tweet.objects.create(text='after rebuild', author=self.user)
+        self.assertEqual(self.texts(self.search('rebuild')), ['after rebuild'])
+
+
+class BulkTweetCreateTest(APITestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='test', password='password')
+        self.follower = User.objects.create_user(username='fan', password='password')
+        Follow.objects.follow(self.follower, self.author)
+        res = self.client.post(reverse('token_login'), data={
+            'username': 'test',
+            'password': 'password',
+        })
+        self.token = res.data.get('access')
+        self.url = reverse('bulk_create_tweets')
+
+    def post(self, data):
+        return self.client.post(self.url, data=data, format='json',
+                                HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_bulk_create(self):
+        data = [{'text': f'scheduled {i}'} for i in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            res = self.post(data)
+
+        self.assertEqual(res.status_code, s.HTTP_201_CREATED)
+        self.assertEqual([r['status'] for r in res.data], [201] * 5)
+        tweets = [r['tweet'] for r in res.data]
+        self.assertEqual([t['text'] for t in tweets], [t['text'] for t in data])
+        self.assertTrue(all(t['author'] == 'test' for t in tweets))
+        self.assertEqual(
+            Tweet.objects.filter(author=self.author).count(), 5)
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "tweets_tweet"')]
+        self.assertEqual(len(inserts), 1)
+
+        # fanned out like single tweets
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.follower).count(), 5)
+        detail = self.client.get(
+            reverse('tweet_detail', kwargs={'uuid': tweets[0]['uuid']}))
+        self.assertEqual(detail.data['text'], 'scheduled 0')
+
+    def test_invalid_items(self):
+        res = self.post([{'text': 'fine'}, {'text': 'x' * 251}, {}, {'text': 'also fine'}])
+
+        self.assertEqual(res.status_code, s.HTTP_207_MULTI_STATUS)
+        self.assertEqual([r['status'] for r in res.data], [201, 400, 400, 201])
+        self.assertEqual([res.data[0]['tweet']['text'], res.data[3]['tweet']['text']],
+                         ['fine', 'also fine'])
+        self.assertIn('text', res.data[1]['errors'])
+        self.assertIn('text', res.data[2]['errors'])
+        self.assertEqual(sorted(Tweet.objects.values_list('text', flat=True)),
+                         ['also fine', 'fine'])
+
+    def test_no_valid_item(self):
+        res = self.post([{'text': 'x' * 251}, {}])
+
+        self.assertEqual(res.status_code, s.HTTP_400_BAD_REQUEST)
+        self.assertEqual([r['status'] for r in res.data], [400, 400])
+        self.assertIn('text', res.data[0]['errors'])
+        self.assertFalse(Tweet.objects.exists())
+
+    def test_limits(self):
+        self.assertEqual(self.post([]).status_code, s.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.post({'text': 'not a list'}).status_code,
+                         s.HTTP_400_BAD_REQUEST)
+
+        res = self.post([{'text': 'too many'}] * 101)
+        self.assertEqual(res.status_code, s.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Tweet.objects.exists())
+
+    def test_unauth(self):
+        res = self.client.post(self.url, data=[{'text': 'hi'}], format='json')
+        self.assertEqual(res.status_code, s.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(OBJECT_CACHE={'SINGLE_PROCESS': True})
+class TweetBatchTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test', password='password')
+        cls.tweets = [Tweet.objects.create(text=f'tweet{i}', author=cls.user)
+                      for i in range(4)]
+
+    def setUp(self):
+        clear_caches()
+        self.url = reverse('batch_tweets')
+
+    def get(self, ids):
+        return self.client.get(self.url, {'ids': ','.join(str(i) for i in ids)})
+
+    def test_request_order(self):
+        ids = [self.tweets[2].uuid, self.tweets[0].uuid, self.tweets[3].uuid]
+        with self.assertNumQueries(1):
+            res = self.get(ids)
+
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        self.assertEqual([t['text'] for t in res.data['results']],
+                         ['tweet2', 'tweet0', 'tweet3'])
+        self.assertEqual(res.data['missing'], [])
+        self.assertEqual(
+            res.data['results'][0],
+            self.client.get(reverse('tweet_detail', kwargs={'uuid': ids[0]})).data)
+
+    def test_missing(self):
+        missing = uuid7()
+        res = self.get([self.tweets[0].uuid, missing, self.tweets[1].uuid])
+
+        self.assertEqual(res.data['results'][1], None)
+        self.assertEqual(res.data['missing'], [str(missing)])
+        self.assertEqual(res.data['results'][2]['text'], 'tweet1')
+
+    def test_only_misses_loaded(self):
+        self.client.get(reverse('tweet_detail', kwargs={'uuid': self.tweets[0].uuid}))
+        self.get([self.tweets[1].uuid])
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.get([t.uuid for t in self.tweets])
+        # one IN query for the two tweets not cached yet
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        self.assertIn(self.tweets[2].uuid.hex, sql)
+        self.assertIn(self.tweets[3].uuid.hex, sql)
+        self.assertNotIn(self.tweets[0].uuid.hex, sql)
+        self.assertEqual(len(res.data['results']), 4)
+
+        with self.assertNumQueries(0):
+            self.get([t.uuid for t in self.tweets])
+
+    def test_not_stale(self):
+        self.get([self.tweets[0].uuid])
+        self.tweets[0].text = 'edited'
+        self.tweets[0].save()
+
+        self.assertEqual(self.get([self.tweets[0].uuid]).data['results'][0]['text'], 'edited')
+
+    def test_post(self):
+        ids = [str(t.uuid) for t in reversed(self.tweets)]
+        res = self.client.post(self.url, data={'ids': ids}, format='json')
+
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        self.assertEqual([t['text'] for t in res.data['results']],
+                         ['tweet3', 'tweet2', 'tweet1', 'tweet0'])
+
+    def test_not_modified(self):
+        res = self.get([self.tweets[0].uuid, uuid7()])
+        cached = self.client.get(
+            self.url, {'ids': res.wsgi_request.GET['ids']}, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(cached.status_code, s.HTTP_304_NOT_MODIFIED)
+
+    def test_invalid(self):
+        self.assertEqual(self.get([]).status_code, s.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get(['not-a-uuid']).status_code, s.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get([uuid7() for _ in range(501)]).status_code,
+                         s.HTTP_400_BAD_REQUEST)
+        res = self.client.post(self.url, data={'ids': 'nope'}, format='json')
+        self.assertEqual(res.status_code, s.HTTP_400_BAD_REQUEST)
+
+
+class TrendingTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='test', password='password')
+        cls.fans = [User(username=f'fan{i}', password='!') for i in range(10)]
+        User.objects.bulk_create(cls.fans)
+        cls.fans = list(User.objects.filter(username__startswith='fan'))
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('trending_tweets')
+
+    def create(self, text, hours_ago=0):
+        tweet = Tweet.objects.create(text=text, author=self.author)
+        if hours_ago:
+            Tweet.objects.filter(pk=tweet.pk).update(
+                date_created=tweet.date_created - dt.timedelta(hours=hours_ago))
+            trending.rollup()
+        return Tweet.objects.get(pk=tweet.pk)
+
+    def like(self, tweet, count):
+        for fan in self.fans[:count]:
+            Like.objects.like(fan, tweet)
+        return Tweet.objects.get(pk=tweet.pk)
+
+    def test_new_tweet_score(self):
+        tweet = self.create('new')
+        self.assertAlmostEqual(tweet.score, hot_score(0, tweet.date_created), places=3)
+
+    def test_backdated_tweet_score(self):
+        created = timezone.now() - dt.timedelta(days=3)
+        tweet = Tweet.objects.create(text='old', author=self.author, date_created=created)
+        Tweet.objects.bulk_create([Tweet(text='older', author=self.author, likes=5,
+                                         date_created=created)])
+
+        self.assertAlmostEqual(tweet.score, hot_score(0, created))
+        self.assertAlmostEqual(Tweet.objects.get(text='older').score, hot_score(5, created))
+
+    def test_score_follows_likes(self):
+        tweet = self.like(self.create('liked'), 10)
+        self.assertAlmostEqual(tweet.score, hot_score(10, tweet.date_created))
+
+        Like.objects.unlike(self.fans[0], tweet)
+        tweet = Tweet.objects.get(pk=tweet.pk)
+        self.assertAlmostEqual(tweet.score, hot_score(9, tweet.date_created))
+
+    @override_settings(LIKE_BUFFER={'ENABLED': True, 'FLUSH_INTERVAL': 0})
+    def test_buffered_score(self):
+        counters._buffer = None
+        self.addCleanup(setattr, counters, '_buffer', None)
+        tweet = self.create('buffered')
+        with self.captureOnCommitCallbacks(execute=True):
+            for fan in self.fans:
+                Like.objects.like(fan, tweet)
+        counters.get_like_buffer().flush()
+
+        tweet = Tweet.objects.get(pk=tweet.pk)
+        self.assertAlmostEqual(tweet.score, hot_score(10, tweet.date_created))
+
+    def test_ranking(self):
+        # ten times the likes outweigh 12.5 hours of age
+        popular = self.like(self.create('popular', hours_ago=6), 10)
+        self.create('fresh')
+        self.like(self.create('older', hours_ago=20), 10)
+        self.like(self.create('too old', hours_ago=24 * 3), 10)
+
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        self.assertEqual([t['text'] for t in res.data['results']],
+                         ['popular', 'fresh', 'older'])
+        self.assertEqual(res.data['results'][0]['likes'], popular.likes)
+
+    @override_settings(TRENDING={'SIZE': 2})
+    def test_size(self):
+        for i in range(3):
+            self.create(f'tweet{i}')
+        self.assertEqual(len(self.client.get(self.url).data['results']), 2)
+
+    def test_cached(self):
+        self.create('first')
+        self.client.get(self.url)
+        self.create('second')
+
+        with self.assertNumQueries(0):
+            res = self.client.get(self.url)
+        self.assertEqual([t['text'] for t in res.data['results']], ['first'])
+
+        cache.clear()
+        self.assertEqual(len(self.client.get(self.url).data['results']), 2)
+
+    def test_rollup(self):
+        tweet = self.create('drifted')
+        Tweet.objects.filter(pk=tweet.pk).update(likes=100, score=0)
+
+        out = StringIO()
+        call_command('rollup_trending', stdout=out)
+
+        self.assertIn('Rescored 1 tweets', out.getvalue())
+        tweet = Tweet.objects.get(pk=tweet.pk)
+        self.assertAlmostEqual(tweet.score, hot_score(100, tweet.date_created))
+
+    @override_settings(TRENDING={'BATCH_SIZE': 2})
+    def test_rollup_batches(self):
+        created = timezone.now()
+        Tweet.objects.bulk_create(
+            Tweet(text=f'tweet{i}', author=self.author, likes=i, score=0)
+            for i in range(5))
+        Tweet.objects.update(date_created=created)
+
+        self.assertEqual(trending.rollup(), 5)
+        for tweet in Tweet.objects.all():
+            self.assertAlmostEqual(tweet.score, hot_score(tweet.likes, created))
+
+
+class ExportTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test', password='password')
+        cls.tweets = [Tweet.objects.create(text=f'tweet, "{i}"\nline', author=cls.user)
+                      for i in range(3)]
+        other = User.objects.create_user(username='other', password='password')
+        Tweet.objects.create(text='not exported', author=other)
+
+    def export(self, **kwargs):
+        return self.client.get(
+            reverse('export_user_tweets', kwargs={'uuid': self.user.uuid}), **kwargs)
+
+    def expected(self):
+        return TweetSerializer(Tweet.objects.filter(author=self.user).order_by('id'), many=True).data
+
+    def test_ndjson(self):
+        res = self.export()
+
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        self.assertIn('test.ndjson', res['Content-Disposition'])
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.expected())
+
+    def test_csv(self):
+        res = self.export(data={'output': 'csv'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        content = b''.join(res.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row['text'] for row in rows], [t['text'] for t in self.expected()])
+        self.assertEqual(rows[0]['uuid'], str(self.tweets[0].uuid))
+
+    def test_gzip(self):
+        res = self.export(HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res['Vary'])
+        content = gzip.decompress(b''.join(res.streaming_content)).decode()
+        self.assertEqual(len(content.splitlines()), 3)
+
+    def test_invalid(self):
+        self.assertEqual(self.export(data={'output': 'xml'}).status_code,
+                         s.HTTP_400_BAD_REQUEST)
+        res = self.client.get(reverse('export_user_tweets', kwargs={'uuid': uuid7()}))
+        self.assertEqual(res.status_code, s.HTTP_404_NOT_FOUND)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_tweets', 'test', output='csv', stdout=out)
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(out.getvalue())))), 3)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tweets.ndjson.gz')
+            call_command('export_tweets', 'test', gzip=True, file=path)
+            with open(path, 'rb') as f:
+                self.assertEqual(len(gzip.decompress(f.read()).splitlines()), 3)
+
+    def peak_memory(self, user, count):
+        Tweet.objects.bulk_create(
+            Tweet(text='x' * 200, author=user) for _ in range(count))
+        stream = export.export(Tweet.objects.filter(author=user), chunk_size=100)
+
+        tracemalloc.start()
+        try:
+            exported = sum(data.count(b'\n') for data in stream)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(exported, count)
+        return peak
+
+    def test_memory_flat(self):
+        small = self.peak_memory(User.objects.create_user(username='small', password='password'), 500)
+        large = self.peak_memory(User.objects.create_user(username='large', password='password'), 10000)
+
+        # twenty times the tweets, about the same peak
+        self.assertLess(large, small * 1.5)
+
+
+class ImportTweetsTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.author = User.objects.create_user(username='test', password='password')
+
+    def write(self, records, name='tweets.ndjson'):
+        path = os.path.join(self.tmp.name, name)
+        lines = ''.join(
+            (r if isinstance(r, str) else json.dumps(r)) + '\n' for r in records).encode()
+        with open(path, 'wb') as f:
+            f.write(gzip.compress(lines) if name.endswith('.gz') else lines)
+        return path
+
+    def run_import(self, path, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_tweets', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_export_round_trip(self):
+        for i in range(3):
+            Tweet.objects.create(text=f'tweet {i}', author=self.author, likes=i)
+        exported = StringIO()
+        call_command('export_tweets', 'test', stdout=exported)
+        before = list(Tweet.objects.order_by('id').values('uuid', 'text', 'likes', 'date_created'))
+        Tweet.objects.all().delete()
+
+        self.run_import(self.write(exported.getvalue().splitlines()))
+
+        after = list(Tweet.objects.order_by('id').values('uuid', 'text', 'likes', 'date_created'))
+        self.assertEqual(after, before)
+        tweet = Tweet.objects.get(text='tweet 2')
+        self.assertAlmostEqual(tweet.score, hot_score(2, tweet.date_created))
+
+    def test_users_and_authors(self):
+        author_uuid = uuid7()
+        path = self.write([
+            {'type': 'user', 'username': 'imported', 'uuid': str(author_uuid),
+             'date_joined': '2020-05-01T10:00:00'},
+            {'text': 'by uuid', 'author_uuid': str(author_uuid),
+             'date_created': '2020-06-01T12:00:00Z'},
+            {'text': 'by username', 'author': 'imported'},
+            {'text': 'existing author', 'author': 'test'},
+        ])
+        out, err = self.run_import(path, batch_size=2)
+
+        user = User.objects.get(username='imported')
+        self.assertEqual(user.uuid, author_uuid)
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual(Tweet.objects.filter(author=user).count(), 2)
+        self.assertEqual(
+            Tweet.objects.get(text='by uuid').date_created,
+            dt.datetime(2020, 6, 1, 12, tzinfo=dt.timezone.utc))
+        self.assertEqual(Tweet.objects.get(text='existing author').author, self.author)
+        self.assertIn('rows/s', out)
+        self.assertEqual(err, '')
+
+    def test_invalid_lines_skipped(self):
+        path = self.write([
+            'not json',
+            [1, 2],
+            {'text': 'no author'},
+            {'text': 'x' * 251, 'author': 'test'},
+            {'text': 'bad date', 'author': 'test', 'date_created': 'yesterday'},
+            {'text': 'unknown', 'author': 'nobody'},
+            {'type': 'retweet'},
+            {'text': 'fine', 'author': 'test'},
+        ])
+        out, err = self.run_import(path)
+
+        self.assertEqual(list(Tweet.objects.values_list('text', flat=True)), ['fine'])
+        self.assertIn('skipped 7 invalid lines', out)
+        self.assertIn('line 1: not JSON', err)
+        self.assertIn('unknown author nobody', err)
+
+    def test_reimport_skips_existing(self):
+        records = [
+            {'text': f'tweet {i}', 'author': 'test', 'date_created': '2021-01-01T00:00:00Z'}
+            for i in range(3)]
+        self.run_import(self.write(records))
+        first = set(Tweet.objects.values_list('uuid', flat=True))
+        changes_count = TweetChange.objects.count()
+        out, _ = self.run_import(self.write([
+            {'type': 'user', 'username': 'test'},
+            {'type': 'user', 'username': 'new'},
+            {'type': 'user', 'username': 'new'},
+            *records,
+        ], 'again.ndjson'))
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(set(Tweet.objects.values_list('uuid', flat=True)), first)
+        self.assertIn('Imported 1 users and 0 tweets, 5 were already there', out)
+        self.assertEqual(TweetChange.objects.count(), changes_count)
+
+    def test_gzip_input(self):
+        self.run_import(self.write([{'text': 'zipped', 'author': 'test'}], 'tweets.ndjson.gz'))
+        self.assertTrue(Tweet.objects.filter(text='zipped').exists())
+
+    def test_resume(self):
+        path = self.write([{'text': f'tweet {i}', 'author': 'test'} for i in range(5)])
+        checkpoint = os.path.join(self.tmp.name, 'import.checkpoint')
+
+        write_batch = ImportCommand.write_batch
+        calls = []
+
+        def crash_on_second_batch(command, users, tweets):
+            calls.append(len(tweets))
+            if len(calls) == 2:
+                raise RuntimeError('crash')
+            write_batch(command, users, tweets)
+
+        with mock.patch.object(ImportCommand, 'write_batch', crash_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.run_import(path, batch_size=2, checkpoint=checkpoint)
+        self.assertEqual(Tweet.objects.count(), 2)
+
+        with mock.patch.object(Tweet.objects, 'bulk_create', wraps=Tweet.objects.bulk_create) as bulk_create:
+            out, _ = self.run_import(path, batch_size=2, checkpoint=checkpoint)
+        self.assertIn('Resuming after line 2', out)
+        # only the lines after the checkpoint are read again
+        self.assertEqual(sum(len(c.args[0]) for c in bulk_create.call_args_list), 3)
+        self.assertEqual(
+            sorted(Tweet.objects.values_list('text', flat=True)),
+            [f'tweet {i}' for i in range(5)])
+
+    def test_checkpoint_of_other_input(self):
+        checkpoint = os.path.join(self.tmp.name, 'import.checkpoint')
+        self.run_import(self.write([], 'a.ndjson'), checkpoint=checkpoint)
+        with self.assertRaises(CommandError):
+            self.run_import(self.write([], 'b.ndjson'), checkpoint=checkpoint)
+
+
+class SeedTest(TestCase):
+
+    def test_seed(self):
+        out = StringIO()
+        call_command('seed', users=50, tweets=500, follows=5, days=1, timeline_hours=24,
+                     batch_size=100, stdout=out)
+
+        self.assertEqual(User.objects.filter(username__startswith='user').count(), 50)
+        self.assertEqual(Tweet.objects.count(), 500)
+        self.assertTrue(User.objects.get(username='user7').check_password('password'))
+        # power law: the first user writes more than an average user and is followed more
+        top = User.objects.get(username='user0')
+        self.assertGreater(Tweet.objects.filter(author=top).count(), 500 / 50)
+        self.assertEqual(top.followers_count, Follow.objects.filter(followee=top).count())
+        self.assertGreater(top.followers_count, 5)
+        self.assertTrue(TimelineEntry.objects.filter(owner=top).exists())
+        tweet = Tweet.objects.order_by('-likes').first()
+        self.assertAlmostEqual(tweet.score, hot_score(tweet.likes, tweet.date_created))
+
+        with self.assertRaises(CommandError):
+            call_command('seed', users=1, tweets=0, stdout=out)
+
+
+@override_settings(METRICS={'ENABLED': True})
+class MetricsTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='test', password='password')
+        for i in range(3):
+            Tweet.objects.create(text=f'tweet {i}', author=user)
+
+    def setUp(self):
+        metrics.registry.clear()
+
+    def server_timing(self, res):
+        return {part.split(';')[0]: part for part in res['Server-Timing'].split(', ')}
+
+    def scrape(self):
+        res = self.client.get(reverse('metrics'))
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return res.content.decode()
+
+    def test_server_timing(self):
+        res = self.client.get(reverse('recent_tweets'))
+
+        phases = self.server_timing(res)
+        self.assertEqual(set(phases), set(metrics.PHASES))
+        self.assertIn('desc="1 queries"', phases['db'])
+
+    def test_auth_and_serialize_timed(self):
+        token = self.client.post(reverse('token_login'), data={
+            'username': 'test', 'password': 'password'}).data['access']
+        self.client.get(reverse('tweet_list_create'), HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        histograms = metrics.registry.collect()
+        for phase in ('auth', 'serialize', 'render', 'db'):
+            h = histograms[(metrics.DURATION, (('view', 'tweet_list_create'), ('phase', phase)))]
+            self.assertEqual(h.count, 1)
+            self.assertGreater(h.sum, 0, phase)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('recent_tweets'))
+        self.client.get(reverse('recent_tweets'))
+        text = self.scrape()
+
+        self.assertIn('# TYPE speertweet_request_duration_seconds histogram', text)
+        self.assertIn(
+            'speertweet_request_duration_seconds_count{view="recent_tweets",phase="total"} 2',
+            text)
+        self.assertIn(
+            'speertweet_request_queries_bucket{view="recent_tweets",le="1"} 2', text)
+        self.assertIn('speertweet_request_queries_bucket{view="recent_tweets",le="+Inf"} 2', text)
+
+    def test_multiple_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            other = [[metrics.QUERIES, [['view', 'recent_tweets']],
+                      [0, 3, 0, 0, 0, 0, 0, 0, 0], 3, 3]]
+            with open(os.path.join(directory, '1.json'), 'w') as f:
+                json.dump(other, f)
+
+            with self.settings(METRICS={'ENABLED': True, 'MULTIPROCESS_DIR': directory}):
+                self.client.get(reverse('recent_tweets'))
+                text = self.scrape()
+                self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+
+        self.assertIn('speertweet_request_queries_count{view="recent_tweets"} 4', text)
+
+    @override_settings(METRICS={'ENABLED': False})
+    def test_disabled(self):
+        res = self.client.get(reverse('recent_tweets'))
+
+        self.assertNotIn('Server-Timing', res)
+        self.assertEqual(metrics.registry.collect(), {})
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, s.HTTP_404_NOT_FOUND)
+
+
+class ProfilerTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='test', password='password')
+        Tweet.objects.create(text='tweet', author=user)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        enabled = self.settings(PROFILER={'ENABLED': True, 'DIRECTORY': self.tmp.name})
+        enabled.enable()
+        self.addCleanup(enabled.disable)
+
+    def test_signed_header(self):
+        res = self.client.get(reverse('recent_tweets'), HTTP_X_PROFILE=profiling.make_token())
+
+        name = res['X-Profile-Id']
+        self.assertTrue(name.startswith('RecentTweetsAPIView-'))
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), [f'{name}.prof', f'{name}.sql'])
+        stats = pstats.Stats(os.path.join(self.tmp.name, f'{name}.prof'))
+        self.assertTrue(stats.total_calls)
+        with open(os.path.join(self.tmp.name, f'{name}.sql')) as f:
+            sql = f.read()
+        self.assertIn('GET /tweets/recent/ -> 200', sql)
+        self.assertIn('-- 1 queries', sql)
+        self.assertIn('FROM "tweets_tweet"', sql)
+
+    def test_function_view_name(self):
+        res = self.client.get(reverse('user_details', kwargs={'username': 'test'}),
+                              HTTP_X_PROFILE=profiling.make_token())
+        self.assertTrue(res['X-Profile-Id'].startswith('user_details-'))
+
+    def test_parameters_not_written(self):
+        res = self.client.post(reverse('token_login'),
+                               {'username': 'test', 'password': 'password'},
+                               HTTP_X_PROFILE=profiling.make_token())
+        with open(os.path.join(self.tmp.name, f'{res["X-Profile-Id"]}.sql')) as f:
+            sql = f.read()
+        self.assertIn('%s', sql)
+        self.assertIn('1 parameters', sql)
+        self.assertNotIn("'test'", sql)
+        self.assertNotIn('pbkdf2', sql)
+
+    def test_bad_token_not_profiled(self):
+        token = profiling.make_token()
+        for value in ('profile', token[:-1] + ('A' if token[-1] != 'A' else 'B')):
+            res = self.client.get(reverse('recent_tweets'), HTTP_X_PROFILE=value)
+            self.assertNotIn('X-Profile-Id', res)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_sample_rate(self):
+        with self.settings(PROFILER={'ENABLED': True, 'DIRECTORY': self.tmp.name,
+                                     'SAMPLE_RATE': 1.0}):
+            self.client.get(reverse('trending_tweets'))
+        self.assertEqual(len(os.listdir(self.tmp.name)), 2)
+
+        # middleware reads its settings once, when a new client loads it
+        self.client_class().get(reverse('trending_tweets'))
+        self.assertEqual(len(os.listdir(self.tmp.name)), 2)
+
+    def test_disabled(self):
+        with self.settings(PROFILER={'ENABLED': False, 'DIRECTORY': self.tmp.name}):
+            res = self.client.get(reverse('recent_tweets'), HTTP_X_PROFILE=profiling.make_token())
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_profile_token_command(self):
+        out = StringIO()
+        call_command('profile_token', stdout=out)
+        header, token = out.getvalue().strip().split(': ')
+        self.assertEqual(header, 'X-Profile')
+        self.assertTrue(profiling.check_token(token))
+
+
+class SlowQueryTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='test', password='password')
+        Tweet.objects.create(text='tweet', author=user)
+
+    def test_slow_query_logged_with_plan(self):
+        with self.settings(SLOW_QUERIES={'THRESHOLD': 0}):
+            with self.assertLogs('speertweet_backend.slowqueries', 'WARNING') as logs:
+                with slowqueries.wrap_connections(slowqueries.SlowQueryLog()):
+                    list(Tweet.objects.filter(text='tweet'))
+                    list(Tweet.objects.filter(uuid=uuid4()))
+
+        full, indexed = logs.output
+        self.assertIn('FULL SCAN of tweets_tweet', full)
+        self.assertIn('SCAN tweets_tweet', full)
+        self.assertNotIn('FULL SCAN', indexed)
+        self.assertIn('SEARCH tweets_tweet USING INDEX', indexed)
+
+    def test_fast_query_not_logged(self):
+        with self.assertNoLogs('speertweet_backend.slowqueries'):
+            with slowqueries.wrap_connections(slowqueries.SlowQueryLog(threshold=60)):
+                list(Tweet.objects.filter(text='tweet'))
+
+    def test_aliased_full_scan(self):
+        with self.assertRaises(AssertionError) as raised:
+            with slowqueries.assert_no_full_scans(self):
+                # the subquery scans tweets_tweet as U0
+                list(User.objects.filter(pk__in=Tweet.objects.filter(
+                    text__contains='x').values('author_id')))
+        self.assertIn('full scan of tweets_tweet', str(raised.exception))
+
+    @override_settings(SLOW_QUERIES={'ENABLED': True, 'THRESHOLD': 0})
+    def test_middleware(self):
+        with self.assertLogs('speertweet_backend.slowqueries', 'WARNING') as logs:
+            self.client.get(reverse('recent_tweets'))
+        self.assertEqual(len(logs.output), 1)
+
+
+class FullScanTest(APITestCase):
+    """
+    Every endpoint on a seeded database, failing on any query that reads
+    tweets_tweet or users_user in full.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed', users=200, tweets=5000, follows=10, days=3,
+                     timeline_hours=72, batch_size=1000, stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+        clear_caches()
+        res = self.client.post(reverse('token_login'), data={
+            'username': 'user1', 'password': 'password'})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {res.data["access"]}')
+        self.tweet = Tweet.objects.filter(author__username='user5').latest('date_created')
+        self.other = User.objects.get(username='user5')
+
+    def test_reads(self):
+        recent = self.client.get(reverse('recent_tweets'))
+        uuids = ','.join(str(t['uuid']) for t in recent.data['results'][:5])
+        urls = [
+            reverse('recent_tweets'),
+            recent.data['next'],
+            reverse('tweet_detail', kwargs={'uuid': self.tweet.uuid}),
+            reverse('batch_tweets') + f'?ids={uuids}',
+            reverse('get_user_tweets', kwargs={'uuid': self.other.uuid}),
+            reverse('export_user_tweets', kwargs={'uuid': self.other.uuid}),
+            reverse('tweet_list_create'),
+            reverse('home_timeline'),
+            reverse('trending_tweets'),
+            reverse('search_tweets') + '?q=coffee',
+            reverse('like_tweet', kwargs={'uuid': self.tweet.uuid}),
+            reverse('current_user_details'),
+            reverse('user_details', kwargs={'username': 'user5'}),
+        ]
+        for url in urls:
+            with self.subTest(url=url), slowqueries.assert_no_full_scans(self):
+                res = self.client.get(url)
+                if res.streaming:
+                    b''.join(res.streaming_content)
+                self.assertEqual(res.status_code, s.HTTP_200_OK)
+
+    def test_writes(self):
+        like = reverse('like_tweet', kwargs={'uuid': self.tweet.uuid})
+        follow = reverse('follow', kwargs={'username': 'user150'})
+        requests = [
+            ('post', reverse('tweet_list_create'), {'text': 'new tweet'}),
+            ('post', reverse('bulk_create_tweets'), [{'text': 'one'}, {'text': 'two'}]),
+            ('put', like, None),
+            ('delete', like, None),
+            ('post', follow, None),
+            ('delete', follow, None),
+            ('put', reverse('tweet_detail', kwargs={'uuid': Tweet.objects.filter(
+                author__username='user1').latest('id').uuid}), {'text': 'edited'}),
+            ('post', reverse('register'), {
+                'username': 'newuser', 'password': 'password', 'confirm_password': 'password'}),
+        ]
+        for method, url, data in requests:
+            with self.subTest(method=method, url=url), slowqueries.assert_no_full_scans(self):
+                res = getattr(self.client, method)(url, data=data, format='json')
+                self.assertLess(res.status_code, 400)
+
+
+class DatabaseProfileTest(TestCase):
+
+    def open_connection(self, directory):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        settings_dict = {**connection.settings_dict,
+                         'NAME': os.path.join(directory, 'profile.sqlite3')}
+        conn = DatabaseWrapper(settings_dict, alias='profile_test')
+        self.addCleanup(conn.close)
+        conn.ensure_connection()
+        return conn
+
+    def test_production_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(DATABASE_PROFILE='production'):
+                values = database.pragma_values(self.open_connection(directory))
+
+        self.assertEqual(values['journal_mode'], 'wal')
+        self.assertEqual(values['synchronous'], 1)  # NORMAL
+        self.assertEqual(values['busy_timeout'], 5000)
+        self.assertEqual(values['cache_size'], -65536)
+        self.assertEqual(values['temp_store'], 2)  # MEMORY
+
+    def test_default_profile_untouched(self):
+        with tempfile.TemporaryDirectory() as directory:
+            values = database.pragma_values(self.open_connection(directory))
+
+        self.assertEqual(values['journal_mode'], 'delete')
+        self.assertEqual(values['synchronous'], 2)  # FULL
+
+    def test_unknown_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(DATABASE_PROFILE='fast'):
+                with self.assertRaises(ValueError):
+                    self.open_connection(directory)
+
+    def test_check_profile(self):
+        with self.assertRaisesMessage(ValueError, "Unknown DATABASE_PROFILE 'fast'"):
+            database.check_profile('fast')
+        self.assertEqual(database.check_profile('production'), 'production')
+
+
+@override_settings(REPLICAS={'ALIASES': ['replica_test'], 'LAG_CHECK_INTERVAL': 0,
+                             'SINGLE_PROCESS': True},
+                   OBJECT_CACHE={'SINGLE_PROCESS': True})
+class ReplicaRouterTest(TransactionTestCase):
+    """
+    Routing against a file copy of the test database, added as the
+    replica_test alias for the duration of each test.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        connections.settings['replica_test'] = {
+            **connection.settings_dict, 'NAME': os.path.join(self.tmp.name, 'replica.sqlite3')}
+        self.addCleanup(self.remove_replica)
+        routers.monitor.reset()
+        cache.clear()
+        clear_caches()
+
+        self.user = User.objects.create_user(username='test', password='password')
+        self.sync()
+        self.tweet = Tweet.objects.create(text='after the copy', author=self.user)
+
+    def remove_replica(self):
+        connections['replica_test'].close()
+        del connections['replica_test']
+        del connections.settings['replica_test']
+
+    def sync(self):
+        call_command('sync_replicas', stdout=StringIO())
+
+    def login(self):
+        res = self.client.post(reverse('token_login'), data={
+            'username': 'test', 'password': 'password'})
+        return {'HTTP_AUTHORIZATION': f'Bearer {res.data["access"]}'}
+
+    def recent(self, **extra):
+        return [t['text'] for t in self.client.get(reverse('recent_tweets'), **extra).data['results']]
+
+    def test_reads_from_replica(self):
+        self.assertEqual(self.recent(), [])
+        self.sync()
+        self.assertEqual(self.recent(), ['after the copy'])
+
+    def test_writes_to_primary(self):
+        auth = self.login()
+        res = self.client.post(reverse('tweet_list_create'), data={'text': 'new'}, **auth)
+
+        self.assertEqual(res.status_code, s.HTTP_201_CREATED)
+        self.assertTrue(Tweet.objects.using('default').filter(text='new').exists())
+        self.assertFalse(Tweet.objects.using('replica_test').filter(text='new').exists())
+
+    def test_read_your_writes(self):
+        auth = self.login()
+        self.client.post(reverse('tweet_list_create'), data={'text': 'new'}, **auth)
+
+        own = self.client.get(reverse('tweet_list_create'), REMOTE_ADDR='10.0.0.2', **auth)
+        self.assertEqual(len(own.data['results']), 2)
+        self.assertEqual(self.recent(**auth), ['new', 'after the copy'])
+        # anonymous requests, from the same address too, still read the replica
+        self.assertEqual(self.recent(), [])
+
+    def test_shared_cache_required(self):
+        with self.settings(REPLICAS={'ALIASES': ['replica_test']}):
+            with self.assertRaisesMessage(ImproperlyConfigured, "REPLICAS['CACHE'] 'default'"):
+                routers.ReplicaMiddleware(lambda request: None)
+        with self.settings(REPLICAS={'ALIASES': ['replica_test'], 'CACHE': 'shared'},
+                           CACHES={**settings.CACHES, 'shared': {
+                               'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                               'LOCATION': os.path.join(self.tmp.name, 'pins')}}):
+            routers.ReplicaMiddleware(lambda request: None)
+
+    @override_settings(REPLICAS={'ALIASES': ['replica_test'], 'LAG_CHECK_INTERVAL': 0,
+                                 'SINGLE_PROCESS': True, 'STICKY_SECONDS': 0.01})
+    def test_pin_expires(self):
+        self.client.post(reverse('tweet_list_create'), data={'text': 'new'}, **self.login())
+        time.sleep(0.02)
+        self.assertEqual(self.recent(), [])
+
+    def test_lagging_replica_skipped(self):
+        self.sync()
+        Tweet.objects.create(text='not copied', author=self.user)
+        self.assertEqual(self.recent(), ['after the copy'])
+
+        Heartbeat.objects.update(date_written=timezone.now() + dt.timedelta(seconds=60))
+        self.assertEqual(self.recent(), ['not copied', 'after the copy'])
+
+    def test_unreachable_replica_skipped(self):
+        self.remove_replica()
+        connections.settings['replica_test'] = {
+            **connection.settings_dict, 'NAME': os.path.join(self.tmp.name, 'missing', 'x')}
+        self.assertEqual(self.recent(), ['after the copy'])
+
+    def test_cache_filled_from_primary(self):
+        url = reverse('tweet_detail', kwargs={'uuid': self.tweet.uuid})
+        self.assertEqual(self.client.get(url).status_code, s.HTTP_200_OK)
+
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Tweet))
+        self.assertEqual(router.db_for_write(Tweet), 'default')
+        self.assertFalse(router.allow_migrate('replica_test', 'tweets'))
+        self.assertIsNone(router.allow_migrate('default', 'tweets'))
+
+
+@override_settings(SHARDS={'ALIASES': ['shard_a', 'shard_b']})
+class ShardTest(TransactionTestCase):
+    """
+    Tweets spread over two SQLite files added as the shard_a and shard_b
+    aliases for the duration of the class.
+    """
+    shards = ('shard_a', 'shard_b')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        for alias in cls.shards:
+            connections.settings[alias] = {
+                **connection.settings_dict, 'NAME': os.path.join(cls.tmp.name, f'{alias}.sqlite3')}
+            call_command('migrate', database=alias, verbosity=0)
+            # migrate turns foreign keys back on, the next connection has them off
+            connections[alias].close()
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in cls.shards:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        for alias in self.shards:
+            Tweet.objects.using(alias).all().delete()
+        # the tombstones of the tweets just deleted
+        TweetChange.objects.all().delete()
+        cache.clear()
+        clear_caches()
+        # an author on each shard
+        self.users = {}
+        for i in range(100):
+            user = User.objects.create_user(username=f'user{i}', password='password')
+            alias = shards.author_alias(user.pk)
+            if alias in self.users:
+                user.delete()
+            else:
+                self.users[alias] = user
+            if len(self.users) == len(self.shards):
+                break
+
+    def login(self, user):
+        res = self.client.post(reverse('token_login'), data={
+            'username': user.username, 'password': 'password'})
+        return {'HTTP_AUTHORIZATION': f'Bearer {res.data["access"]}'}
+
+    def stored_in(self, uuid):
+        return [alias for alias in shards.databases()
+                if Tweet.objects.using(alias).filter(uuid=uuid).exists()]
+
+    def test_create_on_author_shard(self):
+        for alias, user in self.users.items():
+            auth = self.login(user)
+            res = self.client.post(reverse('tweet_list_create'), data={'text': alias}, **auth)
+            self.assertEqual(res.status_code, s.HTTP_201_CREATED)
+            self.assertEqual(res.data['author'], user.username)
+
+            uuid = res.data['uuid']
+            self.assertEqual(self.stored_in(uuid), [alias])
+            self.assertEqual(shards.uuid_bucket(uuid), shards.author_bucket(user.pk))
+
+            own = self.client.get(reverse('tweet_list_create'), **auth).data['results']
+            self.assertEqual([(t['text'], t['author']) for t in own], [(alias, user.username)])
+
+    def test_bulk_create_on_author_shard(self):
+        alias, user = next(iter(self.users.items()))
+        res = self.client.post(reverse('bulk_create_tweets'), data=[{'text': 'a'}, {'text': 'b'}],
+                               format='json', content_type='application/json', **self.login(user))
+        self.assertEqual(res.status_code, s.HTTP_201_CREATED)
+        self.assertEqual(Tweet.objects.using(alias).count(), 2)
+
+    def test_detail(self):
+        alias, user = next(iter(self.users.items()))
+        auth = self.login(user)
+        uuid = self.client.post(reverse('tweet_list_create'), data={'text': 'hi'}, **auth).data['uuid']
+        url = reverse('tweet_detail', kwargs={'uuid': uuid})
+
+        res = self.client.get(url)
+        self.assertEqual((res.data['text'], res.data['author']), ('hi', user.username))
+
+        res = self.client.put(url, data={'text': 'edited'}, content_type='application/json', **auth)
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        self.assertEqual(Tweet.objects.using(alias).get(uuid=uuid).text, 'edited')
+        self.assertEqual(self.client.get(url).data['text'], 'edited')
+
+        other = next(u for a, u in self.users.items() if a != alias)
+        res = self.client.delete(url, **self.login(other))
+        self.assertEqual(res.status_code, s.HTTP_403_FORBIDDEN)
+
+        self.assertEqual(self.client.delete(url, **auth).status_code, s.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.stored_in(uuid), [])
+        self.assertEqual(self.client.get(url).status_code, s.HTTP_404_NOT_FOUND)
+
+    def test_likes_on_tweet_shard(self):
+        (alias, user), (other_alias, other) = self.users.items()
+        # ids are per shard, the same id on both
+        tweets = [shards.tweets(u.pk).create(pk=1000, author=u, text=a, uuid=shards.new_uuid(u.pk))
+                  for a, u in self.users.items()]
+        auth = self.login(other)
+        url = reverse('like_tweet', kwargs={'uuid': tweets[0].uuid})
+
+        self.assertEqual(self.client.put(url, **auth).status_code, s.HTTP_200_OK)
+        self.assertTrue(self.client.get(url, **auth).data['liked'])
+        self.assertEqual(Like.objects.using(alias).filter(user=other).count(), 1)
+        self.assertEqual(Tweet.objects.using(alias).get().likes, 1)
+        self.assertEqual(Tweet.objects.using(other_alias).get().likes, 0)
+        other_url = reverse('like_tweet', kwargs={'uuid': tweets[1].uuid})
+        self.assertFalse(self.client.get(other_url, **auth).data['liked'])
+
+        Tweet.objects.using(alias).update(likes=5)
+        call_command('reconcile_likes', stdout=StringIO())
+        self.assertEqual(Tweet.objects.using(alias).get().likes, 1)
+
+        self.assertEqual(self.client.delete(url, **auth).status_code, s.HTTP_200_OK)
+        self.assertFalse(Like.objects.using(alias).exists())
+        self.assertEqual(Tweet.objects.using(alias).get().likes, 0)
+
+    @override_settings(LIKE_BUFFER={'ENABLED': True, 'FLUSH_INTERVAL': 0})
+    def test_buffered_likes_on_shards(self):
+        counters._buffer = None
+        self.addCleanup(setattr, counters, '_buffer', None)
+        fan = User.objects.create_user(username='fan', password='password')
+        tweets = [shards.tweets(u.pk).create(pk=1000, author=u, text=a, uuid=shards.new_uuid(u.pk))
+                  for a, u in self.users.items()]
+        Like.objects.like(fan, tweets[0])
+        Like.objects.like(fan, tweets[1])
+        Like.objects.unlike(fan, tweets[1])
+
+        buffer = counters.get_like_buffer()
+        self.assertEqual(buffer.pending(tweets[0].uuid), 1)
+        self.assertEqual(buffer.pending(tweets[1].uuid), 0)
+        buffer.flush()
+        self.assertEqual([Tweet.objects.using(a).get().likes for a in self.users], [1, 0])
+
+    def test_home_timeline_across_shards(self):
+        reader = User.objects.create_user(username='reader', password='password')
+        (alias, user), (other_alias, other) = self.users.items()
+        Follow.objects.follow(reader, user)
+        Follow.objects.follow(reader, other)
+        for author in (user, other, user):
+            self.client.post(reverse('tweet_list_create'), data={'text': author.username},
+                             **self.login(author))
+        self.assertTrue(TimelineEntry.objects.using(alias).filter(owner=reader).exists())
+        self.assertTrue(TimelineEntry.objects.using(other_alias).filter(owner=reader).exists())
+
+        auth = self.login(reader)
+        res = self.client.get(reverse('home_timeline'), **auth)
+        self.assertEqual([(t['text'], t['author']) for t in res.data['results']],
+                         [(user.username, user.username), (other.username, other.username),
+                          (user.username, user.username)])
+
+        with self.settings(TIMELINE={'FANOUT_LIMIT': 1}):
+            # other is now merged on read, from their shard
+            TimelineEntry.objects.using(other_alias).all().delete()
+            res = self.client.get(reverse('home_timeline'), **auth)
+            self.assertEqual(len(res.data['results']), 3)
+
+        Follow.objects.unfollow(reader, other)
+        self.assertFalse(TimelineEntry.objects.using(other_alias).filter(owner=reader).exists())
+        Follow.objects.follow(reader, other)
+        self.assertEqual(TimelineEntry.objects.using(other_alias).filter(owner=reader).count(), 1)
+
+    def test_search_and_trending_across_shards(self):
+        for alias, user in self.users.items():
+            shards.tweets(user.pk).create(author=user, text=f'hello {alias}',
+                                          uuid=shards.new_uuid(user.pk))
+        res = self.client.get(reverse('search_tweets'), {'q': 'hello'})
+        self.assertEqual(sorted((t['text'], t['author']) for t in res.data['results']),
+                         sorted((f'hello {a}', u.username) for a, u in self.users.items()))
+
+        res = self.client.get(reverse('trending_tweets'))
+        self.assertEqual(sorted(t['text'] for t in res.data['results']),
+                         sorted(f'hello {a}' for a in self.users))
+        self.assertTrue(all(t['author'] for t in res.data['results']))
+
+        out = StringIO()
+        call_command('rollup_trending', stdout=out)
+        self.assertIn('Rescored 2 tweets', out.getvalue())
+
+    def test_user_tweets(self):
+        for alias, user in self.users.items():
+            shards.tweets(user.pk).create(author=user, text=alias, uuid=shards.new_uuid(user.pk))
+        for alias, user in self.users.items():
+            res = self.client.get(reverse('get_user_tweets', kwargs={'uuid': user.uuid}))
+            self.assertEqual([(t['text'], t['author']) for t in res.data['results']],
+                             [(alias, user.username)])
+        res = self.client.get(reverse('get_user_tweets', kwargs={'uuid': uuid4()}))
+        self.assertEqual(res.data['results'], [])
+
+    def test_recent_merges_shards(self):
+        now = timezone.now()
+        expected = []
+        for i in range(9):
+            user = list(self.users.values())[i % 2]
+            tweet = shards.tweets(user.pk).create(
+                author=user, text=str(i), uuid=shards.new_uuid(user.pk),
+                date_created=now - dt.timedelta(minutes=i))
+            expected.append(tweet.text)
+        # an old tweet still in default
+        Tweet.objects.using('default').create(
+            author=user, text='legacy', date_created=now - dt.timedelta(days=1))
+        expected.append('legacy')
+
+        texts, url = [], reverse('recent_tweets') + '?page_size=4'
+        while url:
+            data = self.client.get(url).data
+            texts += [t['text'] for t in data['results']]
+            self.assertTrue(all(t['author'] for t in data['results']))
+            url = data['next']
+        self.assertEqual(texts, expected)
+
+        # and back again
+        res = self.client.get(data['previous'])
+        self.assertEqual([t['text'] for t in res.data['results']], expected[-6:-2])
+
+    def test_rebalance(self):
+        legacy = []
+        for user in self.users.values():
+            for i in range(3):
+                legacy.append(Tweet.objects.using('default').create(author=user, text=str(i)))
+        out = StringIO()
+        call_command('rebalance_shards', dry_run=True, stdout=out)
+        self.assertIn('Would move 6 tweets', out.getvalue())
+        self.assertEqual(Tweet.objects.using('default').count(), 6)
+
+        call_command('rebalance_shards', batch_size=4, stdout=StringIO())
+        self.assertEqual(Tweet.objects.using('default').count(), 0)
+        # moved, not deleted
+        self.assertFalse(TweetChange.objects.filter(kind=TweetChange.DELETE).exists())
+        for tweet in legacy:
+            self.assertEqual(self.stored_in(tweet.uuid), [shards.author_alias(tweet.author_id)])
+            # the uuid carries no bucket, the other shards are asked too
+            res = self.client.get(reverse('tweet_detail', kwargs={'uuid': tweet.uuid}))
+            self.assertEqual(res.status_code, s.HTTP_200_OK)
+
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('Moved 0 tweets', out.getvalue())
+
+    def test_rebalance_keeps_likes_and_timelines(self):
+        (alias, user), (_, fan) = self.users.items()
+        Follow.objects.follow(fan, user)
+        # written before sharding, one tweet holding the id the other will get
+        shards.tweets(user.pk).create(author=user, text='on the shard', uuid=shards.new_uuid(user.pk))
+        legacy = Tweet.objects.using('default').create(author=user, text='legacy')
+        timeline.fan_out([legacy])
+        Like.objects.like(fan, legacy)
+        liked = Like.objects.using('default').get()
+
+        call_command('rebalance_shards', stdout=StringIO())
+
+        moved = Tweet.objects.using(alias).get(uuid=legacy.uuid)
+        self.assertEqual(moved.likes, 1)
+        like = Like.objects.using(alias).get()
+        self.assertEqual((like.tweet_id, like.user_id, like.date_created),
+                         (moved.pk, fan.pk, liked.date_created))
+        self.assertEqual(
+            set(TimelineEntry.objects.using(alias).values_list('owner_id', 'tweet_id')),
+            {(user.pk, moved.pk), (fan.pk, moved.pk)})
+        self.assertFalse(Like.objects.using('default').exists())
+        self.assertFalse(TimelineEntry.objects.using('default').exists())
+
+        res = self.client.get(reverse('home_timeline'), **self.login(fan))
+        self.assertEqual([t['text'] for t in res.data['results']], ['legacy'])
+        res = self.client.get(reverse('like_tweet', kwargs={'uuid': legacy.uuid}), **self.login(fan))
+        self.assertTrue(res.data['liked'])
+
+    def test_cache_invalidated_when_the_shard_commits(self):
+        alias, user = next(iter(self.users.items()))
+        tweet = shards.tweets(user.pk).create(author=user, text='old', uuid=shards.new_uuid(user.pk))
+        with mock.patch.object(tweet_cache, '_invalidate') as invalidate:
+            with transaction.atomic(using=alias):
+                tweet.text = 'new'
+                tweet.save()
+                self.assertEqual(invalidate.call_count, 1)
+            # again once the shard commits, a read racing it may have cached 'old'
+            self.assertEqual(invalidate.call_count, 2)
+
+    @override_settings(SHARDS={'ALIASES': []})
+    def test_rebalance_needs_shards(self):
+        with self.assertRaises(CommandError):
+            call_command('rebalance_shards')
+
+    def test_adding_shard_moves_few_buckets(self):
+        before = [shards.jump_hash(b, 4) for b in range(shards.NUM_BUCKETS)]
+        after = [shards.jump_hash(b, 5) for b in range(shards.NUM_BUCKETS)]
+        moved = [a for b, a in zip(before, after) if a != b]
+        self.assertTrue(all(a == 4 for a in moved))
+        self.assertLess(len(moved), shards.NUM_BUCKETS * 0.3)
+
+
+class AsyncViewTest(APITestCase):
+    """
+    The async read views of the ASGI URLconf answer exactly like the REST
+    framework views they replace.
+    """
+
+    def setUp(self):
+        cache.clear()
+        clear_caches()
+        self.user = User.objects.create_user(username='test', password='password')
+        now = timezone.now()
+        self.tweets = [
+            Tweet.objects.create(text=f'tweet {i}', author=self.user,
+                                 date_created=now - dt.timedelta(minutes=i))
+            for i in range(5)
+        ]
+        self.token = self.client.post(reverse('token_login'), data={
+            'username': 'test', 'password': 'password'}).data['access']
+
+    def async_request(self, method, path, **extra):
+        # AsyncClient takes headers by name, not as META keys
+        extra = {key[5:].replace('_', '-') if key.startswith('HTTP_') else key: value
+                 for key, value in extra.items()}
+        async def request():
+            return await getattr(self.async_client, method)(path, **extra)
+
+        with self.settings(ROOT_URLCONF='speertweet_backend.asgi_urls'):
+            return async_to_sync(request)()
+
+    def assertSameResponse(self, path, **extra):
+        expected = self.client.get(path, **extra)
+        res = self.async_request('get', path, **extra)
+        self.assertEqual(res.status_code, expected.status_code)
+        self.assertEqual(res.content, expected.content)
+        for header in ('Content-Type', 'ETag', 'Last-Modified', 'WWW-Authenticate'):
+            self.assertEqual(res.get(header), expected.get(header), header)
+        return res
+
+    def test_views_are_async(self):
+        with self.settings(ROOT_URLCONF='speertweet_backend.asgi_urls'):
+            for name, args in [('recent_tweets', []), ('get_user_tweets', [self.user.uuid]),
+                               ('tweet_detail', [self.tweets[0].uuid]),
+                               ('user_details', ['test'])]:
+                view = resolve(reverse(name, args=args)).func
+                self.assertTrue(asyncio.iscoroutinefunction(view), name)
+            # the other routes are kept
+            self.assertEqual(resolve(reverse('current_user_details')).url_name,
+                             'current_user_details')
+
+    def test_no_sync_middleware(self):
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    def test_recent(self):
+        res = self.assertSameResponse(reverse('recent_tweets') + '?page_size=2')
+        self.assertSameResponse(res.json()['next'])
+        self.assertSameResponse(reverse('recent_tweets') + '?cursor=bad')
+
+    def test_user_tweets(self):
+        self.assertSameResponse(reverse('get_user_tweets', args=[self.user.uuid]))
+        self.assertSameResponse(reverse('get_user_tweets', args=[uuid4()]))
+
+    def test_detail(self):
+        self.assertSameResponse(reverse('tweet_detail', args=[self.tweets[0].uuid]))
+        self.assertSameResponse(reverse('tweet_detail', args=[uuid4()]))
+
+    def test_user_details(self):
+        self.assertSameResponse(reverse('user_details', args=['test']))
+        self.assertSameResponse(reverse('user_details', args=['nobody']))
+
+    def test_not_modified(self):
+        url = reverse('tweet_detail', args=[self.tweets[0].uuid])
+        etag = self.async_request('get', url)['ETag']
+        res = self.async_request('get', url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, s.HTTP_304_NOT_MODIFIED)
+
+    def test_authentication(self):
+        url = reverse('recent_tweets')
+        self.assertSameResponse(url, HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        res = self.assertSameResponse(url, HTTP_AUTHORIZATION='Bearer invalid')
+        self.assertEqual(res.status_code, s.HTTP_401_UNAUTHORIZED)
+
+    def test_writes_go_to_sync_view(self):
+        url = reverse('tweet_detail', args=[self.tweets[0].uuid])
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+        res = self.async_request('put', url, data={'text': 'edited'},
+                                 content_type='application/json', **auth)
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        self.assertEqual(self.async_request('get', url).json()['text'], 'edited')
+
+        res = self.async_request('delete', url)
+        self.assertEqual(res.status_code, s.HTTP_401_UNAUTHORIZED)
+        res = self.async_request('post', reverse('recent_tweets'))
+        self.assertEqual(res.status_code, s.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(res.json(), {'detail': 'Method "POST" not allowed.'})
+
+
+class StreamTest(APITestCase):
+    """
+    The live stream broker, its ASGI application and the events the views
+    publish.
+    """
+
+    def setUp(self):
+        self.broker = stream.Broker()
+        patcher = mock.patch.object(stream, 'broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='test', password='password')
+        self.client.force_authenticate(self.user)
+
+    def serve(self, events=(), headers=(), method='GET', path=stream.PATH, sends=3):
+        """
+        Connect to the stream application, publish events from another thread
+        once subscribed, disconnect after sends messages and return them.
+        """
+        scope = {'type': 'http', 'method': method, 'path': path, 'headers': list(headers)}
+
+        async def main():
+            disconnect = asyncio.Event()
+            sent = []
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+
+            app = asyncio.create_task(stream.StreamApplication(None)(scope, receive, send))
+            await asyncio.sleep(0)
+            # all at once, before the subscriber gets to send any
+            await asyncio.to_thread(lambda: [self.broker.publish(*e) for e in events])
+            for _ in range(1000):
+                if len(sent) >= sends or app.done():
+                    break
+                await asyncio.sleep(0.001)
+            disconnect.set()
+            await asyncio.wait_for(app, 1)
+            return sent
+
+        return asyncio.run(main())
+
+    def test_publish_and_resume(self):
+        async def main():
+            subscriber, backlog = self.broker.subscribe()
+            self.assertEqual(backlog, [])
+            first = await asyncio.to_thread(self.broker.publish, 'tweet', {'text': 'one'})
+            await subscriber.wait(1)
+            self.broker.unsubscribe(subscriber)
+            return first, list(subscriber.queue)
+
+        first, queue = asyncio.run(main())
+        self.assertEqual(queue, [f'id: {first}\nevent: tweet\ndata: {{"text":"one"}}\n\n'.encode()])
+        self.assertFalse(self.broker.has_subscribers())
+
+        second = self.broker.publish('tweet', {'text': 'two'})
+        self.assertGreater(second, first)
+        self.assertEqual(self.broker.since(second), [])
+        self.assertEqual(len(self.broker.since(first)), 1)
+        self.assertEqual(len(self.broker.since(first - 1)), 2)
+        # too old, or from the future of another process
+        self.assertIsNone(self.broker.since(first - 2))
+        self.assertIsNone(self.broker.since(second + 1))
+
+    def test_resumed_subscriber_gets_events_once(self):
+        async def main():
+            other, _ = self.broker.subscribe()
+            seen = self.broker.last_id
+            # delivered to the loop only after the client below resumed on it
+            self.broker.publish('tweet', {'text': 'one'})
+            subscriber, backlog = self.broker.subscribe(seen)
+            await other.wait(1)
+            self.broker.unsubscribe(other)
+            self.broker.unsubscribe(subscriber)
+            return backlog, list(other.queue), list(subscriber.queue)
+
+        backlog, others, queue = asyncio.run(main())
+        self.assertEqual(len(backlog), 1)
+        self.assertEqual(others, backlog)
+        self.assertEqual(queue, [])
+
+    @override_settings(STREAM={'HISTORY': 2})
+    def test_history_is_bounded(self):
+        broker = stream.Broker()
+        ids = [broker.publish('tweet', {}) for _ in range(3)]
+        self.assertEqual(len(broker.history), 2)
+        self.assertEqual(len(broker.since(ids[0])), 2)
+        self.assertIsNone(broker.since(ids[0] - 1))
+
+    @override_settings(STREAM={'QUEUE_SIZE': 2})
+    def test_slow_subscriber_is_dropped(self):
+        subscriber = stream.Subscriber()
+        self.broker.loops['loop'] = {subscriber}
+        for _ in range(3):
+            self.broker.deliver('loop', stream.Message(1, b'event'))
+        self.assertTrue(subscriber.dropped)
+        self.assertEqual(len(subscriber.queue), 0)
+
+    def test_stream(self):
+        sent = self.serve(events=[('tweet', {'text': 'hello'})])
+        start, retry, event = sent[:3]
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+        self.assertEqual(retry['body'], b'retry: 2000\n\n')
+        self.assertIn(b'event: tweet\ndata: {"text":"hello"}\n\n', event['body'])
+        self.assertFalse(self.broker.has_subscribers())
+
+    @override_settings(STREAM={'HEARTBEAT': 0.01})
+    def test_heartbeat(self):
+        sent = self.serve()
+        self.assertEqual(sent[2]['body'], b': ping\n\n')
+
+    def test_resume_with_last_event_id(self):
+        first = self.broker.publish('tweet', {'text': 'seen'})
+        self.broker.publish('tweet', {'text': 'missed'})
+        sent = self.serve(headers=[(b'last-event-id', str(first).encode())], sends=2)
+        self.assertIn(b'"missed"', sent[1]['body'])
+        self.assertNotIn(b'"seen"', sent[1]['body'])
+
+        sent = self.serve(headers=[(b'last-event-id', str(first - 5).encode())], sends=2)
+        self.assertIn(b'event: reset\n', sent[1]['body'])
+
+    @override_settings(STREAM={'QUEUE_SIZE': 1})
+    def test_dropped_stream_ends(self):
+        sent = self.serve(events=[('tweet', {})] * 3, sends=10)
+        self.assertEqual(sent[-1], {'type': 'http.response.body', 'body': b'', 'more_body': False})
+        self.assertFalse(self.broker.has_subscribers())
+
+    def test_other_requests_go_to_django(self):
+        application = mock.AsyncMock()
+        scope = {'type': 'http', 'method': 'GET', 'path': '/tweets/recent/'}
+        asyncio.run(stream.StreamApplication(application)(scope, None, None))
+        application.assert_awaited_once_with(scope, None, None)
+
+        sent = self.serve(method='POST', sends=2)
+        self.assertEqual(sent[0]['status'], 405)
+
+    def test_views_publish(self):
+        self.broker.loops['loop'] = set()
+        with mock.patch.object(self.broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(reverse('tweet_list_create'), {'text': 'live'})
+            publish.assert_called_once_with('tweet', res.data)
+
+            publish.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('bulk_create_tweets'),
+                                 [{'text': 'a'}, {'text': 'b'}], format='json')
+            self.assertEqual([c.args[1]['text'] for c in publish.call_args_list], ['a', 'b'])
+
+            publish.reset_mock()
+            url = reverse('like_tweet', args=[res.data['uuid']])
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.put(url)
+                self.client.put(url)
+            publish.assert_called_once_with('likes', {'uuid': res.data['uuid'], 'likes': 1})
+
+            publish.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(url)
+            publish.assert_called_once_with('likes', {'uuid': res.data['uuid'], 'likes': 0})
+
+    def test_nothing_published_without_subscribers(self):
+        with mock.patch.object(self.broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('tweet_list_create'), {'text': 'quiet'})
+            publish.assert_not_called()
+
+
+class ChangesTest(APITestCase):
+    """
+    The tweet change log and the changes feed offline clients sync with.
+    """
+
+    def setUp(self):
+        cache.clear()
+        clear_caches()
+        self.user = User.objects.create_user(username='test', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('tweet_changes')
+
+    def sync(self, since, **params):
+        res = self.client.get(self.url, {'since': since, **params})
+        self.assertEqual(res.status_code, s.HTTP_200_OK)
+        return res.data
+
+    def post(self, text, user=None):
+        self.client.force_authenticate(user or self.user)
+        res = self.client.post(reverse('tweet_list_create'), {'text': text})
+        self.client.force_authenticate(self.user)
+        return res.data['uuid']
+
+    def test_current_token(self):
+        self.assertEqual(self.client.get(self.url).data,
+                         {'changes': [], 'next': '0', 'has_more': False})
+        self.post('one')
+        token = self.client.get(self.url).data['next']
+        self.assertEqual(self.sync(token)['changes'], [])
+        self.assertEqual(self.sync(token)['next'], token)
+
+    def test_sync(self):
+        token = self.client.get(self.url).data['next']
+        deleted = self.post('deleted')
+        kept = self.post('kept')
+        detail = reverse('tweet_detail', args=[kept])
+        self.client.put(detail, {'text': 'edited'})
+        self.client.put(reverse('like_tweet', args=[kept]))
+        self.client.delete(reverse('tweet_detail', args=[deleted]))
+
+        data = self.sync(token)
+        self.assertFalse(data['has_more'])
+        # one entry per tweet, its last change, in commit order
+        self.assertEqual([(c['type'], c['uuid']) for c in data['changes']],
+                         [('likes', kept), ('delete', deleted)])
+        self.assertEqual(data['changes'][0]['tweet'], self.client.get(detail).data)
+        self.assertIsNone(data['changes'][1]['tweet'])
+        self.assertEqual(data['next'], str(TweetChange.objects.latest('seq').seq))
+        self.assertEqual(self.sync(data['next'])['changes'], [])
+
+    def test_every_change_is_logged(self):
+        uuid = self.post('tweet')
+        self.client.post(reverse('bulk_create_tweets'), [{'text': 'a'}, {'text': 'b'}],
+                         format='json')
+        self.client.patch(reverse('tweet_detail', args=[uuid]), {'text': 'edited'})
+        self.client.put(reverse('like_tweet', args=[uuid]))
+        self.client.delete(reverse('like_tweet', args=[uuid]))
+        self.client.delete(reverse('tweet_detail', args=[uuid]))
+        self.assertEqual(
+            list(TweetChange.objects.order_by('seq').values_list('kind', flat=True)),
+            ['create', 'create', 'create', 'update', 'likes', 'likes', 'delete'])
+
+    def test_cascaded_deletes_are_logged(self):
+        token = self.client.get(self.url).data['next']
+        theirs = [self.post('one', user=self.other), self.post('two', user=self.other)]
+        mine = self.post('mine')
+        self.other.delete()
+        Tweet.objects.filter(uuid=mine).delete()
+
+        changes = self.sync(token)['changes']
+        self.assertEqual(sorted(c['uuid'] for c in changes if c['type'] == 'delete'),
+                         sorted(theirs + [mine]))
+
+    def test_likes_logged_without_reading_the_tweet(self):
+        tweet = Tweet.objects.get(uuid=self.post('tweet'))
+        with CaptureQueriesContext(connection) as ctx:
+            Like.objects.like(self.other, tweet)
+
+        self.assertEqual([q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')], [])
+        change = TweetChange.objects.latest('seq')
+        self.assertEqual((change.kind, change.tweet_uuid, change.author_id),
+                         (TweetChange.LIKES, tweet.uuid, self.user.pk))
+
+    @override_settings(LIKE_BUFFER={'ENABLED': True, 'FLUSH_INTERVAL': 0})
+    def test_buffered_likes_are_logged_when_flushed(self):
+        counters._buffer = None
+        self.addCleanup(setattr, counters, '_buffer', None)
+        uuid = self.post('tweet')
+        token = self.client.get(self.url).data['next']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse('like_tweet', args=[uuid]))
+        self.assertEqual(self.sync(token)['changes'], [])
+
+        counters.get_like_buffer().flush()
+        changes = self.sync(token)['changes']
+        self.assertEqual([(c['type'], c['tweet']['likes']) for c in changes], [('likes', 1)])
+
+    def test_pages(self):
+        token = self.client.get(self.url).data['next']
+        uuids = [self.post(f'tweet {i}') for i in range(3)]
+        first = self.sync(token, page_size=2)
+        self.assertTrue(first['has_more'])
+        second = self.sync(first['next'], page_size=2)
+        self.assertFalse(second['has_more'])
+        self.assertEqual([c['uuid'] for c in first['changes'] + second['changes']], uuids)
+
+    def test_author(self):
+        token = self.client.get(self.url).data['next']
+        mine = self.post('mine')
+        self.post('theirs', user=self.other)
+        data = self.sync(token, author=self.user.uuid)
+        self.assertEqual([c['uuid'] for c in data['changes']], [mine])
+        # the next page starts after every change, not only the author's
+        self.assertEqual(data['next'], self.client.get(self.url).data['next'])
+
+        res = self.client.get(self.url, {'since': token, 'author': uuid4()})
+        self.assertEqual(res.status_code, s.HTTP_404_NOT_FOUND)
+
+    def test_invalid_and_expired_tokens(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'x'}).status_code,
+                         s.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'since': 5}).status_code, s.HTTP_410_GONE)
+
+        token = self.client.get(self.url).data['next']
+        for i in range(3):
+            self.post(f'tweet {i}')
+        call_command('compact_changes', days=0, stdout=StringIO())
+        res = self.client.get(self.url, {'since': token})
+        self.assertEqual(res.status_code, s.HTTP_410_GONE)
+        self.assertEqual(res.data['detail'].code, 'expired')
+        # the newest entry is kept, so the current token stays valid
+        self.assertEqual(TweetChange.objects.count(), 1)
+        latest = self.client.get(self.url).data['next']
+        self.assertEqual(self.sync(latest)['changes'], [])
+
+    def test_compact_superseded(self):
+        token = self.client.get(self.url).data['next']
+        uuid = self.post('tweet')
+        other = self.post('other')
+        for text in ('edit 1', 'edit 2', 'edit 3'):
+            self.client.put(reverse('tweet_detail', args=[uuid]), {'text': text})
+        before = self.sync(token)
+
+        out = StringIO()
+        call_command('compact_changes', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Deleted 2 superseded and 0 expired changes')
+        # the oldest entry bounds the valid tokens and is kept
+        self.assertEqual(list(TweetChange.objects.order_by('seq').values_list('kind', flat=True)),
+                         ['create', 'create', 'update'])
+        self.assertEqual(self.sync(token), before)
+        self.assertEqual([c['uuid'] for c in before['changes']], [other, uuid])
@@ -0,0 +1,165 @@
+from itertools import chain, groupby
+
+from django.conf import settings
+from django.db.models import F, Value
+
+from users.models import Follow
+
+from . import shards
+from .models import TimelineEntry, Tweet
+
+
+DEFAULTS = {
+    'FANOUT_LIMIT': 10000,
+    'BACKFILL': 50,
+    'BATCH_SIZE': 1000,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'TIMELINE', {}).get(name, DEFAULTS[name])
+
+
+def fan_out(tweets):
+    """
+    Write new tweets into their authors timeline and the timelines of the
+    authors followers, on the shard of the tweets, see tweets.shards. Authors
+    with FANOUT_LIMIT or more followers only get the entry in their own
+    timeline, their tweets are merged into follower timelines on read instead
+    of fanned out into that many rows. Entries fanned out before an author
+    reached the limit stay, the merge drops the rows both sources return.
+    """
+    limit = get_setting('FANOUT_LIMIT')
+    batch_size = get_setting('BATCH_SIZE')
+
+    for author_id, author_tweets in groupby(tweets, key=lambda t: t.author_id):
+        author_tweets = list(author_tweets)
+        entries = TimelineEntry.objects.using(shards.tweet_db(author_tweets[0]))
+        owners = [author_id]
+        if author_tweets[0].author.followers_count < limit:
+            owners = chain(owners, Follow.objects.filter(followee_id=author_id)
+                           .values_list('follower_id', flat=True)
+                           .iterator(chunk_size=batch_size))
+
+        batch = []
+        for owner_id in owners:
+            for tweet in author_tweets:
+                batch.append(TimelineEntry(
+                    owner_id=owner_id, tweet_id=tweet.pk,
+                    date_created=tweet.date_created))
+
+            if len(batch) >= batch_size:
+                entries.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+
+        if batch:
+            entries.bulk_create(batch, ignore_conflicts=True)
+
+
+def recent_tweets(author):
+    """
+    Return the alias of the authors shard, as shards.routed returns it, and
+    (id, date_created) of their BACKFILL most recent tweets there.
+    """
+    db = shards.routed(shards.author_alias(author.pk))
+    recent = (Tweet.objects.using(db).filter(author_id=author.pk)
+              .order_by('-date_created', '-id')
+              .values_list('id', 'date_created')[:get_setting('BACKFILL')])
+    return db, list(recent)
+
+
+def backfill(follower, followee):
+    """
+    Copy the followees most recent tweets into the followers timeline.
+    """
+    if followee.followers_count >= get_setting('FANOUT_LIMIT'):
+        return
+
+    db, recent = recent_tweets(followee)
+    TimelineEntry.objects.using(db).bulk_create([
+        TimelineEntry(owner_id=follower.pk, tweet_id=pk, date_created=date_created)
+        for pk, date_created in recent
+    ], ignore_conflicts=True)
+
+
+def backfill_followers(followee):
+    """
+    Copy the followees most recent tweets into every followers timeline once
+    the followee has just dropped below FANOUT_LIMIT: their tweets were merged
+    into those timelines on read until now and are fanned out from now on.
+    """
+    followers = (type(followee).objects.filter(pk=followee.pk)
+                 .values_list('followers_count', flat=True).first())
+    if followers != get_setting('FANOUT_LIMIT') - 1:
+        return
+    batch_size = get_setting('BATCH_SIZE')
+
+    db, recent = recent_tweets(followee)
+    if not recent:
+        return
+    entries = TimelineEntry.objects.using(db)
+    batch = []
+    owners = (Follow.objects.filter(followee=followee)
+              .values_list('follower_id', flat=True).iterator(chunk_size=batch_size))
+    for owner_id in owners:
+        batch.extend(
+            TimelineEntry(owner_id=owner_id, tweet_id=pk, date_created=date_created)
+            for pk, date_created in recent)
+        if len(batch) >= batch_size:
+            entries.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+
+    if batch:
+        entries.bulk_create(batch, ignore_conflicts=True)
+
+
+def remove(follower, followee):
+    """
+    Remove the followees tweets from the followers timeline.
+    """
+    for alias in shards.databases():
+        TimelineEntry.objects.using(shards.routed(alias)).filter(
+            owner_id=follower.pk, tweet__author_id=followee.pk).delete()
+
+
+def home_timeline(user):
+    """
+    Return the querysets a users home timeline is merged from, each giving
+    (date_created, tweet_id, db) rows, db being the database of the tweet:
+    the precomputed timeline on every database holding tweets and, when the
+    user follows authors that are not fanned out, those authors tweets.
+    """
+    aliases = shards.databases()
+    sources = [
+        TimelineEntry.objects.using(shards.routed(alias)).filter(owner_id=user.pk)
+        .values('date_created', 'tweet_id', db=Value(alias))
+        for alias in aliases
+    ]
+
+    celebrities = list(Follow.objects.filter(
+        follower=user, followee__followers_count__gte=get_setting('FANOUT_LIMIT')
+    ).values_list('followee_id', flat=True))
+    if celebrities:
+        sources.extend(
+            Tweet.objects.using(shards.routed(alias)).filter(author_id__in=celebrities)
+            .annotate(tweet_id=F('id'))
+            .values('date_created', 'tweet_id', db=Value(alias))
+            for alias in aliases)
+
+    return sources
+
+
+def page_tweets(page):
+    """
+    Return the feed rows of the tweets of a home timeline page, in page
+    order, one query per database.
+    """
+    ids = {}
+    for row in page:
+        ids.setdefault(row['db'], []).append(row['tweet_id'])
+    found = {}
+    for alias, batch in ids.items():
+        for tweet in shards.feed(Tweet.objects.using(shards.routed(alias)).filter(pk__in=batch)):
+            found[alias, tweet['id']] = tweet
+    rows = [found[key] for key in ((row['db'], row['tweet_id']) for row in page) if key in found]
+    return shards.attach_authors(rows)
@@ -0,0 +1,84 @@
+import heapq
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import shards
+from .models import Tweet
+from .scores import hot_score
+
+
+DEFAULTS = {
+    'WINDOW': 2 * 24 * 60 * 60,
+    'SIZE': 50,
+    'CACHE_TTL': 30,
+    'BATCH_SIZE': 1000,
+}
+
+CACHE_KEY = 'tweets:trending'
+
+
+def get_setting(name):
+    return getattr(settings, 'TRENDING', {}).get(name, DEFAULTS[name])
+
+
+def top_tweets():
+    """
+    Return the feed rows of the SIZE highest scoring tweets of the last WINDOW
+    seconds. The list is read from the score index, walking it from the top,
+    and cached for CACHE_TTL seconds. With sharding on, the top of every
+    shard is read and merged.
+    """
+    rows = cache.get(CACHE_KEY)
+    if rows is None:
+        since = timezone.now() - timedelta(seconds=get_setting('WINDOW'))
+        size = get_setting('SIZE')
+        if shards.enabled():
+            tops = (shards.feed(Tweet.objects.using(alias).filter(date_created__gte=since)
+                                .order_by('-score'), 'score')[:size]
+                    for alias in shards.databases())
+            rows = shards.attach_authors(heapq.nlargest(
+                size, (row for top in tops for row in top), key=lambda row: row['score']))
+        else:
+            rows = list(
+                Tweet.objects.filter(date_created__gte=since)
+                .order_by('-score')
+                .feed()[:size]
+            )
+        cache.set(CACHE_KEY, rows, get_setting('CACHE_TTL'))
+    return rows
+
+
+def rollup(queryset=None, since=None):
+    """
+    Recompute the score of every tweet created within WINDOW seconds, or since
+    the given time, from its like count, correcting any drift of the in place
+    updates. Returns the number of tweets updated.
+    """
+    if queryset is None:
+        return sum(rollup(Tweet.objects.using(shards.routed(alias)), since)
+                   for alias in shards.databases())
+    if since is None:
+        since = timezone.now() - timedelta(seconds=get_setting('WINDOW'))
+    batch_size = get_setting('BATCH_SIZE')
+
+    # walk the (date_created, id) index in keyset batches
+    tweets = queryset.filter(date_created__gte=since).order_by('date_created', 'id')
+    updated = 0
+    last = None
+    while True:
+        batch = tweets
+        if last is not None:
+            batch = batch.filter(date_created__gte=last.date_created).exclude(
+                date_created=last.date_created, id__lte=last.id)
+        batch = list(batch.only('id', 'likes', 'date_created', 'score')[:batch_size])
+        if not batch:
+            return updated
+
+        for tweet in batch:
+            tweet.score = hot_score(tweet.likes, tweet.date_created)
+        queryset.model.objects.db_manager(queryset._db).bulk_update(batch, ['score'])
+        updated += len(batch)
+        last = batch[-1]
@@ -2,16 +2,30 @@ from django.urls import path
 
 from .views import (
     TweetListCreateAPIView,
+    BulkTweetCreateAPIView,
+    TweetBatchAPIView,
     TweetDetailAPIView,
     LikeTweetAPIView,
     UserTweetListAPIView,
-    RecentTweetsAPIView
+    UserTweetExportAPIView,
+    RecentTweetsAPIView,
+    HomeTimelineAPIView,
+    SearchTweetsAPIView,
+    TrendingTweetsAPIView,
+    TweetChangesAPIView,
 )
 
 urlpatterns = [
     path('', TweetListCreateAPIView.as_view(), name='tweet_list_create'),
-    path('<uuid>/', TweetDetailAPIView.as_view(), name='tweet_detail'),
-    path('<uuid>/tweet/', LikeTweetAPIView.as_view(), name='like_tweet'),
+    path('bulk/', BulkTweetCreateAPIView.as_view(), name='bulk_create_tweets'),
+    path('batch/', TweetBatchAPIView.as_view(), name='batch_tweets'),
     path('recent/', RecentTweetsAPIView.as_view(), name='recent_tweets'),
-    path('user/<uuid>/', UserTweetListAPIView.as_view(), name='get_user_tweets')
+    path('home/', HomeTimelineAPIView.as_view(), name='home_timeline'),
+    path('trending/', TrendingTweetsAPIView.as_view(), name='trending_tweets'),
+    path('search/', SearchTweetsAPIView.as_view(), name='search_tweets'),
+    path('changes/', TweetChangesAPIView.as_view(), name='tweet_changes'),
+    path('<uuid:uuid>/', TweetDetailAPIView.as_view(), name='tweet_detail'),
+    path('<uuid:uuid>/tweet/', LikeTweetAPIView.as_view(), name='like_tweet'),
+    path('user/<uuid:uuid>/', UserTweetListAPIView.as_view(), name='get_user_tweets'),
+    path('user/<uuid:uuid>/export/', UserTweetExportAPIView.as_view(), name='export_user_tweets'),
 ]
\ No newline at end of file
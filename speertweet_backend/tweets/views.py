@@ -1,4 +1,9 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.cache import patch_vary_headers
 
 # Create your views here.
 from rest_framework.permissions import (
@@ -6,6 +11,7 @@ from rest_framework.permissions import (
     IsAuthenticatedOrReadOnly
 )
 from rest_framework.generics import (
+    GenericAPIView,
     ListAPIView,
     ListCreateAPIView,
     RetrieveUpdateDestroyAPIView,
@@ -14,32 +20,153 @@ from rest_framework.generics import (
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status as s
+from uuid import UUID
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from rest_framework.exceptions import NotFound, ValidationError
+
+from speertweet_backend.metrics import timer
 
-from .models import Tweet
+from .caches import tweet_cache
+from .conditional import ConditionalListMixin, not_modified, set_validators, tweet_etag
+from .counters import get_like_buffer
+from .models import Like, Tweet, TweetChange
 from .serializers import TweetSerializer
 from .permissions import IsAuthorOrReadOnly
+from .pagination import KeysetPagination, SearchPagination, TimelinePagination
+from . import changes, export, shards, stream, timeline, trending
 
 
-class TweetListCreateAPIView(ListCreateAPIView):
+class TweetListCreateAPIView(ConditionalListMixin, ListCreateAPIView):
     """
     Lists the currently logged in users tweets with a GET and allows a user to 
     create a new tweet with TWEET. Must be logged in to access this route.
     EXAMPLE:
-        GET -> /tweets/ -> return a list of tweets
+        GET -> /tweets/ -> return a page of tweets, newest first
         TWEET -> /tweets/ -> create new tweet
     """
     serializer_class = TweetSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         """
-        Return all tweets for logged in user.
+        Return all tweets for logged in user, from their shard.
         """
-        return Tweet.objects.filter(author=self.request.user)
+        user = self.request.user
+        return shards.feed(shards.tweets(user.pk).filter(author=user))
 
     def perform_create(self, serializer):
-        return serializer.save(author=self.request.user)
+        tweet = serializer.save(author=self.request.user)
+        timeline.fan_out([tweet])
+        changes.record(TweetChange.CREATE, [tweet])
+        stream.publish_tweets([tweet])
+        return tweet
+
+
+class BulkTweetCreateAPIView(GenericAPIView):
+    """
+    Creates up to max_tweets tweets for the logged in user in one request, the
+    valid ones inserted with one bulk insert in a single transaction. Returns
+    one result per tweet, in the order they were posted: {"status": 201,
+    "tweet"} when it was created, {"status": 400, "errors"} when it was not.
+    The response is 201 when every tweet was created, 207 when only some were
+    and 400 when none were.
+    EXAMPLE:
+        POST -> /tweets/bulk/ -> [{"text": ...}, ...] -> create the tweets
+    """
+    serializer_class = TweetSerializer
+    permission_classes = [IsAuthenticated]
+    max_tweets = 100
+
+    def post(self, request):
+        if isinstance(request.data, list) and len(request.data) > self.max_tweets:
+            raise ValidationError({'non_field_errors': [
+                f'Ensure there are no more than {self.max_tweets} tweets.']})
+
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False)
+        if serializer.is_valid():
+            errors = [{}] * len(request.data)
+        elif not isinstance(serializer.errors, list):
+            # not a list of tweets, or an empty one
+            return Response(serializer.errors, status=s.HTTP_400_BAD_REQUEST)
+        else:
+            errors = serializer.errors
+            valid = [item for item, error in zip(request.data, errors) if not error]
+            if not valid:
+                return Response(self.results(errors, []), status=s.HTTP_400_BAD_REQUEST)
+            serializer = self.get_serializer(data=valid, many=True)
+            serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic():
+            tweets = serializer.save(author=request.user)
+            timeline.fan_out(tweets)
+            changes.record(TweetChange.CREATE, tweets)
+            stream.publish_tweets(tweets)
+        status = s.HTTP_201_CREATED if len(tweets) == len(errors) else s.HTTP_207_MULTI_STATUS
+        return Response(self.results(errors, serializer.data), status=status)
+
+    def results(self, errors, created):
+        """
+        Line the created tweets up with the errors of the posted tweets.
+        """
+        created = iter(created)
+        return [{'status': s.HTTP_400_BAD_REQUEST, 'errors': error} if error
+                else {'status': s.HTTP_201_CREATED, 'tweet': next(created)}
+                for error in errors]
+
+
+class TweetBatchAPIView(APIView):
+    """
+    Fetches many tweets by uuid in one request, in the order asked for. Tweets
+    come from the tweet cache and all misses are loaded with one query.
+    Results line up with the requested ids, a missing tweet is null and also
+    listed under missing. Long lists can be POSTed as {"ids": [...]}.
+    EXAMPLE:
+        GET -> /tweets/batch/?ids=<uuid>,<uuid> -> return the tweets
+        POST -> /tweets/batch/ -> {"ids": [<uuid>, ...]} -> return the tweets
+    """
+    max_ids = 500
+
+    def get(self, request):
+        ids = [i for i in request.query_params.get('ids', '').split(',') if i]
+        return self.batch(request, ids)
+
+    def post(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list):
+            raise ValidationError({'ids': 'Expected a list of tweet uuids.'})
+        return self.batch(request, ids)
+
+    def batch(self, request, ids):
+        if not ids:
+            raise ValidationError({'ids': 'This field is required.'})
+        if len(ids) > self.max_ids:
+            raise ValidationError({'ids': f'Ensure there are no more than {self.max_ids} ids.'})
+        try:
+            ids = [str(UUID(str(i))) for i in ids]
+        except ValueError:
+            raise ValidationError({'ids': 'Every id must be a valid UUID.'})
+
+        found = tweet_cache.get_many(ids)
+        rows = [found[i] for i in ids]
+
+        etag = tweet_etag([row for row in rows if row is not None], *ids)
+        if request.method == 'GET':
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+
+        serializer = TweetSerializer()
+        with timer('serialize'):
+            response = Response({
+                'results': [
+                    serializer.row_to_representation(row) if row is not None else None
+                    for row in rows
+                ],
+                'missing': [i for i, row in zip(ids, rows) if row is None],
+            })
+        return set_validators(response, etag)
 
 
 class TweetDetailAPIView(RetrieveUpdateDestroyAPIView):
@@ -52,50 +179,282 @@ class TweetDetailAPIView(RetrieveUpdateDestroyAPIView):
         PUT -> /tweets/<uuid>/ -> make an edit to the tweet text (if owner)
         DELETE -> /tweets/<uuid>/ -> delete tweet (if owner)
     """
-    queryset = Tweet.objects.all()
+    queryset = Tweet.objects.select_related('author')
     lookup_field = 'uuid'
 
     serializer_class = TweetSerializer
     permission_classes = [IsAuthorOrReadOnly]
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Return the tweet details through the tweet cache, or 304 when the
+        client's copy is current.
+        """
+        row = tweet_cache.get(self.kwargs['uuid'])
+        if row is None:
+            raise NotFound()
+
+        etag = tweet_etag([row])
+        # buffered likes are not in date_modified yet
+        buffer = get_like_buffer()
+        if buffer is None or not buffer.pending(row['uuid']):
+            last_modified = row['date_modified']
+        else:
+            last_modified = None
+
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        with timer('serialize'):
+            response = Response(self.get_serializer().row_to_representation(row))
+        return set_validators(response, etag, last_modified)
+
+    def get_object(self):
+        """
+        Return the tweet from whichever shard holds it, see tweets.shards.
+        """
+        if not shards.enabled():
+            return super().get_object()
+        tweet = shards.get_tweet(self.kwargs['uuid'])
+        if tweet is None:
+            raise NotFound()
+        self.check_object_permissions(self.request, tweet)
+        return tweet
+
     def perform_update(self, serializer):
-        return serializer.save(edited=True)
+        tweet = serializer.save(edited=True)
+        changes.record(TweetChange.UPDATE, [tweet])
+        return tweet
+
+    def perform_destroy(self, instance):
+        # tweets.receivers records the tombstone
+        instance.delete()
 
 
 class LikeTweetAPIView(APIView):
     """
-    Allows any authenticated user to like (like) a tweet. This endpoint increments
-    a tweets likes by 1.
-    NOTE:   Currently a user can like the same tweet as many times as they like. 
-            This could be avoided by pulling the likes out into their own table 
-            with one to one FK to a tweet and user, would require a check before
-            likening tweet (some indexing on the table would be a good idea too).
+    Allows any authenticated user to like a tweet once and to unlike it again.
+    Likes are stored one row per user and tweet, and the tweets like count is
+    updated in place in the same transaction.
     EXAMPLE:
-        PUT -> /tweets/<uuid>/like/ -> increment tweet likes by 1
+        GET -> /tweets/<uuid>/tweet/ -> has the current user liked the tweet
+        PUT -> /tweets/<uuid>/tweet/ -> like the tweet
+        DELETE -> /tweets/<uuid>/tweet/ -> unlike the tweet
     """
     permission_classes = [IsAuthenticated]
 
+    def get_tweet(self, uuid):
+        """
+        Return the tweet from whichever shard holds it, see tweets.shards.
+        """
+        if not shards.enabled():
+            return get_object_or_404(Tweet.objects.only('id', 'uuid', 'author_id'), uuid=uuid)
+        tweet = shards.get_tweet(uuid)
+        if tweet is None:
+            raise NotFound()
+        return tweet
+
+    def get(self, request, uuid):
+        """
+        Return whether the current user liked the tweet.
+        """
+        liked = Like.objects.has_liked(request.user, self.get_tweet(uuid))
+        return Response({'liked': liked})
+
     def put(self, request, uuid):
         """
-        Increment tweet likes by 1.
+        Like the tweet, liking it again has no effect.
         """
-        tweet = get_object_or_404(Tweet, uuid=uuid)
-        tweet.likes += 1
-        tweet.save()
-        return Response(status=s.HTTP_200_OK)
+        tweet = self.get_tweet(uuid)
+        if Like.objects.like(request.user, tweet):
+            stream.publish_likes(tweet)
+        return Response({'liked': True}, status=s.HTTP_200_OK)
+
+    def delete(self, request, uuid):
+        """
+        Unlike the tweet, unliking a tweet that is not liked has no effect.
+        """
+        tweet = self.get_tweet(uuid)
+        if Like.objects.unlike(request.user, tweet):
+            stream.publish_likes(tweet)
+        return Response({'liked': False}, status=s.HTTP_200_OK)
 
 
-class UserTweetListAPIView(ListAPIView):
+class UserTweetListAPIView(ConditionalListMixin, ListAPIView):
     """
+    Lists a users tweets, newest first, one cursor page at a time.
+    EXAMPLE:
+        GET -> /tweets/user/<uuid>/ -> return a page of the users tweets
     """
     serializer_class = TweetSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Tweet.objects.order_by('-date_created').filter(author__uuid=self.kwargs['uuid'])
+        if not shards.enabled():
+            return Tweet.objects.filter(author__uuid=self.kwargs['uuid']).feed()
+        # the author is not on the shard to join to
+        author_id = (get_user_model().objects.filter(uuid=self.kwargs['uuid'])
+                     .values_list('pk', flat=True).first())
+        return shards.feed(shards.tweets(author_id).filter(author_id=author_id))
 
 
-class RecentTweetsAPIView(ListAPIView):
+class UserTweetExportAPIView(APIView):
     """
+    Streams all of a users tweets, oldest first, as NDJSON (the default) or
+    CSV. Tweets are read and sent a chunk at a time, so an export of any size
+    runs in constant memory. Clients that accept gzip get the stream gzip
+    compressed.
+    EXAMPLE:
+        GET -> /tweets/user/<uuid>/export/?output=csv -> download the users tweets
+    """
+    accepts_gzip = re.compile(r'\bgzip\b')
+
+    def get(self, request, uuid):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in export.FORMATS:
+            raise ValidationError({'output': f'Must be one of {", ".join(export.FORMATS)}.'})
+        user = get_object_or_404(get_user_model().objects.only('username'), uuid=uuid)
+
+        gzip = bool(self.accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        content_type, extension = export.FORMATS[output]
+        response = StreamingHttpResponse(
+            export.export(shards.tweets(user.pk).filter(author=user), output, gzip),
+            content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="{user.username}.{extension}"')
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if gzip:
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+
+class RecentTweetsAPIView(ConditionalListMixin, ListAPIView):
+    """
+    Lists the most recent tweets of all users, one cursor page at a time. With
+    sharding on, a page is read from every shard and the pages are merged.
+    EXAMPLE:
+        GET -> /tweets/recent/ -> return a page of recent tweets
+        GET -> /tweets/recent/ with If-None-Match: <etag> -> 304 if unchanged
+    """
+    serializer_class = TweetSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        if shards.enabled():
+            return shards.all_feeds()
+        return Tweet.objects.feed()
+
+
+class SearchTweetsAPIView(ConditionalListMixin, ListAPIView):
+    """
+    Full-text search of all tweets, best match first, one cursor page at a
+    time. Every word of the query must appear in a matching tweet. With
+    sharding on, every shard is searched and the pages are merged.
+    EXAMPLE:
+        GET -> /tweets/search/?q=<words> -> return a page of matching tweets
+    """
+    serializer_class = TweetSerializer
+    pagination_class = SearchPagination
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'This query parameter is required.'})
+        if shards.enabled():
+            return [shards.feed(Tweet.objects.using(alias).search(query), 'rank')
+                    for alias in shards.databases()]
+        return Tweet.objects.search(query).feed('rank')
+
+
+class TrendingTweetsAPIView(APIView):
+    """
+    Lists the top scoring tweets of the last days, see tweets.scores. The list
+    is read from the score index and cached for a short time.
+    EXAMPLE:
+        GET -> /tweets/trending/ -> return the trending tweets, top first
+    """
+
+    def get(self, request):
+        rows = trending.top_tweets()
+        etag = tweet_etag(rows)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        serializer = TweetSerializer()
+        with timer('serialize'):
+            response = Response(
+                {'results': [serializer.row_to_representation(row) for row in rows]})
+        return set_validators(response, etag)
+
+
+class TweetChangesAPIView(APIView):
+    """
+    Lists the creates, edits, like count changes and deletes of tweets after a
+    token, oldest first, so offline clients sync only what changed, see
+    tweets.changes. 410 when the changes after the token were compacted.
+    EXAMPLE:
+        GET -> /tweets/changes/ -> return the current token
+        GET -> /tweets/changes/?since=<token> -> return the changes after it
+        GET -> /tweets/changes/?since=<token>&author=<uuid> -> only that users tweets
+    """
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            since = int(params['since']) if 'since' in params else None
+        except ValueError:
+            raise ValidationError({'since': 'A valid token is required.'})
+
+        author_id = None
+        if 'author' in params:
+            try:
+                author_uuid = UUID(params['author'])
+            except ValueError:
+                raise ValidationError({'author': 'A valid UUID is required.'})
+            author_id = get_object_or_404(
+                get_user_model().objects.values_list('pk', flat=True), uuid=author_uuid)
+
+        with timer('serialize'):
+            data = changes.changes_since(since, author_id, self.get_page_size(request))
+        return Response(data)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params['page_size'])
+        except (KeyError, ValueError):
+            return None
+        if size <= 0:
+            return None
+        return min(size, changes.get_setting('MAX_PAGE_SIZE'))
+
+
+class HomeTimelineAPIView(ListAPIView):
+    """
+    Lists tweets of the users the logged in user follows, and their own, newest
+    first. A page is read from the users precomputed timeline on every shard,
+    merged with the tweets of followed authors too popular to fan out.
+    EXAMPLE:
+        GET -> /tweets/home/ -> return a page of the users home timeline
     """
     serializer_class = TweetSerializer
-    queryset = Tweet.objects.order_by('-date_created').all()
\ No newline at end of file
+    permission_classes = [IsAuthenticated]
+    pagination_class = TimelinePagination
+
+    def get_queryset(self):
+        return timeline.home_timeline(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        rows = timeline.page_tweets(page)
+
+        paginator = self.paginator
+        etag = tweet_etag(rows, paginator.has_next, paginator.has_previous)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        serializer = self.get_serializer(rows, many=True)
+        return set_validators(self.get_paginated_response(serializer.data), etag)
+
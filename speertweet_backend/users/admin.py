@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User
+from .models import Follow, User
 
 # Register your models here.
 
@@ -8,4 +8,9 @@ from .models import User
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    pass
\ No newline at end of file
+    pass
+
+
+@admin.register(Follow)
+class FollowAdmin(admin.ModelAdmin):
+    pass
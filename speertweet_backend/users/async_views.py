@@ -0,0 +1,15 @@
+from speertweet_backend.async_views import AsyncReadView
+
+from .caches import user_cache
+
+
+class AsyncUserDetailsView(AsyncReadView):
+    """
+    views.user_details served in the event loop, through the user cache.
+    """
+
+    async def read(self, request, username):
+        data = await user_cache.aget(username)
+        if data is None:
+            return self.render(None, status=404)
+        return self.render(data)
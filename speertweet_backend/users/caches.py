@@ -0,0 +1,18 @@
+from speertweet_backend.objectcache import ObjectCache
+
+from .models import User
+from .serializers import UserSerializer
+
+
+def load_user(username):
+    """
+    Return the serialized user details of a user, or None.
+    """
+    user = User.objects.filter(username=username).first()
+    if user is None:
+        return None
+    return dict(UserSerializer(instance=user).data)
+
+
+# serialized user details by username, kept fresh by users.receivers
+user_cache = ObjectCache('user', load_user)
@@ -1,4 +1,8 @@
 from django.contrib.auth.models import BaseUserManager
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+from .signals import followed, unfollowed
 
 
 class UserManager(BaseUserManager):
@@ -26,4 +30,43 @@ class UserManager(BaseUserManager):
         if not kwargs.get('is_staff'):
             raise ValueError('Superuser must have is_staff=True')
 
-        return self.create_user(username, password, **kwargs)
\ No newline at end of file
+        return self.create_user(username, password, **kwargs)
+
+
+class FollowManager(models.Manager):
+    """
+    Custom follow manager class. Keeps User.followers_count in step with the
+    follow rows using a single row UPDATE.
+    """
+
+    def follow(self, follower, followee):
+        """
+        Follow a user. Returns False if the user is already followed.
+        """
+        try:
+            with transaction.atomic():
+                self.create(follower=follower, followee=followee)
+                self._add_followers(followee, 1)
+        except IntegrityError:
+            return False
+
+        followed.send(sender=self.model, follower=follower, followee=followee)
+        return True
+
+    def unfollow(self, follower, followee):
+        """
+        Stop following a user. Returns False if the user was not followed.
+        """
+        with transaction.atomic():
+            deleted, _ = self.filter(follower=follower, followee=followee).delete()
+            if deleted:
+                self._add_followers(followee, -1)
+
+        if deleted:
+            unfollowed.send(sender=self.model, follower=follower, followee=followee)
+        return bool(deleted)
+
+    def _add_followers(self, followee, delta):
+        type(followee).objects.filter(pk=followee.pk).update(
+            followers_count=F('followers_count') + delta)
+
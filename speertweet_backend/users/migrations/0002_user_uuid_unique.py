@@ -0,0 +1,55 @@
+from django.db import migrations, models
+import uuid
+
+
+INDEX = 'users_user_uuid_6fe513d7_uniq'
+
+
+def add_unique_index(apps, schema_editor):
+    """
+    Build the unique index without a table rewrite, and on PostgreSQL without
+    blocking writes, then attach it as the field's unique constraint.
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "{INDEX}" '
+            f'ON "users_user" ("uuid")')
+        schema_editor.execute(
+            f'ALTER TABLE "users_user" ADD CONSTRAINT "{INDEX}" '
+            f'UNIQUE USING INDEX "{INDEX}"')
+    else:
+        schema_editor.execute(f'CREATE UNIQUE INDEX "{INDEX}" ON "users_user" ("uuid")')
+
+
+def drop_unique_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'ALTER TABLE "users_user" DROP CONSTRAINT "{INDEX}"')
+    else:
+        schema_editor.execute(f'DROP INDEX "{INDEX}"')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can not run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    # the name AlterField(unique=True) would give the constraint, written out
+    # so it does not depend on how Django derives it
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_unique_index, drop_unique_index),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='user',
+                    name='uuid',
+                    field=models.UUIDField(default=uuid.uuid4, unique=True),
+                ),
+            ],
+        ),
+    ]
@@ -1,8 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from uuid import uuid4
 
-from .managers import UserManager
+from speertweet_backend.ids import uuid7
+
+from .managers import FollowManager, UserManager
 
 # Create your models here.
 
@@ -13,12 +14,46 @@ class User(AbstractUser):
     email = None
     first_name = None
     last_name = None
-    uuid = models.UUIDField(default=uuid4)
+    uuid = models.UUIDField(default=uuid7, unique=True)
+    followers_count = models.IntegerField(default=0)
 
     objects = UserManager()
 
     REQUIRED_FIELDS = []
     USERNAME_FIELD = 'username'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the stored username, so a rename is noticed on save without a query,
+        # see users.receivers; unknown when the field was deferred
+        instance._saved_username = instance.__dict__.get('username')
+        return instance
+
+    def __str__(self):
+        return self.username
+
+
+class Follow(models.Model):
+    """
+    A user following another users tweets.
+    """
+    follower = models.ForeignKey(
+        User, related_name='following', on_delete=models.CASCADE)
+    followee = models.ForeignKey(
+        User, related_name='followers', on_delete=models.CASCADE)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    objects = FollowManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['follower', 'followee'], name='unique_follow'),
+            models.CheckConstraint(
+                check=~models.Q(follower=models.F('followee')),
+                name='no_self_follow'),
+        ]
+
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return f'<Follow follower={self.follower_id} followee={self.followee_id}>'
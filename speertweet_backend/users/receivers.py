@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caches import user_cache
+from .models import User
+from .signals import username_changed
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(sender, instance, created, using, **kwargs):
+    user_cache.invalidate(instance.username, using=using)
+
+    old_username = getattr(instance, '_saved_username', None)
+    if old_username is not None and old_username != instance.username:
+        user_cache.invalidate(old_username, using=using)
+        username_changed.send(sender=sender, user=instance, old_username=old_username)
+    instance._saved_username = instance.username
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, instance, using, **kwargs):
+    user_cache.invalidate(instance.username, using=using)
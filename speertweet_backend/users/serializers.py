@@ -1,10 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
 
+from speertweet_backend.metrics import TimedSerializerMixin
+
 from .models import User
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(max_length=128, write_only=True)
     confirm_password = serializers.CharField(max_length=128, write_only=True)
 
@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+
+# sent with follower and followee after a new follow is saved
+followed = Signal()
+
+# sent with follower and followee after a follow is removed
+unfollowed = Signal()
+
+# sent with user and old_username after a user is saved with a new username
+username_changed = Signal()
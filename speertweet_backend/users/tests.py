@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.db.utils import IntegrityError
 from django.urls import reverse
@@ -8,6 +8,9 @@ from rest_framework import status
 
 import datetime as dt
 
+from speertweet_backend.objectcache import clear_caches
+
+from .models import Follow
 from .serializers import UserSerializer
 
 # Create your tests here.
@@ -67,6 +70,16 @@ class UserTests(TestCase):
             u2 = User.objects.create_user(
                 username='user1', password='123Testtest123')
 
+    def test_uuid_unique(self):
+        """
+        Assert that uuids must be unique.
+        """
+        u1 = User.objects.create_user(
+            username='user1', password='123Testtest123')
+        with self.assertRaises(IntegrityError):
+            User.objects.create_user(
+                username='user2', password='123Testtest123', uuid=u1.uuid)
+
 
 class TestUserApi(APITestCase):
 
@@ -192,4 +205,106 @@ class TestUserApi(APITestCase):
         res = self.client.post(reverse('token_verify'), data={
             'access': access
         }, format='json')
-        self.assertTrue(res.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertTrue(res.status_code, status.HTTP_200_OK)
+
+class FollowApiTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        res = self.client.post(reverse('token_login'), data={
+            'username': 'test',
+            'password': 'password',
+        })
+        self.token = res.data['access']
+
+    def _follow(self, username, method='post'):
+        return getattr(self.client, method)(
+            reverse('follow', args=[username]),
+            HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_follow(self):
+        res = self._follow('other')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Follow.objects.filter(
+            follower=self.user, followee=self.other).exists())
+        self.assertEqual(User.objects.get(pk=self.other.pk).followers_count, 1)
+
+    def test_follow_twice(self):
+        self._follow('other')
+        res = self._follow('other')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(User.objects.get(pk=self.other.pk).followers_count, 1)
+
+    def test_unfollow(self):
+        self._follow('other')
+        res = self._follow('other', 'delete')
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(User.objects.get(pk=self.other.pk).followers_count, 0)
+
+        # unfollowing again does not go negative
+        self._follow('other', 'delete')
+        self.assertEqual(User.objects.get(pk=self.other.pk).followers_count, 0)
+
+    def test_follow_self(self):
+        res = self._follow('test')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_follow_404(self):
+        res = self._follow('nobody')
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_follow_unauth(self):
+        res = self.client.post(reverse('follow', args=['other']))
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(OBJECT_CACHE={'SINGLE_PROCESS': True})
+class UserCacheTests(APITestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user(username='test', password='password')
+
+    def test_user_details_cached(self):
+        res = self.client.get(reverse('user_details', args=['test']))
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse('user_details', args=['test']))
+        self.assertEqual(res.data, cached.data)
+
+    def test_rename_not_stale(self):
+        self.client.get(reverse('user_details', args=['test']))
+        self.user.username = 'renamed'
+        self.user.save()
+
+        res = self.client.get(reverse('user_details', args=['test']))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        res = self.client.get(reverse('user_details', args=['renamed']))
+        self.assertEqual(res.data['username'], 'renamed')
+
+    def test_rename_of_loaded_user(self):
+        self.client.get(reverse('user_details', args=['test']))
+        user = User.objects.get(pk=self.user.pk)
+        user.username = 'renamed'
+        # the old username is known from the load, the save is one UPDATE
+        with self.assertNumQueries(1):
+            user.save()
+
+        res = self.client.get(reverse('user_details', args=['test']))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_not_stale(self):
+        self.client.get(reverse('user_details', args=['test']))
+        self.user.delete()
+
+        res = self.client.get(reverse('user_details', args=['test']))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_negative_entry(self):
+        res = self.client.get(reverse('user_details', args=['late']))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        User.objects.create_user(username='late', password='password')
+        res = self.client.get(reverse('user_details', args=['late']))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
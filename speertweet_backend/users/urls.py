@@ -14,4 +14,5 @@ urlpatterns = [
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('token/verify/', TokenVerifyView.as_view(), name='token_verify'),
     path('<str:username>/', views.user_details, name='user_details'),
+    path('<str:username>/follow/', views.follow, name='follow'),
 ]
\ No newline at end of file
@@ -1,10 +1,13 @@
 from django.contrib.auth import get_user_model
+from django.shortcuts import get_object_or_404
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status as s
 
+from .caches import user_cache
+from .models import Follow
 from .serializers import UserSerializer
 
 # Create your views here.
@@ -27,14 +30,12 @@ def current_user_details(request, username=None):
 @api_view(['GET'])
 def user_details(request, username):
     """
-    Return user details by username.
+    Return user details by username, through the user cache.
     """
-    try:
-        serializer = UserSerializer(
-            instance=User.objects.get(username=username))
-        return Response(serializer.data)
-    except User.DoesNotExist:
+    data = user_cache.get(username)
+    if data is None:
         return Response(status=s.HTTP_404_NOT_FOUND)
+    return Response(data)
 
 
 @api_view(['POST'])
@@ -48,3 +49,22 @@ def register(request):
         return Response(status=s.HTTP_201_CREATED)
 
     return Response(user.errors, status=s.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def follow(request, username):
+    """
+    Follow (POST) or unfollow (DELETE) a user by username.
+    """
+    followee = get_object_or_404(User, username=username)
+    if followee.pk == request.user.pk:
+        return Response({'detail': 'You can not follow yourself.'},
+                        status=s.HTTP_400_BAD_REQUEST)
+
+    if request.method == 'POST':
+        created = Follow.objects.follow(request.user, followee)
+        return Response(status=s.HTTP_201_CREATED if created else s.HTTP_200_OK)
+
+    Follow.objects.unfollow(request.user, followee)
+    return Response(status=s.HTTP_204_NO_CONTENT)